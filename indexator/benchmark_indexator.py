@@ -0,0 +1,206 @@
+import os
+import time
+import json
+import shutil
+import resource
+import tempfile
+import argparse
+from indexator import Indexator
+from bulk_loader import BulkLoader
+from synthetic_corpus import SyntheticCorpus
+
+
+class SinkBulkLoader(BulkLoader):
+    """
+    Stands in for BulkLoader in benchmarks. The actions are serialized
+    and the bulk request bodies are built exactly as usual, but they
+    are discarded instead of being sent to Elasticsearch.
+    """
+    def send_chunk(self, chunk):
+        """
+        Build the request body of the chunk and count its actions
+        as processed.
+        """
+        t1 = time.time()
+        body = '\n'.join(line for lines, size, action in chunk for line in lines) + '\n'
+        self.update_stats(chunk, [action for lines, size, action in chunk], time.time() - t1)
+        return len(body)
+
+
+class IndexatorBenchmark:
+    """
+    Runs the stages of the indexation of a corpus (by default,
+    a synthetic one) without Elasticsearch and measures the time
+    and the peak memory usage of each stage. The indexator is
+    configured by corpus.json as usual; only the directory of the
+    source files is different, and word statistics and dictionaries
+    are written to a temporary directory. Full-text HTML is not
+    generated.
+    """
+    STAGES = ['analyze', 'documents', 'words', 'dictionary']
+
+    def __init__(self, corpusDir, workers=1):
+        self.x = Indexator(overwrite=True, workers=workers)
+        self.x.corpus_dir = corpusDir
+        self.x.fulltextEnabled = False
+        self.tmpDir = tempfile.mkdtemp(prefix='tsakorpus_benchmark_')
+        self.x.INDEX_STATE_DIR = self.tmpDir
+        self.x.dictionaryDir = os.path.join(self.tmpDir, 'dictionaries')
+        self.x.bulkLoader = SinkBulkLoader(self.x.es, self.x.settings)
+        self.x.bulkLoader.set_error_handler(self.x.index_name('docs'), self.x.doc_error_fallback)
+        self.results = []   # list of dictionaries with the results of each stage
+        self.numTypes = 0   # number of different words in the corpus
+
+    @staticmethod
+    def reset_peak_memory():
+        """
+        Reset the peak resident set size of this process, if the
+        system allows it (only Linux does).
+        """
+        try:
+            with open('/proc/self/clear_refs', 'w') as fRefs:
+                fRefs.write('5')
+        except OSError:
+            pass
+
+    @staticmethod
+    def peak_memory():
+        """
+        Return the peak resident set size of this process in MB.
+        """
+        try:
+            with open('/proc/self/status', 'r') as fStatus:
+                for line in fStatus:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        # ru_maxrss is in kilobytes on Linux and cannot be reset
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def run_stage(self, stage):
+        """
+        Run one stage of the indexation and store its time, peak memory
+        usage and the number of actions it has produced.
+        """
+        x = self.x
+        self.reset_peak_memory()
+        actionsBefore = x.bulkLoader.stats['actions']
+        t1 = time.time()
+        if stage == 'analyze':
+            x.analyze_dir()
+        elif stage == 'documents':
+            x.index_files([fname for fname, fsize in sorted(x.filenames, key=lambda p: -p[1])])
+        elif stage == 'words':
+            x.bulkLoader.add(x.iterate_words())
+            x.bulkLoader.flush()
+        elif stage == 'dictionary':
+            x.generate_dictionary()
+        t2 = time.time()
+        self.results.append({
+            'stage': stage,
+            'time': t2 - t1,
+            'actions': x.bulkLoader.stats['actions'] - actionsBefore,
+            'memory_peak': self.peak_memory()
+        })
+
+    def run(self, stages=None):
+        """
+        Run the stages in their usual order and return the results.
+        """
+        if stages is None:
+            stages = self.STAGES
+        x = self.x
+        x.reset_word_stats(x.wordStatsSettings['backend'])
+        try:
+            for stage in self.STAGES:
+                if stage in stages:
+                    print('Stage:', stage)
+                    self.run_stage(stage)
+            self.numTypes = x.wordStats.num_items()
+        finally:
+            x.bulkLoader.close()
+            x.wordStats.close()
+            shutil.rmtree(self.tmpDir, ignore_errors=True)
+        return self.results
+
+    def report(self):
+        """
+        Print the results of the benchmark.
+        """
+        x = self.x
+        totalTime = sum(r['time'] for r in self.results)
+        print('\n{0} documents, {1} sentences, {2} words, {3} word types, {4:.1f} MB of source files.'.format(
+            len(x.filenames), x.sID, x.totalNumWords, self.numTypes,
+            x.corpusSizeInBytes / (1024 * 1024)))
+        print('{0:<12}{1:>10}{2:>14}{3:>12}{4:>16}'.format(
+            'Stage', 'Time, s', 'Tokens/s', 'Actions', 'Peak RSS, MB'))
+        for r in self.results:
+            print('{0:<12}{1:>10.2f}{2:>14.0f}{3:>12}{4:>16.1f}'.format(
+                r['stage'], r['time'], x.totalNumWords / max(r['time'], 0.001),
+                r['actions'], r['memory_peak']))
+        print('{0:<12}{1:>10.2f}{2:>14.0f}{3:>12}{4:>16.1f}'.format(
+            'total', totalTime, x.totalNumWords / max(totalTime, 0.001),
+            sum(r['actions'] for r in self.results),
+            max([r['memory_peak'] for r in self.results] + [0])))
+        if x.workers > 1:
+            print('Peak RSS of worker processes: {0:.1f} MB.'.format(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024))
+
+    def save(self, fname):
+        """
+        Write the results to a JSON file, so that they could be
+        compared with those of other runs.
+        """
+        x = self.x
+        with open(fname, 'w', encoding='utf-8') as fOut:
+            json.dump({
+                'documents': len(x.filenames),
+                'sentences': x.sID,
+                'words': x.totalNumWords,
+                'word_types': self.numTypes,
+                'workers': x.workers,
+                'stages': self.results
+            }, fOut, ensure_ascii=False, indent=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the performance of the indexator '
+                                                 'without Elasticsearch.')
+    parser.add_argument('--corpus', default='../corpus/synthetic',
+                        help='directory with the source files; a synthetic corpus is '
+                             'generated there if it does not exist')
+    parser.add_argument('--docs', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['n_docs'],
+                        help='number of documents in the generated corpus')
+    parser.add_argument('--sentences', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['sentences_per_doc'],
+                        help='number of sentences in each language in one generated document')
+    parser.add_argument('--vocabulary', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['vocabulary_size'],
+                        help='number of different word forms in each language of the generated corpus')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes that parse and prepare documents')
+    parser.add_argument('--stages', nargs='+', choices=IndexatorBenchmark.STAGES,
+                        help='only run these stages and those they depend on '
+                             '(by default, all stages that a usual indexation includes)')
+    parser.add_argument('--output', metavar='FILE', help='write the results to FILE as JSON')
+    args = parser.parse_args()
+    benchmark = IndexatorBenchmark(args.corpus, workers=args.workers)
+    if not os.path.exists(args.corpus):
+        corpus = SyntheticCorpus(benchmark.x.languages, settings={
+            'n_docs': args.docs,
+            'sentences_per_doc': args.sentences,
+            'vocabulary_size': args.vocabulary,
+            'input_format': benchmark.x.input_format
+        }, wordFields=sorted(benchmark.x.additionalWordFields))
+        corpus.write(args.corpus)
+    stages = args.stages
+    if stages is None:
+        stages = ['analyze', 'documents', 'words']
+        if 'generate_dictionary' in benchmark.x.settings and benchmark.x.settings['generate_dictionary']:
+            stages.append('dictionary')
+    else:
+        # Words and dictionaries need the statistics collected from the documents
+        stages = set(stages) | {'analyze', 'documents'}
+    benchmark.run(stages)
+    benchmark.report()
+    if args.output is not None:
+        benchmark.save(args.output)
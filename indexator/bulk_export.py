@@ -0,0 +1,141 @@
+import os
+import json
+import gzip
+from elasticsearch.helpers import expand_action
+
+
+class BulkExporter:
+    """
+    Writes indexing actions to gzipped NDJSON files in the Elasticsearch
+    bulk format instead of sending them to Elasticsearch. It has the same
+    interface as BulkLoader, so that the indexator can prepare a corpus
+    on a machine without access to the cluster. The files of each index
+    are split into shards with a fixed number of actions. The index
+    mappings and the list of files are stored in manifest.json, which
+    is used by load_export.py to load the files into Elasticsearch.
+    The parameters are taken from the bulk_export dictionary
+    in corpus.json.
+    """
+    DEFAULT_SETTINGS = {
+        'shard_size': 100000,       # maximum number of actions in one file
+        'compression_level': 6
+    }
+    MANIFEST_NAME = 'manifest.json'
+
+    def __init__(self, es, dirOut, settings):
+        self.es = es                # only used to serialize the actions
+        self.dirOut = dirOut
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if 'bulk_export' in settings:
+            self.settings.update(settings['bulk_export'])
+        self.corpusName = settings['corpus_name']
+        self.mappings = {}          # index name -> mapping
+        self.files = {}             # index name -> list of dictionaries describing its files
+        self.curFiles = {}          # index name -> currently open file
+        self.errorHandlers = {}     # index name -> name of the error handler used when loading
+        if not os.path.exists(self.dirOut):
+            os.makedirs(self.dirOut)
+
+    def set_mapping(self, index, mapping):
+        """
+        Remember the mapping of an index, so that the index could be
+        created before the files are loaded.
+        """
+        self.mappings[index] = mapping
+        if index not in self.files:
+            self.files[index] = []
+
+    def set_error_handler(self, index, handler):
+        """
+        Remember the name of the error handler of an index. Errors
+        can only occur when the files are loaded, so the name is
+        stored in the manifest, and load_export.py registers the
+        handler with the same name.
+        """
+        self.errorHandlers[index] = handler.__name__
+
+    def open_shard(self, index):
+        """
+        Start a new file for the actions of the index.
+        """
+        if index not in self.files:
+            self.files[index] = []
+        fname = index + '.' + str(len(self.files[index])).zfill(5) + '.ndjson.gz'
+        # mtime=0 makes the files of identical builds identical
+        fOut = gzip.GzipFile(filename='', mode='wb', mtime=0,
+                             compresslevel=self.settings['compression_level'],
+                             fileobj=open(os.path.join(self.dirOut, fname), 'wb'))
+        self.files[index].append({'file': fname, 'actions': 0, 'bytes': 0})
+        self.curFiles[index] = fOut
+        return fOut
+
+    def close_shard(self, index):
+        """
+        Finish the current file of the index.
+        """
+        fOut = self.curFiles.pop(index, None)
+        if fOut is None:
+            return
+        fileObj = fOut.fileobj
+        fOut.close()
+        fileObj.close()
+
+    def add(self, actions):
+        """
+        Serialize the actions and write them to the files of their
+        indices.
+        """
+        for action in actions:
+            actionMeta, source = expand_action(action)
+            lines = [self.es.transport.serializer.dumps(actionMeta)]
+            if source is not None:
+                lines.append(self.es.transport.serializer.dumps(source))
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            index = action.get('_index', '')
+            fOut = self.curFiles.get(index)
+            if fOut is None or self.files[index][-1]['actions'] >= self.settings['shard_size']:
+                self.close_shard(index)
+                fOut = self.open_shard(index)
+            fOut.write(data)
+            self.files[index][-1]['actions'] += 1
+            self.files[index][-1]['bytes'] += len(data)
+
+    def flush(self):
+        """
+        Write the manifest, so that it always lists all the
+        actions written so far.
+        """
+        for fOut in self.curFiles.values():
+            fOut.flush()
+        manifest = {
+            'corpus_name': self.corpusName,
+            'indices': {index: {'mapping': self.mappings.get(index),
+                                'files': self.files[index]}
+                        for index in sorted(self.files)}
+        }
+        for index in self.errorHandlers:
+            if index in manifest['indices']:
+                manifest['indices'][index]['error_handler'] = self.errorHandlers[index]
+        with open(os.path.join(self.dirOut, self.MANIFEST_NAME), 'w', encoding='utf-8') as fOut:
+            json.dump(manifest, fOut, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def close(self):
+        """
+        Close all files and write the manifest.
+        """
+        for index in list(self.curFiles):
+            self.close_shard(index)
+        self.flush()
+
+    def report(self):
+        """
+        Print the number of actions and files written so far
+        for each index.
+        """
+        for index in sorted(self.files):
+            if len(self.files[index]) <= 0:
+                continue
+            print('{0}: {1} actions, {2:.1f} MB (uncompressed) in {3} files.'.format(
+                index, sum(f['actions'] for f in self.files[index]),
+                sum(f['bytes'] for f in self.files[index]) / (1024 * 1024),
+                len(self.files[index])))
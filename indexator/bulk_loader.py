@@ -0,0 +1,286 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from elasticsearch.helpers import expand_action, BulkIndexError
+from elasticsearch.exceptions import TransportError
+
+
+def doc_error_fallback(action, result):
+    """
+    Handle a document whose metadata could not be indexed, e.g.
+    because of a value that does not fit the mapping. Return an
+    action that indexes only its filename and title instead, an
+    empty list if there is no title, or None if the short
+    metadata could not be indexed either.
+    Used as the error handler of the docs index both by the
+    indexator and by load_export.py.
+    """
+    print('Metadata error: {0}'.format(result.get('error')))
+    meta = action['_source']
+    shortMeta = {}
+    if 'filename' in meta:
+        shortMeta['filename'] = meta['filename']
+    if 'title' not in meta:
+        return []
+    shortMeta['title'] = meta['title']
+    shortMeta['title_kw'] = meta['title']
+    if shortMeta == meta:
+        return None
+    return [{'_index': action['_index'],
+             '_id': action['_id'],
+             '_source': shortMeta}]
+
+
+class BulkLoader:
+    """
+    Sends indexing actions to Elasticsearch with bulk requests.
+    Actions are collected into chunks limited both by the number
+    of actions and by their size in bytes, so that chunks of short
+    sentences are not too small and chunks of long annotated
+    sentences are not too large. Several chunks can be sent
+    in parallel. Chunks and separate actions rejected by an overloaded
+    cluster (HTTP 429) are resent with exponential backoff. Other
+    failed actions can be replaced with fallback actions by error
+    handlers registered for their indices.
+    The parameters are taken from the bulk_loader dictionary
+    in corpus.json.
+    """
+    DEFAULT_SETTINGS = {
+        'thread_count': 2,                      # number of requests sent in parallel
+        'queue_size': 2,                        # number of prepared chunks waiting to be sent
+        'chunk_size': 1000,                     # maximum number of actions in one request
+        'max_chunk_bytes': 5 * 1024 * 1024,     # maximum size of one request
+        'max_retries': 5,                       # number of retries for rejected actions
+        'initial_backoff': 2,                   # seconds before the first retry
+        'max_backoff': 60,                      # maximum number of seconds between retries
+        'request_timeout': 60,
+        'log_chunks': False                     # whether to print statistics for each chunk
+    }
+
+    def __init__(self, es, settings):
+        self.es = es
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if 'bulk_loader' in settings:
+            self.settings.update(settings['bulk_loader'])
+        self.executor = None
+        self.inFlight = set()
+        self.curChunk = []          # list of tuples (serialized lines, size in bytes, original action)
+        self.curChunkBytes = 0
+        self.errors = []
+        self.errorHandlers = {}     # index name -> function that handles failed actions
+        self.fallbackActions = []   # actions returned by error handlers, sent in flush()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the counters used in the load report.
+        """
+        self.stats = {
+            'requests': 0,
+            'actions': 0,
+            'bytes': 0,
+            'retries': 0,
+            'request_time': 0,      # total time spent waiting for responses
+            'max_latency': 0,
+            'actions_by_index': {}
+        }
+        self.timeStart = None
+
+    def set_error_handler(self, index, handler):
+        """
+        Register a function that is called for each action for the
+        given index that failed with an error other than a rejection.
+        It is called as handler(action, result), where result is the
+        item of the bulk response, and returns a list of actions that
+        should be sent instead (possibly empty), or None if the error
+        should be reported. The handler is called in a sending thread.
+        """
+        self.errorHandlers[index] = handler
+
+    def serialize_action(self, action):
+        """
+        Return the lines of the bulk request body that correspond
+        to one action and their total size in bytes.
+        """
+        actionMeta, source = expand_action(action)
+        lines = [self.es.transport.serializer.dumps(actionMeta)]
+        if source is not None:
+            lines.append(self.es.transport.serializer.dumps(source))
+        return lines, sum(len(line.encode('utf-8')) + 1 for line in lines)
+
+    def add(self, actions):
+        """
+        Add the actions to the current chunk and send each chunk
+        that is full. Partially filled chunks are kept until more
+        actions arrive or flush() is called.
+        """
+        for action in actions:
+            lines, size = self.serialize_action(action)
+            self.add_lines(lines, size, action)
+
+    def add_serialized(self, actions):
+        """
+        Add actions that have already been serialized, e.g. read
+        from the files written by BulkExporter. actions is an iterable
+        of tuples (lines of the request body, action), where action
+        only needs the _index key, which is used in the statistics.
+        """
+        for lines, action in actions:
+            self.add_lines(lines, sum(len(line.encode('utf-8')) + 1 for line in lines), action)
+
+    def add_lines(self, lines, size, action):
+        """
+        Add one serialized action to the current chunk and send
+        the chunk if it is full.
+        """
+        if self.timeStart is None:
+            self.timeStart = time.time()
+        if (len(self.curChunk) > 0
+                and (len(self.curChunk) >= self.settings['chunk_size']
+                     or self.curChunkBytes + size > self.settings['max_chunk_bytes'])):
+            self.submit_chunk()
+        self.curChunk.append((lines, size, action))
+        self.curChunkBytes += size
+
+    def submit_chunk(self):
+        """
+        Pass the current chunk to one of the sending threads. If too
+        many chunks are already being sent, wait until some of them
+        are done.
+        """
+        if len(self.curChunk) <= 0:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.settings['thread_count'])
+        while len(self.inFlight) >= self.settings['thread_count'] + self.settings['queue_size']:
+            done, self.inFlight = wait(self.inFlight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()     # re-raise exceptions from the sending thread
+        self.inFlight.add(self.executor.submit(self.send_chunk, self.curChunk))
+        self.curChunk = []
+        self.curChunkBytes = 0
+
+    def send_chunk(self, chunk):
+        """
+        Send one chunk, retrying rejected actions. Errors other
+        than rejections are collected in self.errors.
+        """
+        backoff = self.settings['initial_backoff']
+        for attempt in range(self.settings['max_retries'] + 1):
+            body = '\n'.join(line for lines, size, action in chunk for line in lines) + '\n'
+            t1 = time.time()
+            try:
+                resp = self.es.bulk(body=body, request_timeout=self.settings['request_timeout'])
+            except TransportError as err:
+                if err.status_code != 429 or attempt >= self.settings['max_retries']:
+                    raise
+                print('Bulk request rejected (429), retrying in', backoff, 'seconds.')
+                with self.lock:
+                    self.stats['retries'] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.settings['max_backoff'])
+                continue
+            latency = time.time() - t1
+            rejected = []
+            processed = []
+            for (lines, size, action), item in zip(chunk, resp['items']):
+                opType, result = item.popitem()
+                status = result.get('status', 500)
+                if status == 429 and attempt < self.settings['max_retries']:
+                    rejected.append((lines, size, action))
+                    continue
+                processed.append(action)
+                if not 200 <= status < 300:
+                    handler = self.errorHandlers.get(action.get('_index', ''))
+                    if handler is not None:
+                        fallbackActions = handler(action, result)
+                        if fallbackActions is not None:
+                            with self.lock:
+                                self.fallbackActions += fallbackActions
+                            continue
+                    if '_source' in action:
+                        result['data'] = action['_source']
+                    with self.lock:
+                        self.errors.append({opType: result})
+            self.update_stats(chunk, processed, latency)
+            if len(rejected) <= 0:
+                return
+            print(len(rejected), 'actions rejected (429), retrying in', backoff, 'seconds.')
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.settings['max_backoff'])
+            chunk = rejected
+
+    def update_stats(self, chunk, processed, latency):
+        """
+        Update the load counters after a chunk has been sent.
+        processed contains the actions that were not rejected.
+        """
+        nBytes = sum(size for lines, size, action in chunk)
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += nBytes
+            self.stats['request_time'] += latency
+            self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+            if len(processed) < len(chunk):
+                self.stats['retries'] += 1
+            for action in processed:
+                self.stats['actions'] += 1
+                index = action.get('_index', '')
+                try:
+                    self.stats['actions_by_index'][index] += 1
+                except KeyError:
+                    self.stats['actions_by_index'][index] = 1
+        if self.settings['log_chunks']:
+            print('Bulk chunk: {0} actions, {1:.1f} KB, {2:.3f} s, {3:.0f} actions/s.'.format(
+                len(chunk), nBytes / 1024, latency, len(chunk) / max(latency, 0.001)))
+
+    def flush(self):
+        """
+        Send the remaining actions and the fallback actions returned
+        by the error handlers, and wait until all requests are done.
+        Raise BulkIndexError if any action failed.
+        """
+        while True:
+            self.submit_chunk()
+            while len(self.inFlight) > 0:
+                done, self.inFlight = wait(self.inFlight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            if len(self.fallbackActions) <= 0:
+                break
+            fallbackActions = self.fallbackActions
+            self.fallbackActions = []
+            self.add(fallbackActions)
+        if len(self.errors) > 0:
+            errors = self.errors
+            self.errors = []
+            raise BulkIndexError('%i document(s) failed to index.' % len(errors), errors)
+
+    def close(self):
+        """
+        Flush the remaining actions and stop the sending threads.
+        """
+        try:
+            self.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def report(self):
+        """
+        Print the load statistics collected so far.
+        """
+        if self.timeStart is None or self.stats['requests'] <= 0:
+            return
+        totalTime = max(time.time() - self.timeStart, 0.001)
+        print('Bulk load: {0} actions in {1} requests, {2:.1f} MB, {3} retries.'.format(
+            self.stats['actions'], self.stats['requests'],
+            self.stats['bytes'] / (1024 * 1024), self.stats['retries']))
+        print('Average request latency {0:.3f} s, maximum {1:.3f} s; '
+              'throughput {2:.0f} actions/s, {3:.2f} MB/s.'.format(
+                  self.stats['request_time'] / self.stats['requests'], self.stats['max_latency'],
+                  self.stats['actions'] / totalTime, self.stats['bytes'] / (1024 * 1024) / totalTime))
+        for index in sorted(self.stats['actions_by_index']):
+            print(index + ':', self.stats['actions_by_index'][index], 'actions.')
@@ -0,0 +1,110 @@
+import re
+
+
+class CollationTable(dict):
+    """
+    Translation table for str.translate() that turns each character of
+    a lowercase string into the code of its position in the alphabet.
+    Characters absent from the alphabet get codes that follow all
+    alphabet positions and preserve the code point order; they are
+    added to the table the first time they are seen.
+    """
+    MAX_CODE = 0x10FFFF
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base    # first code for characters absent from the alphabet
+
+    def __missing__(self, charCode):
+        code = self.base + charCode
+        if code < self.MAX_CODE:
+            value = chr(code)
+        else:
+            # The code does not fit in one character: MAX_CODE is
+            # not used by any other character, so the order is kept
+            value = chr(self.MAX_CODE) + chr(charCode)
+        self[charCode] = value
+        return value
+
+
+class Collation:
+    """
+    Compiles the custom alphabetical order of a language (the
+    lexicographic_order list in lang_props) into a sort key encoder.
+    The key of a string is another string, in which each character
+    or multicharacter sequence (digraph etc.) of the lowercased original
+    is replaced with a character whose code reflects its position
+    in the alphabet. Characters absent from the alphabet follow all
+    alphabet characters in Unicode order. Keys are compared by
+    Python as ordinary strings, which is much faster than comparing
+    lists of tuples, and are cached.
+    """
+    def __init__(self, lexicographicOrder=None, cacheSize=500000):
+        self.cacheSize = cacheSize
+        self.keyCache = {}      # string -> its sort key
+        self.lexicographicOrder = lexicographicOrder
+        if lexicographicOrder is None:
+            lexicographicOrder = []
+        positions = {lexicographicOrder[i]: i for i in range(len(lexicographicOrder))}
+        self.table = CollationTable(len(lexicographicOrder))
+        self.table[ord('\n')] = None    # line breaks are not characters for sorting
+        self.multigraphCodes = {}       # multicharacter sequence -> its code
+        for c, i in positions.items():
+            if len(c) == 1:
+                self.table[ord(c)] = chr(i)
+            else:
+                self.multigraphCodes[c] = chr(i)
+        multigraphs = sorted(set(c.lower() for c in lexicographicOrder if len(c) > 1),
+                             key=lambda x: (-len(x), x))
+        for c in multigraphs:
+            if c not in self.multigraphCodes:
+                # Only possible if the alphabet lists the sequence in upper case
+                self.multigraphCodes[c] = c.translate(self.table)
+        self.rxMultigraphs = None
+        if len(multigraphs) > 0:
+            self.rxMultigraphs = re.compile('(' + '|'.join(re.escape(c) for c in multigraphs) + ')')
+        self.rxChars = re.compile('(' + ''.join(re.escape(c) + '|' for c in multigraphs) + '.)')
+
+    def sort_key(self, s):
+        """
+        Return the sort key of a string.
+        """
+        try:
+            return self.keyCache[s]
+        except KeyError:
+            pass
+        if self.lexicographicOrder is None:
+            key = s.lower()
+        elif self.rxMultigraphs is None:
+            key = s.lower().translate(self.table)
+        else:
+            # re.split() puts the multigraphs at odd positions
+            parts = self.rxMultigraphs.split(s.lower())
+            for i in range(len(parts)):
+                if i % 2 == 0:
+                    parts[i] = parts[i].translate(self.table)
+                else:
+                    parts[i] = self.multigraphCodes[parts[i]]
+            key = ''.join(parts)
+        if len(self.keyCache) >= self.cacheSize:
+            self.keyCache = {}
+        self.keyCache[s] = key
+        return key
+
+    def sort(self, strings):
+        """
+        Return a sorted list of the strings.
+        """
+        if self.lexicographicOrder is None:
+            return sorted(strings)
+        return sorted(strings, key=self.sort_key)
+
+    def first_letter(self, s):
+        """
+        Return the first character or multicharacter sequence of the
+        lowercased string, or None if there is none.
+        """
+        m = self.rxChars.search(s.lower())
+        if m is None:
+            return None
+        return m.group(0)
@@ -0,0 +1,208 @@
+import os
+import json
+import heapq
+import shutil
+import tempfile
+from itertools import groupby
+
+
+class DictionaryWriter:
+    """
+    Writes the HTML dictionary of one language, which is shown in the
+    web interface when the user clicks the book glyph. The lexemes are
+    added in portions while the word list is being read. They are
+    sorted in runs of at most RUN_SIZE lexemes, which are stored in
+    temporary files, and the runs are merged when the dictionary is
+    written, so that the lexemes of a language are never all kept
+    in memory. The sorted lexemes are written letter by letter.
+    If split_dictionary is turned on, the main file only contains the
+    list of letters, and the table of each letter is written to
+    a separate file, which the web interface loads when the letter
+    is clicked.
+    """
+    DICT_DIR = '../search/web_app/templates/dictionaries'
+    RUN_SIZE = 200000       # maximum number of lexemes sorted in memory
+
+    def __init__(self, corpusName, lang, collation, splitByLetter=False, dictDir=DICT_DIR):
+        self.corpusName = corpusName
+        self.lang = lang
+        self.collation = collation
+        self.splitByLetter = splitByLetter
+        self.dictDir = dictDir
+        self.curRun = {}        # (lemma, grammatical tags, translations) -> [frequency, order of appearance]
+        self.runs = []          # names of the files with sorted runs
+        self.runDir = None
+        self.nLexemes = 0       # number of lexemes added so far, counting repetitions in different portions
+
+    def filename(self, letterNum=None):
+        """
+        Return the path to the main dictionary file or, if letterNum
+        is given, to the file with the table of one letter.
+        """
+        fname = 'dictionary_' + self.corpusName + '_' + self.lang
+        if letterNum is not None:
+            fname += '_' + str(letterNum)
+        return os.path.join(self.dictDir, fname + '.html')
+
+    def add_lexemes(self, lexFreqs):
+        """
+        Add a portion of lexemes. lexFreqs is a dictionary
+        {(lemma, grammatical tags, translations) -> frequency}.
+        Lexemes with empty lemmata are not included in the dictionary.
+        """
+        for lexTuple, freq in lexFreqs.items():
+            if len(lexTuple[0]) <= 0:
+                continue
+            try:
+                self.curRun[lexTuple][0] += freq
+            except KeyError:
+                self.curRun[lexTuple] = [freq, self.nLexemes]
+                self.nLexemes += 1
+        if len(self.curRun) >= self.RUN_SIZE:
+            self.write_run()
+
+    def run_entries(self):
+        """
+        Return the lexemes of the current run as a sorted list of
+        entries [letter sort key, letter, lemma sort key, lemma,
+        grammatical tags, translations, frequency, order of appearance].
+        """
+        entries = []
+        for (lemma, grdic, trans), (freq, order) in self.curRun.items():
+            letter = self.collation.first_letter(lemma)
+            if letter is None:
+                letter = '*'
+            entries.append([self.collation.sort_key(letter), letter,
+                            self.collation.sort_key(lemma), lemma, grdic, trans,
+                            freq, order])
+        entries.sort(key=lambda e: e[:6])
+        return entries
+
+    def write_run(self):
+        """
+        Sort the current run and store it in a temporary file.
+        """
+        if len(self.curRun) <= 0:
+            return
+        if self.runDir is None:
+            self.runDir = tempfile.mkdtemp(prefix='tsakorpus_dictionary_')
+        fname = os.path.join(self.runDir, str(len(self.runs)) + '.json')
+        with open(fname, 'w', encoding='utf-8') as fOut:
+            for entry in self.run_entries():
+                fOut.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.runs.append(fname)
+        self.curRun = {}
+
+    @staticmethod
+    def read_run(fname):
+        """
+        Iterate over the entries of a run stored in a file.
+        """
+        with open(fname, 'r', encoding='utf-8') as fIn:
+            for line in fIn:
+                yield json.loads(line)
+
+    def iterate_lexemes(self):
+        """
+        Merge the runs and iterate over the entries of all lexemes
+        in sort order. Frequencies of a lexeme that occurs in several
+        runs are summed up.
+        """
+        if len(self.runs) <= 0:
+            entries = iter(self.run_entries())
+        else:
+            self.write_run()
+            entries = heapq.merge(*[self.read_run(fname) for fname in self.runs],
+                                  key=lambda e: e[:6])
+        prevEntry = None
+        for entry in entries:
+            if prevEntry is not None and prevEntry[:6] == entry[:6]:
+                prevEntry[6] += entry[6]
+                prevEntry[7] = min(prevEntry[7], entry[7])
+                continue
+            if prevEntry is not None:
+                yield prevEntry
+            prevEntry = entry
+        if prevEntry is not None:
+            yield prevEntry
+
+    def iterate_letters(self):
+        """
+        Iterate over tuples (letter, iterator over its lexemes) in
+        alphabetical order of the letters. Lexemes are tuples (lemma,
+        grammatical tags, translations, frequency). Lexemes with the
+        same lemma sort key are ordered by descending frequency, and
+        those with equal frequencies, by order of appearance.
+        """
+        for letter, letterEntries in groupby(self.iterate_lexemes(), key=lambda e: e[1]):
+            yield letter, (
+                (lemma, grdic, trans, freq)
+                for lemmaKey, lemmaEntries in groupby(letterEntries, key=lambda e: e[2])
+                for l1, l2, l3, lemma, grdic, trans, freq, order in sorted(lemmaEntries,
+                                                                           key=lambda e: (-e[6], e[7]))
+            )
+
+    def remove_runs(self):
+        """
+        Remove the temporary files with the runs.
+        """
+        if self.runDir is not None:
+            shutil.rmtree(self.runDir, ignore_errors=True)
+            self.runDir = None
+        self.runs = []
+        self.curRun = {}
+
+    @staticmethod
+    def letter_table(letter, lexemes):
+        """
+        Iterate over the lines of the HTML of one letter.
+        """
+        yield '<h2 class="dictionary_letter">' + letter.upper() + '</h2>\n'
+        yield ('<table class="dictionary_table">\n<thead>\n'
+               '<th>{{ _(\'word_th_lemma\') }}</th>'
+               '<th>{{ _(\'word_th_gr\') }}</th>'
+               '<th>{{ _(\'word_th_trans_en\') }}</th>'
+               '<th>{{ _(\'word_th_frequency\') }}</th>'
+               '</thead>\n<tbody>\n')
+        for lemma, grdic, trans, freq in lexemes:
+            yield ('<tr>\n<td class="dictionary_lemma">' + lemma + '</td><td>' + grdic + '</td>'
+                   '<td>' + trans + '</td><td>'
+                   + str(freq) + '</td></tr>\n')
+        yield '</tbody>\n</table>\n'
+
+    def write(self):
+        """
+        Write the dictionary of the lexemes added with add_lexemes()
+        and remove the temporary files.
+        """
+        if not os.path.exists(self.dictDir):
+            os.makedirs(self.dictDir)
+        fOut = open(self.filename(), 'w', encoding='utf-8')
+        fOut.write('<h1 class="dictionary_header"> {{ _(\'Dictionary_header\') }} '
+                   '({{ _(\'langname_' + self.lang + '\') }})</h1>\n')
+        letters = []
+        try:
+            for letter, lexemes in self.iterate_letters():
+                if self.splitByLetter:
+                    with open(self.filename(len(letters)), 'w', encoding='utf-8') as fLetter:
+                        fLetter.writelines(self.letter_table(letter, lexemes))
+                else:
+                    fOut.writelines(self.letter_table(letter, lexemes))
+                letters.append(letter)
+        finally:
+            self.remove_runs()
+        if self.splitByLetter:
+            # The tables are in separate files, so the list of letters
+            # can be written after them
+            fOut.write('<div class="dictionary_letters">\n')
+            for i in range(len(letters)):
+                fOut.write('<span class="dictionary_letter_link" data-lang="' + self.lang
+                           + '" data-letter="' + str(i) + '">' + letters[i].upper() + '</span>\n')
+            fOut.write('</div>\n<div id="dictionary_letter_body"></div>\n')
+        fOut.close()
+        if self.splitByLetter:
+            # Remove the files of letters that are no longer there
+            i = len(letters)
+            while os.path.exists(self.filename(i)):
+                os.remove(self.filename(i))
+                i += 1
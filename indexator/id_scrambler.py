@@ -0,0 +1,47 @@
+import random
+
+
+class IDScrambler:
+    """
+    Turns consecutive sentence IDs into (relatively) randomized ones.
+    IDs are permuted within blocks of BLOCK_SIZE consecutive numbers,
+    so that the first ID of each block stays the same and the other IDs
+    of a block are mapped onto each other. The permutation is a small
+    Feistel network over 20-bit numbers: each of its four rounds XORs
+    one 10-bit half with a value looked up in a random table by the
+    other half. Numbers outside the block are skipped by applying
+    the network again (cycle walking). Only the tables, generated
+    from the seed, are stored, so the same seed gives the same IDs
+    in any process and in any later run.
+    """
+    BLOCK_SIZE = 1000000
+    HALF_BITS = 10          # 2 ** 20 > BLOCK_SIZE
+
+    def __init__(self, seed):
+        self.seed = seed
+        rand = random.Random(seed)
+        self.roundTables = []
+        for i in range(4):
+            table = list(range(1 << self.HALF_BITS))
+            rand.shuffle(table)
+            self.roundTables.append(table)
+
+    def scramble(self, realID):
+        """
+        Return the randomized ID that corresponds to a real
+        sentence ID. Negative IDs are not changed.
+        """
+        idStart, idEnd = divmod(realID, self.BLOCK_SIZE)
+        if realID < 0 or idEnd == 0:
+            return realID
+        t0, t1, t2, t3 = self.roundTables
+        halfMask = (1 << self.HALF_BITS) - 1
+        while True:
+            left, right = idEnd >> self.HALF_BITS, idEnd & halfMask
+            left ^= t0[right]
+            right ^= t1[left]
+            left ^= t2[right]
+            right ^= t3[left]
+            idEnd = (left << self.HALF_BITS) | right
+            if 0 < idEnd < self.BLOCK_SIZE:
+                return idStart * self.BLOCK_SIZE + idEnd
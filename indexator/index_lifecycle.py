@@ -0,0 +1,231 @@
+from elasticsearch.exceptions import TransportError
+import time
+
+
+class IndexLifecycle:
+    """
+    Changes the settings of newly created indices for the time of
+    bulk loading and restores them afterwards. While the indices are
+    being loaded, they are not refreshed and have no replicas, which
+    makes loading considerably faster. After loading, the indices can
+    be force-merged, which speeds up the first searches, and the
+    cluster is given time to allocate the replicas.
+    If versioned_indices is turned on, each full indexation creates
+    a new version of the indices (e.g. corpus.sentences.v20240101120000)
+    while the previous version is still being searched. When the new
+    version is ready, the aliases with the usual index names (e.g.
+    corpus.sentences) are switched to it in one request, and old
+    versions are deleted. Afterwards, the size of each index and of
+    its largest fields can be reported, which shows how the mapping
+    affects the storage.
+    The parameters are taken from the index_lifecycle dictionary
+    in corpus.json.
+    """
+    DEFAULT_SETTINGS = {
+        'disable_refresh': True,        # whether refresh is switched off while loading
+        'load_replicas': 0,             # number of replicas while loading (None: do not change)
+        'number_of_replicas': None,     # number of replicas after loading (None: restore the previous value)
+        'forcemerge_segments': 0,       # number of segments to merge each index into (0: no force merge)
+        'wait_for_status': 'green',     # cluster health to wait for after loading (None: do not wait)
+        'wait_timeout': '10m',
+        'request_timeout': 3600,        # for force merge and waiting, in seconds
+        'versioned_indices': False,     # whether to build new versions of the indices and switch aliases
+        'keep_versions': 1,             # number of previous versions kept after the switch
+        'storage_report': False         # whether to print the storage used by each index and field
+    }
+    REPORT_FIELDS = 25      # number of the largest fields listed in the storage report
+
+    def __init__(self, es, es_ic, settings):
+        self.es = es
+        self.es_ic = es_ic
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if 'index_lifecycle' in settings:
+            self.settings.update(settings['index_lifecycle'])
+        self.savedSettings = {}     # index name -> settings to restore after loading
+
+    def start_load(self, indices, savedSettings=None):
+        """
+        Remember the current refresh interval and number of replicas
+        of the indices and change them for bulk loading. If the loading
+        is resumed after a crash, the indices still have the loading
+        settings, so the values remembered before (savedSettings)
+        are restored afterwards instead.
+        """
+        loadSettings = {}
+        if self.settings['disable_refresh']:
+            loadSettings['refresh_interval'] = '-1'
+        if self.settings['load_replicas'] is not None:
+            loadSettings['number_of_replicas'] = self.settings['load_replicas']
+        if len(loadSettings) <= 0:
+            return
+        for index in indices:
+            if savedSettings is not None:
+                if index in savedSettings:
+                    self.savedSettings[index] = savedSettings[index]
+                    self.es_ic.put_settings(index=index, body={'index': loadSettings})
+                continue
+            curSettings = self.es_ic.get_settings(index=index)[index]['settings']['index']
+            # A missing refresh_interval is restored as None,
+            # which resets it to the default value
+            self.savedSettings[index] = {
+                'refresh_interval': curSettings.get('refresh_interval'),
+                'number_of_replicas': curSettings.get('number_of_replicas')
+            }
+            self.es_ic.put_settings(index=index, body={'index': loadSettings})
+
+    def restore_settings(self, indices):
+        """
+        Restore the settings changed by start_load(). The number of
+        replicas is set to the configured value, if there is one.
+        """
+        for index in indices:
+            if index not in self.savedSettings:
+                continue
+            finalSettings = {}
+            if self.settings['disable_refresh']:
+                finalSettings['refresh_interval'] = self.savedSettings[index]['refresh_interval']
+            if self.settings['number_of_replicas'] is not None:
+                finalSettings['number_of_replicas'] = self.settings['number_of_replicas']
+            elif self.settings['load_replicas'] is not None:
+                finalSettings['number_of_replicas'] = self.savedSettings[index]['number_of_replicas']
+            self.es_ic.put_settings(index=index, body={'index': finalSettings})
+            del self.savedSettings[index]
+
+    def finish_load(self, indices):
+        """
+        Refresh the indices after loading, force-merge them if
+        necessary and wait until the cluster reaches the required
+        health status. Green status is only waited for if there
+        are enough nodes for the replicas; otherwise, the indices
+        can only become yellow. If storage_report is turned on,
+        print the sizes of the indices and their fields afterwards.
+        """
+        self.es_ic.refresh(index=','.join(indices))
+        if self.settings['forcemerge_segments'] > 0:
+            print('Merging index segments...')
+            for index in indices:
+                self.es_ic.forcemerge(index=index,
+                                      max_num_segments=self.settings['forcemerge_segments'],
+                                      request_timeout=self.settings['request_timeout'])
+        status = self.settings['wait_for_status']
+        if status == 'green':
+            # Replicas cannot be allocated if there are not enough nodes
+            nNodes = self.es.cluster.health()['number_of_data_nodes']
+            allSettings = self.es_ic.get_settings(index=','.join(indices))
+            maxReplicas = max(int(allSettings[index]['settings']['index'].get('number_of_replicas', 1))
+                              for index in indices)
+            if maxReplicas >= nNodes:
+                status = 'yellow'
+        if status is not None:
+            print('Waiting for', status, 'cluster status...')
+            try:
+                health = self.es.cluster.health(index=','.join(indices),
+                                                wait_for_status=status,
+                                                timeout=self.settings['wait_timeout'],
+                                                request_timeout=self.settings['request_timeout'])
+                timedOut = health['timed_out']
+            except TransportError as err:
+                # Elasticsearch answers with 408 if the status has not been reached
+                if err.status_code != 408:
+                    raise
+                timedOut = True
+            if timedOut:
+                print('Warning: the indices have not reached', status,
+                      'status in', self.settings['wait_timeout'] + '.')
+        if self.settings['storage_report']:
+            self.storage_report(indices)
+
+    def new_version(self):
+        """
+        Return the suffix of the index names for a new version
+        of the indices.
+        """
+        return '.v' + time.strftime('%Y%m%d%H%M%S')
+
+    def concrete_indices(self, name):
+        """
+        Return the sorted list of indices an index name or an alias
+        refers to, or an empty list if there are none.
+        """
+        if not self.es_ic.exists(index=name):
+            return []
+        return sorted(self.es_ic.get_alias(index=name))
+
+    def switch_aliases(self, aliases):
+        """
+        Make each alias in the dictionary {alias -> index} point
+        to its new index only. All aliases are switched in one atomic
+        request. An index whose name coincides with the alias
+        (created before versioning was turned on) is deleted
+        in the same request.
+        """
+        actions = []
+        for alias, index in sorted(aliases.items()):
+            if self.es_ic.exists_alias(name=alias):
+                for oldIndex in self.concrete_indices(alias):
+                    actions.append({'remove': {'index': oldIndex, 'alias': alias}})
+            elif self.es_ic.exists(index=alias):
+                actions.append({'remove_index': {'index': alias}})
+            actions.append({'add': {'index': index, 'alias': alias}})
+        self.es_ic.update_aliases(body={'actions': actions})
+
+    def remove_old_versions(self, alias):
+        """
+        Delete the versions of an index (alias + '.v' + timestamp)
+        except the one the alias points to and keep_versions
+        newest previous versions.
+        """
+        curIndices = set(self.concrete_indices(alias))
+        versions = sorted((index for index in self.es_ic.get_alias(index=alias + '.v*')
+                           if index not in curIndices),
+                          reverse=True)
+        for index in versions[max(self.settings['keep_versions'], 0):]:
+            print('Deleting old index', index)
+            self.es_ic.delete(index=index)
+
+    def storage_report(self, indices):
+        """
+        Print the number of documents and the size of each index
+        and the sizes of its largest fields, broken down by data
+        structure. Field sizes are only available in Elasticsearch 7.15
+        and later, which have the disk usage API, and with a client
+        of the same version; otherwise, only the index sizes taken
+        from the index statistics are printed.
+        """
+        for index in indices:
+            self.es_ic.flush(index=index)
+            stats = self.es_ic.stats(index=index, metric='docs,store')['_all']['primaries']
+            print('\n{0}: {1} documents, {2:.1f} MB in primary shards.'.format(
+                index, stats['docs']['count'], stats['store']['size_in_bytes'] / (1024 * 1024)))
+            if not hasattr(self.es_ic, 'disk_usage'):
+                print('Field sizes are not available: the disk usage API requires '
+                      'the elasticsearch client 7.15 or later.')
+                continue
+            try:
+                usage = self.es_ic.disk_usage(index=index, run_expensive_tasks=True,
+                                              request_timeout=self.settings['request_timeout'])
+            except TransportError as err:
+                print('Field sizes are not available:', err.error)
+                continue
+            fieldSizes = {}     # field -> [total, inverted index, stored, doc values, points, norms]
+            for concreteIndex, indexUsage in usage.items():
+                if concreteIndex == '_shards':
+                    continue
+                for field, fieldUsage in indexUsage['fields'].items():
+                    sizes = [fieldUsage.get('total_in_bytes', 0),
+                             fieldUsage.get('inverted_index', {}).get('total_in_bytes', 0),
+                             fieldUsage.get('stored_fields_in_bytes', 0),
+                             fieldUsage.get('doc_values_in_bytes', 0),
+                             fieldUsage.get('points_in_bytes', 0),
+                             fieldUsage.get('norms_in_bytes', 0)]
+                    if field not in fieldSizes:
+                        fieldSizes[field] = sizes
+                    else:
+                        fieldSizes[field] = [fieldSizes[field][i] + sizes[i] for i in range(len(sizes))]
+            print('{0:<40}{1:>10}{2:>10}{3:>10}{4:>10}{5:>10}{6:>10}'.format(
+                'Field (KB)', 'total', 'inverted', 'stored', 'doc val.', 'points', 'norms'))
+            for field in sorted(fieldSizes, key=lambda f: -fieldSizes[f][0])[:self.REPORT_FIELDS]:
+                print('{0:<40}'.format(field) + ''.join('{0:>10.1f}'.format(v / 1024)
+                                                         for v in fieldSizes[field]))
+            if len(fieldSizes) > self.REPORT_FIELDS:
+                print('(' + str(len(fieldSizes) - self.REPORT_FIELDS), 'smaller fields not shown)')
@@ -1,20 +1,31 @@
 from elasticsearch import Elasticsearch
 from elasticsearch.client import IndicesClient
-from elasticsearch.helpers import bulk
-from elasticsearch.exceptions import RequestError
+from elasticsearch.helpers import scan
 import json
 import ijson
 import os
+import gzip
 import re
 import time
-import math
 import random
 import sys
 import subprocess
 import argparse
+import multiprocessing
 from prepare_data import PrepareData
-from json_doc_reader import JSONDocReader
+from json_doc_reader import JSONDocReader, JSONDoc
 from json2html import JSON2HTML
+from bulk_loader import BulkLoader, doc_error_fallback
+from bulk_export import BulkExporter
+from index_lifecycle import IndexLifecycle
+from shard_planner import ShardPlanner
+from word_stats import WordStats, SQLiteWordStats
+from collation import Collation
+from dictionary_writer import DictionaryWriter
+from id_scrambler import IDScrambler
+
+sys.path.insert(0, '../search/web_app')
+from freq_ranks import sorted_freqs, freq_ranks, freq_quantiles, rank_labels
 
 
 class Indexator:
@@ -23,10 +34,18 @@ class Indexator:
     database.
     """
     SETTINGS_DIR = '../conf'
+    INDEX_STATE_DIR = '../index_state'
     rxBadFileName = re.compile('[^\\w_.-]*', flags=re.DOTALL)
+    # Fields of word and lemma objects in the words index that
+    # can change when documents are added to or removed from the corpus
+    VOLATILE_WORD_FIELDS = ['wf_order', 'l_order', 'freq', 'lemma_freq', 'dids', 'd_freqs',
+                            'n_sents', 'n_docs', 'rank_true', 'lemma_rank_true', 'rank']
+    DICT_CHUNK_SIZE = 20000     # number of words in one task of dictionary generation
 
-    def __init__(self, overwrite=False):
+    def __init__(self, overwrite=False, workers=1, exportDir=None):
         self.overwrite = overwrite  # whether to overwrite an existing index without asking
+        self.workers = max(1, workers)   # number of processes that parse and prepare documents
+        self.exportDir = exportDir  # if set, bulk files are written there instead of indexing
         with open(os.path.join(self.SETTINGS_DIR, 'corpus.json'),
                   'r', encoding='utf-8') as fSettings:
             self.settings = json.load(fSettings)
@@ -40,6 +59,50 @@ class Indexator:
         self.lowerWf = False
         if 'wf_lowercase' not in self.settings or self.settings['wf_lowercase']:
             self.lowerWf = True
+        # Whether word statistics and the list of indexed files should be
+        # stored after indexing, so that the corpus could be updated later
+        self.keepState = ('incremental_indexing' in self.settings
+                          and self.settings['incremental_indexing'])
+        self.fulltextEnabled = ('fulltext_view_enabled' in self.settings
+                                and self.settings['fulltext_view_enabled'])
+        # Number of processes that generate full-text HTML; if it is 0,
+        # it is generated in the main process
+        self.fulltextWorkers = 0
+        if 'fulltext_workers' in self.settings:
+            self.fulltextWorkers = self.settings['fulltext_workers']
+        self.fulltextPool = None
+        self.fulltextTasks = []
+        self.dictionaryDir = DictionaryWriter.DICT_DIR     # where the HTML dictionaries are written
+        # Number of seconds between checkpoints written during a full
+        # indexation, from which it can be resumed (0: no checkpoints)
+        self.checkpointInterval = 0
+        if 'checkpoint_interval' in self.settings:
+            self.checkpointInterval = self.settings['checkpoint_interval']
+        self.lastCheckpoint = time.time()
+        # If word_freq_layout is "packed", frequencies of words and lemmata
+        # in individual documents are stored in the d_freqs arrays of
+        # the word and lemma objects instead of separate word_freq objects
+        self.packedFreqs = ('word_freq_layout' in self.settings
+                            and self.settings['word_freq_layout'] == 'packed')
+        # If ngram_index is turned on, the frequencies of pairs of adjacent
+        # words in each document are stored in a separate index, which
+        # is used to answer two-word queries without searching sentences
+        self.ngramIndex = ('ngram_index' in self.settings
+                           and self.settings['ngram_index'])
+        # If word_meta_tables is turned on, the frequencies of each word
+        # and lemma in the documents with each value of the document-level
+        # metafields listed in stat_options are stored in a separate index,
+        # from which the statistics by metafield are taken
+        self.wordMetaTables = ('word_meta_tables' in self.settings
+                               and self.settings['word_meta_tables'])
+        self.wordMetaFields = []
+        if (self.wordMetaTables and 'search_meta' in self.settings
+                and 'stat_options' in self.settings['search_meta']):
+            sentMetaFields = []
+            if 'sentence_meta' in self.settings:
+                sentMetaFields = self.settings['sentence_meta']
+            self.wordMetaFields = [field for field in self.settings['search_meta']['stat_options']
+                                   if field not in sentMetaFields]
         self.iterSent = None
         if self.input_format in ['json', 'json-gzip']:
             self.iterSent = JSONDocReader(format=self.input_format,
@@ -70,7 +133,12 @@ class Indexator:
         self.goodWordFields += ['gr.' + v for lang in categories
                                 for v in categories[lang].values()]
         self.goodWordFields = set(self.goodWordFields)
-        self.characterRegexes = {}
+        self.keptWordFields = self.goodWordFields | self.additionalWordFields
+        # Cleaned words are serialized with this encoder, which is
+        # faster than calling json.dumps() with the same parameters
+        self.wordEncoder = json.JSONEncoder(ensure_ascii=False, sort_keys=True)
+        self.collations = {}    # language -> Collation
+        self.sortedWords = {}   # alphabetical order -> sorting positions of word forms and lemmata
 
         self.pd = PrepareData()
 
@@ -82,22 +150,35 @@ class Indexator:
         else:
             self.es = Elasticsearch()
         self.es_ic = IndicesClient(self.es)
+        if self.exportDir is not None:
+            self.bulkLoader = BulkExporter(self.es, self.exportDir, self.settings)
+        else:
+            self.bulkLoader = BulkLoader(self.es, self.settings)
+        self.lifecycle = IndexLifecycle(self.es, self.es_ic, self.settings)
+        # If there is a shard_planner dictionary in corpus.json, the numbers
+        # of shards and replicas are chosen based on a sample of the corpus
+        # and the cluster (or the settings, if the cluster is not used)
+        self.shardPlanner = None
+        if 'shard_planner' in self.settings:
+            self.shardPlanner = ShardPlanner(self.es if self.exportDir is None else None,
+                                             self.settings)
+        # Suffix of the names of the indices being built if versioned_indices
+        # is turned on in index_lifecycle; the usual names are aliases then
+        self.indexVersion = ''
+        self.bulkLoader.set_error_handler(self.index_name('docs'), self.doc_error_fallback)
 
-        self.shuffled_ids = [i for i in range(1, 1000000)]
-        random.shuffle(self.shuffled_ids)
-        self.shuffled_ids.insert(0, 0)    # id=0 is special and should not change
-        self.tmpWordIDs = [{} for i in range(len(self.languages))]    # word as JSON -> its integer ID
-        self.tmpLemmaIDs = [{} for i in range(len(self.languages))]   # lemma as string -> its integer ID
-        # Apart from the two dictionaries above, words and lemmata
-        # have string IDs starting with 'w' or 'l' followed by an integer
-        self.word2lemma = [{} for i in range(len(self.languages))]    # word/lemma ID -> ID of its lemma (or -1, if none)
-        self.wordFreqs = [{} for i in range(len(self.languages))]     # word/lemma ID -> its frequency
-        self.wordSFreqs = [{} for i in range(len(self.languages))]    # word/lemma ID -> its number of sentences
-        self.wordDocFreqs = [{} for i in range(len(self.languages))]  # (word/lemma ID, dID) -> word frequency in the document
-        # self.wordSIDs = [{} for i in range(len(self.languages))]      # word's ID -> set of sentence IDs
-        self.wordDIDs = [{} for i in range(len(self.languages))]      # word/lemma ID -> set of document IDs
-        self.wfs = set()         # set of word forms (for sorting)
-        self.lemmata = set()     # set of lemmata (for sorting)
+        # Seed of the sentence ID randomization, stored with the index state
+        if 'sentence_id_seed' in self.settings and self.settings['sentence_id_seed'] is not None:
+            self.idSeed = self.settings['sentence_id_seed']
+        else:
+            self.idSeed = random.randint(1, 1000000000)
+        self.idScrambler = IDScrambler(self.idSeed)
+        self.localIDs = False    # True in worker processes, where sentence and word IDs are local to a document
+        self.wordStatsSettings = {'backend': 'memory', 'cache_size': 200000}
+        if 'word_stats' in self.settings:
+            self.wordStatsSettings.update(self.settings['word_stats'])
+        self.wordStats = None
+        self.reset_word_stats()
         self.sID = 0          # current sentence ID for each language
         self.dID = 0          # current document ID
         self.wID = 0          # current word ID
@@ -111,30 +192,103 @@ class Indexator:
 
         self.filenames = []   # List of tuples (filename, filesize)
         self.corpusSizeInBytes = 0
+        self.indexedFiles = {}  # filename relative to the corpus directory -> its document ID, size and mtime
+        self.droppedDocs = set()    # IDs of documents without a title whose metadata could not be indexed
+        self.docMetaValues = {}     # document ID -> {metafield -> its values}, for word_meta_tables
 
-    def delete_indices(self):
+    def reset_word_stats(self, backend='memory'):
+        """
+        Initialize empty word and lemma statistics, which are
+        kept either in memory or on disk, depending on the backend.
+        """
+        if self.wordStats is not None:
+            self.wordStats.close()
+        if backend == 'sqlite':
+            if not os.path.exists(self.INDEX_STATE_DIR):
+                os.makedirs(self.INDEX_STATE_DIR)
+            self.wordStats = SQLiteWordStats(len(self.languages),
+                                             os.path.join(self.INDEX_STATE_DIR, self.name + '.word_stats.sqlite'),
+                                             cacheSize=self.wordStatsSettings['cache_size'])
+        else:
+            self.wordStats = WordStats(len(self.languages))
+        self.wordCache = {}     # word key -> (word ID, lemma ID) for recently seen words
+        self.sortedWords = {}
+        self.reset_doc_stats()
+
+    def reset_doc_stats(self):
+        """
+        Initialize empty statistics for the current document, which
+        are added to self.wordStats when the document is indexed.
+        """
+        self.docWordFreqs = [{} for i in range(len(self.languages))]    # word ID -> [frequency, number of sentences]
+        self.docLemmaFreqs = [{} for i in range(len(self.languages))]   # lemma ID -> [frequency, number of sentences]
+        self.docNgramFreqs = {}     # (word ID, next word ID) -> [frequency, sentence IDs, language ID, lemma IDs]
+
+    def index_types(self):
+        """
+        Return the types of the indices the corpus consists of.
+        """
+        indexTypes = ['docs', 'words', 'sentences']
+        if self.ngramIndex:
+            indexTypes.append('ngrams')
+        if self.wordMetaTables:
+            indexTypes.append('word_meta')
+        return indexTypes
+
+    def index_name(self, indexType):
+        """
+        Return the name of the docs, words or sentences index
+        the data is written to.
+        """
+        return self.name + '.' + indexType + self.indexVersion
+
+    def set_index_version(self, indexVersion):
+        """
+        Write the data to the given version of the indices.
+        """
+        self.indexVersion = indexVersion
+        self.bulkLoader.set_error_handler(self.index_name('docs'), self.doc_error_fallback)
+
+    def confirm_overwrite(self, versioned=False):
         """
         If there already exist indices with the same names,
-        ask the user if they want to overwrite them. If they
-        say yes, remove the indices and return True. Otherwise,
-        return False.
+        ask the user if they want to overwrite them. Return
+        False if they do not. If versioned is True, the existing
+        indices are replaced only after a new version has been
+        built and validated, and the question says so.
         """
         if not self.overwrite:
             if (self.es_ic.exists(index=self.name + '.docs')
                     or self.es_ic.exists(index=self.name + '.words')
                     or self.es_ic.exists(index=self.name + '.sentences')):
-                print('It seems that a corpus named "' + self.name + '" already exists. '
-                      + 'Do you want to overwrite it? [y/n]')
+                if versioned:
+                    print('It seems that a corpus named "' + self.name + '" already exists. '
+                          + 'A new version of its indices will be built; the current version '
+                          + 'remains searchable until then and is deleted afterwards. '
+                          + 'Do you want to continue? [y/n]')
+                else:
+                    print('It seems that a corpus named "' + self.name + '" already exists. '
+                          + 'Do you want to overwrite it? [y/n]')
                 reply = input()
                 if reply.lower() != 'y':
                     print('Indexation aborted.')
                     return False
-        if self.es_ic.exists(index=self.name + '.docs'):
-            self.es_ic.delete(index=self.name + '.docs')
-        if self.es_ic.exists(index=self.name + '.words'):
-            self.es_ic.delete(index=self.name + '.words')
-        if self.es_ic.exists(index=self.name + '.sentences'):
-            self.es_ic.delete(index=self.name + '.sentences')
+        return True
+
+    def delete_indices(self):
+        """
+        If there already exist indices with the same names,
+        ask the user if they want to overwrite them. If they
+        say yes, remove the indices and return True. Otherwise,
+        return False.
+        """
+        if not self.confirm_overwrite():
+            return False
+        # If the names are aliases, the indices they point to are deleted.
+        # Optional indices are deleted even if they are not used anymore.
+        for indexType in ['docs', 'words', 'sentences', 'ngrams', 'word_meta']:
+            for index in self.lifecycle.concrete_indices(self.name + '.' + indexType):
+                self.es_ic.delete(index=index)
         # Obsolete index word_freq can be present in pre-2019 corpora
         if self.es_ic.exists(index=self.name + '.word_freqs'):
             self.es_ic.delete(index=self.name + '.word_freqs')
@@ -143,20 +297,47 @@ class Indexator:
     def create_indices(self):
         """
         Create empty elasticsearch indices for corpus data, using
-        mappings provided by PrepareData.
+        mappings provided by PrepareData and, if there is a shard
+        planner, the numbers of shards and replicas it has chosen
+        for the files found by analyze_dir(). In export mode, the
+        mappings are stored with the exported files instead.
         """
         self.sentWordMapping = self.pd.generate_words_mapping(wordFreqs=False)
         self.wordMapping = self.pd.generate_words_mapping(wordFreqs=True)
         self.sentMapping = self.pd.generate_sentences_mapping(self.sentWordMapping,
                                                               corpusSizeInBytes=self.corpusSizeInBytes)
         self.docMapping = self.pd.generate_docs_mapping()
+        if self.ngramIndex:
+            self.ngramMapping = self.pd.generate_ngrams_mapping()
+        if self.wordMetaTables:
+            self.wordMetaMapping = self.pd.generate_word_meta_mapping()
+        if self.shardPlanner is not None:
+            plan = self.shardPlanner.plan(self.filenames, self.iterSent)
+            self.docMapping['settings'].update(plan['docs'])
+            self.wordMapping['settings'].update(plan['words'])
+            self.sentMapping['settings'].update(plan['sentences'])
 
-        self.es_ic.create(index=self.name + '.docs',
+        if self.exportDir is not None:
+            self.bulkLoader.set_mapping(self.index_name('docs'), self.docMapping)
+            self.bulkLoader.set_mapping(self.index_name('words'), self.wordMapping)
+            self.bulkLoader.set_mapping(self.index_name('sentences'), self.sentMapping)
+            if self.ngramIndex:
+                self.bulkLoader.set_mapping(self.index_name('ngrams'), self.ngramMapping)
+            if self.wordMetaTables:
+                self.bulkLoader.set_mapping(self.index_name('word_meta'), self.wordMetaMapping)
+            return
+        self.es_ic.create(index=self.index_name('docs'),
                           body=self.docMapping)
-        self.es_ic.create(index=self.name + '.words',
+        self.es_ic.create(index=self.index_name('words'),
                           body=self.wordMapping)
-        self.es_ic.create(index=self.name + '.sentences',
+        self.es_ic.create(index=self.index_name('sentences'),
                           body=self.sentMapping)
+        if self.ngramIndex:
+            self.es_ic.create(index=self.index_name('ngrams'),
+                              body=self.ngramMapping)
+        if self.wordMetaTables:
+            self.es_ic.create(index=self.index_name('word_meta'),
+                              body=self.wordMetaMapping)
 
     def randomize_id(self, realID):
         """
@@ -164,10 +345,9 @@ class Indexator:
         is needed in context-aware word queries where the sentences
         are iterated in the order determined by their IDs.
         """
-        if realID < 0:
+        if self.localIDs:
             return realID
-        idStart, idEnd = realID // 1000000, realID % 1000000
-        return idStart * 1000000 + self.shuffled_ids[idEnd]
+        return self.idScrambler.scramble(realID)
 
     def enhance_word(self, word):
         """
@@ -185,29 +365,82 @@ class Indexator:
         """
         Clean a word object by removing unnecessary fields, lowercasing
         things if needed, etc. Return the cleaned object and the lemma.
-        Add word form and lemma to the global lists.
         """
         wClean = {'lang': langID}
         lemma = ''
         for field in w:
-            if field in self.goodWordFields or field in self.additionalWordFields:
+            if field in self.keptWordFields:
                 wClean[field] = w[field]
                 if field == 'wf':
                     if self.lowerWf:
                         wClean[field] = wClean[field].lower()
-                    self.wfs.add(wClean[field])
         if 'ana' in w:
             lemma = self.get_lemma(w, lower_lemma=self.lowerWf)
-            self.lemmata.add(lemma)
             wClean['ana'] = []
             for ana in w['ana']:
                 cleanAna = {}
                 for anaField in ana:
-                    if anaField in self.goodWordFields or anaField in self.additionalWordFields:
+                    if anaField in self.keptWordFields:
                         cleanAna[anaField] = ana[anaField]
                 wClean['ana'].append(cleanAna)
         return wClean, lemma
 
+    @staticmethod
+    def flatten_value(value, key):
+        """
+        Append a representation of a JSON value to the list key.
+        Strings are appended as they are; other values are preceded
+        by None and their type name, and lists and dictionaries also
+        by their length. Two values have equal representations if and
+        only if their JSON serializations with sorted keys are equal.
+        """
+        if type(value) == str:
+            key.append(value)
+        elif type(value) == list:
+            key += (None, 'list', len(value))
+            for v in value:
+                Indexator.flatten_value(v, key)
+        elif type(value) == dict:
+            key += (None, 'dict', len(value))
+            for k in sorted(value):
+                key.append(k)
+                Indexator.flatten_value(value[k], key)
+        else:
+            key += (None, type(value).__name__, value)
+
+    def word_key(self, w, langID):
+        """
+        Return a hashable key that identifies the cleaned version of
+        a word (see clean_word()): two words have equal keys if and only
+        if their cleaned versions serialized as JSON are equal. The key
+        is calculated directly from the original word object, which is
+        faster than cleaning and serializing it. It is a flat tuple of
+        strings and numbers, which the garbage collector stops tracking
+        quickly.
+        """
+        fields = {'lang': langID}
+        for field, value in w.items():
+            if field in self.keptWordFields:
+                fields[field] = value
+        if 'ana' in w:
+            fields['ana'] = w['ana']
+        if self.lowerWf and 'wf' in fields:
+            fields['wf'] = fields['wf'].lower()
+        key = [None, 'dict', len(fields)]
+        for field in sorted(fields):
+            key.append(field)
+            if field != 'ana':
+                self.flatten_value(fields[field], key)
+                continue
+            key += (None, 'list', len(w['ana']))
+            for ana in w['ana']:
+                anaFields = sorted(anaField for anaField in ana if anaField in self.keptWordFields)
+                key += (None, 'dict', len(anaFields))
+                for anaField in anaFields:
+                    key.append(anaField)
+                    self.flatten_value(ana[anaField], key)
+        return tuple(key)
+
     def process_sentence_words(self, words, langID):
         """
         Take words from a sentence, remove all non-searchable
@@ -215,7 +448,10 @@ class Indexator:
         Add w_id and l_id properties to each word of the words list.
         Return the value of the 'sent_analyzed' meta field.
         """
-        sIDAdded = set()            # word IDs for which the current settence ID has been counted
+        wordsAdded = set()          # word IDs for which the current sentence has been counted
+        lemmataAdded = set()        # same for lemma IDs
+        docWordFreqs = self.docWordFreqs[langID]
+        docLemmaFreqs = self.docLemmaFreqs[langID]
         bFullyAnalyzed = True       # Whether each word in the sentence is analyzed
         bUniquelyAnalyzed = True    # Whether, in addition, each word has exactly one analysis
         for w in words:
@@ -232,93 +468,194 @@ class Indexator:
             elif len(w['ana']) > 1:
                 bUniquelyAnalyzed = False
 
-            wClean, lemma = self.clean_word(w, langID)
-            wCleanTxt = json.dumps(wClean, ensure_ascii=False, sort_keys=True)
-            if wCleanTxt in self.tmpWordIDs[langID]:
-                wID = self.tmpWordIDs[langID][wCleanTxt]
-            else:
-                wID = sum(len(self.tmpWordIDs[i]) for i in range(len(self.languages)))
-                self.tmpWordIDs[langID][wCleanTxt] = wID
-            wID = 'w' + str(wID)
-            w['w_id'] = wID
-            lID = 'l0'   # Default: no analysis
-            if len(lemma) > 0:
-                try:
-                    lID = self.tmpLemmaIDs[langID][lemma]
-                except KeyError:
-                    lID = sum(len(self.tmpLemmaIDs[i])
-                              for i in range(len(self.languages))) + 1
-                    self.tmpLemmaIDs[langID][lemma] = lID
-                lID = 'l' + str(lID)
-                self.word2lemma[langID][wID] = lID
-            w['l_id'] = lID
-            for itemID in [wID, lID]:
-                try:
-                    self.wordFreqs[langID][itemID] += 1
-                except KeyError:
-                    self.wordFreqs[langID][itemID] = 1
-                if itemID not in sIDAdded:
-                    sIDAdded.add(itemID)
-                    try:
-                        self.wordSFreqs[langID][itemID] += 1
-                    except KeyError:
-                        self.wordSFreqs[langID][itemID] = 1
-                try:
-                    self.wordDIDs[langID][itemID].add(self.dID)
-                except KeyError:
-                    self.wordDIDs[langID][itemID] = {self.dID}
-                try:
-                    self.wordDocFreqs[langID][(itemID, self.dID)] += 1
-                except KeyError:
-                    self.wordDocFreqs[langID][(itemID, self.dID)] = 1
+            key = self.word_key(w, langID)
+            try:
+                wID, lID = self.wordCache[key]
+            except KeyError:
+                wClean, lemma = self.clean_word(w, langID)
+                lID = 0   # Default: no analysis
+                if len(lemma) > 0:
+                    lID = self.wordStats.lemma_id(langID, lemma)
+                lemmaForm = None
+                if 'ana' in w:
+                    lemmaForm = lemma
+                wID = self.wordStats.word_id(langID, self.wordEncoder.encode(wClean),
+                                             wClean.get('wf'), lemmaForm, lID)
+                if len(self.wordCache) >= self.wordStatsSettings['cache_size']:
+                    self.wordCache = {}
+                self.wordCache[key] = (wID, lID)
+            w['w_id'] = 'w' + str(wID)
+            w['l_id'] = 'l' + str(lID)
+            try:
+                docWordFreqs[wID][0] += 1
+            except KeyError:
+                docWordFreqs[wID] = [1, 0]
+            if wID not in wordsAdded:
+                wordsAdded.add(wID)
+                docWordFreqs[wID][1] += 1
+            try:
+                docLemmaFreqs[lID][0] += 1
+            except KeyError:
+                docLemmaFreqs[lID] = [1, 0]
+            if lID not in lemmataAdded:
+                lemmataAdded.add(lID)
+                docLemmaFreqs[lID][1] += 1
         if not bFullyAnalyzed:
             return 'incomplete'
         if not bUniquelyAnalyzed:
             return 'complete'
         return 'unique'
 
-    def character_regex(self, lang):
-        """
-        Regex for splitting text into characters. Takes into account
-        multicharacter sequences (digraphs etc.) defined in lang_props.lexicographic_order.
-        """
-        if lang in self.characterRegexes:
-            return self.characterRegexes[lang]   # cache
-        if lang not in self.settings['lang_props'] or 'lexicographic_order' not in self.settings['lang_props'][lang]:
-            self.characterRegexes[lang] = re.compile('.')
-            return self.characterRegexes[lang]
-        rxChars = '(' + '|'.join(re.escape(c.lower())
-                                 for c in sorted(self.settings['lang_props'][lang]['lexicographic_order'],
-                                                 key=lambda x: (-len(x), x))
-                                 if len(c) > 1)
-        if len(rxChars) > 1:
-            rxChars += '|'
-        rxChars += '.)'
-        rxChars = re.compile(rxChars)
-        self.characterRegexes[lang] = rxChars
-        return rxChars
-
-    def make_sorting_function(self, lang):
-        """
-        Return a function that can be used for sorting tokens
-        in a list according to the alphabetical ordering specified
-        for the language lang.
+    @staticmethod
+    def next_words(words, pos):
+        """
+        Return the positions of the words that immediately follow the word
+        at the position pos in the words list, skipping punctuation and other
+        non-word tokens. There can be several of them if the sentence has
+        several tokenization variants. Words are linked with next_word,
+        exactly as when word distances are checked in the search interface.
         """
-        sortingFunction = lambda x: x
-        if lang in self.settings['lang_props'] and 'lexicographic_order' in self.settings['lang_props'][lang]:
-            dictSort = {self.settings['lang_props'][lang]['lexicographic_order'][i]:
-                            (i, self.settings['lang_props'][lang]['lexicographic_order'][i])
-                        for i in range(len(self.settings['lang_props'][lang]['lexicographic_order']))}
-            maxIndex = len(dictSort)
-            rxChars = self.character_regex(lang)
+        result = []
+        visited = set()
+        stack = [pos]
+        while len(stack) > 0:
+            curPos = stack.pop()
+            if 'next_word' not in words[curPos]:
+                continue
+            nextPos = words[curPos]['next_word']
+            if type(nextPos) == int:
+                nextPos = [nextPos]
+            for p in nextPos:
+                if not (0 <= p < len(words)) or p in visited:
+                    continue
+                visited.add(p)
+                if words[p]['wtype'] == 'word':
+                    result.append(p)
+                else:
+                    stack.append(p)
+        return result
 
-            def charReplaceFunction(c):
-                if c in dictSort:
-                    return dictSort[c]
-                return (maxIndex, c)
+    def count_ngrams(self, words, langID):
+        """
+        Add the pairs of adjacent words of a sentence to the n-gram
+        statistics of the current document. The words must already
+        have their w_id and l_id, and self.sID must be the ID of
+        the sentence.
+        """
+        pairsAdded = set()      # pairs for which the current sentence has been counted
+        for i in range(len(words)):
+            if words[i]['wtype'] != 'word':
+                continue
+            for j in self.next_words(words, i):
+                pair = (words[i]['w_id'], words[j]['w_id'])
+                try:
+                    self.docNgramFreqs[pair][0] += 1
+                except KeyError:
+                    self.docNgramFreqs[pair] = [1, [], langID, words[i]['l_id'], words[j]['l_id']]
+                if pair not in pairsAdded:
+                    pairsAdded.add(pair)
+                    self.docNgramFreqs[pair][1].append(self.sID)
 
-            sortingFunction = lambda x: [charReplaceFunction(c) for c in rxChars.findall(x.lower())]
-        return sortingFunction
+    def iterate_ngrams(self):
+        """
+        Iterate over actions that index the pairs of adjacent words
+        of the current document with their frequencies in it.
+        The IDs of the sentences are stored, so that the sentences
+        that contain several pairs fitting a query are counted once.
+        """
+        for pair in sorted(self.docNgramFreqs):
+            freq, sIDs, langID, l1ID, l2ID = self.docNgramFreqs[pair]
+            yield {
+                '_index': self.index_name('ngrams'),
+                '_id': str(self.dID) + '_' + pair[0] + '_' + pair[1],
+                '_source': {
+                    'w1_id': pair[0],
+                    'w2_id': pair[1],
+                    'l1_id': l1ID,
+                    'l2_id': l2ID,
+                    'lang': langID,
+                    'd_id': self.dID,
+                    'freq': freq,
+                    'n_sents': len(sIDs),
+                    's_ids': sIDs
+                }
+            }
+
+    def doc_meta_values(self, meta):
+        """
+        Return a dictionary {metafield -> list of values} with the values
+        of the document-level stat_options fields in the metadata
+        of a document. The values are turned into strings, exactly as
+        they are stored in the keyword fields of the docs index.
+        """
+        values = {}
+        for field in self.wordMetaFields:
+            if field not in meta:
+                continue
+            fieldValues = meta[field]
+            if type(fieldValues) != list:
+                fieldValues = [fieldValues]
+            strValues = set()
+            for v in fieldValues:
+                if type(v) == bool:
+                    strValues.add(str(v).lower())
+                elif v is not None:
+                    strValues.add(str(v))
+            values[field] = sorted(strValues)
+        return values
+
+    def iterate_word_meta(self, itemID, langID, docFreqs):
+        """
+        Iterate over actions that index the frequencies of a word
+        or a lemma in the documents with each value of each document-level
+        stat_options field. docFreqs is a dictionary {document ID ->
+        frequency in the document}.
+        """
+        tables = {}     # metafield -> {value -> [frequency, number of documents]}
+        for docID, freq in docFreqs.items():
+            if docID not in self.docMetaValues:
+                continue
+            for field, values in self.docMetaValues[docID].items():
+                if field not in tables:
+                    tables[field] = {}
+                for v in values:
+                    try:
+                        tables[field][v][0] += freq
+                        tables[field][v][1] += 1
+                    except KeyError:
+                        tables[field][v] = [freq, 1]
+        for iField in range(len(self.wordMetaFields)):
+            field = self.wordMetaFields[iField]
+            if field not in tables:
+                continue
+            values = sorted(tables[field])
+            for iValue in range(len(values)):
+                freq, nDocs = tables[field][values[iValue]]
+                yield {
+                    '_index': self.index_name('word_meta'),
+                    '_id': itemID + '_' + str(iField) + '_' + str(iValue),
+                    '_source': {
+                        'item_id': itemID,
+                        'field': field,
+                        'value': values[iValue],
+                        'lang': langID,
+                        'freq': freq,
+                        'n_docs': nDocs
+                    }
+                }
+
+    def collation(self, lang):
+        """
+        Return the Collation object that sorts strings according to
+        the alphabetical order specified in lang_props.lexicographic_order
+        for the language lang.
+        """
+        if lang not in self.collations:
+            lexicographicOrder = None
+            if lang in self.settings['lang_props'] and 'lexicographic_order' in self.settings['lang_props'][lang]:
+                lexicographicOrder = self.settings['lang_props'][lang]['lexicographic_order']
+            self.collations[lang] = Collation(lexicographicOrder)
+        return self.collations[lang]
 
     def sort_words(self, lang):
         """
@@ -327,61 +664,28 @@ class Indexator:
         lemmata in the sorted list.
         If there is a custom alphabetical order for the language,
         use it. Otherwise, use standard lexicographic sorting.
+        The results are reused for all languages with the same
+        order until the statistics change.
         """
+        collation = self.collation(lang)
+        orderKey = None
+        if collation.lexicographicOrder is not None:
+            orderKey = tuple(collation.lexicographicOrder)
+        if orderKey in self.sortedWords:
+            return self.sortedWords[orderKey]
         wfsSorted = {}
         iOrder = 0
-        sortingFunction = self.make_sorting_function(lang)
-        for wf in sorted(self.wfs, key=sortingFunction):
+        for wf in collation.sort(self.wordStats.word_forms()):
             wfsSorted[wf] = iOrder
             iOrder += 1
         lemmataSorted = {}
         iOrder = 0
-        for l in sorted(self.lemmata, key=sortingFunction):
+        for l in collation.sort(self.wordStats.lemma_forms()):
             lemmataSorted[l] = iOrder
             iOrder += 1
+        self.sortedWords[orderKey] = (wfsSorted, lemmataSorted)
         return wfsSorted, lemmataSorted
 
-    def get_freq_ranks(self, freqsSorted):
-        """
-        Calculate frequency ranks and rank/quantile labels for words
-        or lemmata.
-        """
-        freqToRank = {}
-        quantiles = {}
-        prevFreq = 0
-        prevRank = 0
-        for i in range(len(freqsSorted)):
-            v = freqsSorted[i]
-            if v != prevFreq:
-                if prevFreq != 0:
-                    freqToRank[prevFreq] = prevRank + (i - prevRank) // 2
-                prevRank = i
-                prevFreq = v
-        if prevFreq != 0:
-            freqToRank[prevFreq] = prevRank + (len(freqsSorted) - prevRank) // 2
-        for q in [0.03, 0.04, 0.05, 0.1, 0.15, 0.2, 0.25, 0.5]:
-            qIndex = math.ceil(q * len(freqsSorted))
-            if qIndex >= len(freqsSorted):
-                qIndex = len(freqsSorted) - 1
-            if qIndex >= 0:
-                quantiles[q] = freqsSorted[qIndex]
-            else:
-                quantiles[q] = 0
-        return freqToRank, quantiles
-
-    def quantile_label(self, freq, rank, quantiles):
-        """
-        Return a string label of the frequency rank (for frequent items)
-        or quantile. This label is showed to the user in word query results.
-        """
-        if freq > 1 and freq >= quantiles[0.5]:
-            if freq > quantiles[0.03]:
-                return '#' + str(rank + 1)
-            else:
-                return '&gt; ' + str(min(math.ceil(q * 100) for q in quantiles
-                                     if freq >= quantiles[q])) + '%'
-        return ''
-
     def get_lemma(self, word, lower_lemma=True):
         """
         Join all lemmata in the JSON representation of a word with
@@ -455,20 +759,27 @@ class Indexator:
                 curGramm.add(grTags)
         return ' | '.join(grdic for grdic in sorted(curGramm)), ' | '.join(tr for tr in sorted(translations))
 
-    def iterate_lemmata(self, langID, lemmataSorted):
+    def get_item_freq_ranks(self, langID, prefix):
+        """
+        Calculate frequency ranks and rank/quantile labels for all words
+        (prefix='w') or lemmata (prefix='l') of one language.
+        Return dictionaries {frequency -> rank} and {frequency -> label}.
+        """
+        freqsSorted = sorted_freqs(self.wordStats.item_freqs(langID, prefix))
+        freqToRank = freq_ranks(freqsSorted)
+        return freqToRank, rank_labels(freqToRank, freq_quantiles(freqsSorted))
+
+    def iterate_lemma_sources(self, langID, lemmataSorted, verbose=True):
         """
         Iterate over all lemmata for one language collected at the
-        word iteration stage.
+        word iteration stage. Yield tuples (lemma ID, lemma JSON,
+        {document ID -> frequency in the document}).
         """
-        lFreqsSorted = [self.wordFreqs[langID][itemID]
-                        for itemID in self.wordFreqs[langID]
-                        if itemID.startswith('l')]
-        lFreqsSorted.sort(reverse=True)
-        lemmaFreqToRank, quantiles = self.get_freq_ranks(lFreqsSorted)
+        lemmaFreqToRank, rankLabels = self.get_item_freq_ranks(langID, 'l')
         iLemma = 0
-        for l, lID in self.tmpLemmaIDs[langID].items():
+        for l, lID, freq, sFreq, docFreqs in self.wordStats.iterate_lemmata(langID):
             lID = 'l' + str(lID)
-            if iLemma % 250 == 0:
+            if iLemma % 250 == 0 and verbose:
                 print('indexing lemma', iLemma)
             lOrder = lemmataSorted[l]
             lemmaJson = {
@@ -476,42 +787,139 @@ class Indexator:
                 'wtype': 'lemma',
                 'lang': langID,
                 'l_order': lOrder,
-                'freq': self.wordFreqs[langID][lID],
-                'lemma_freq': self.wordFreqs[langID][lID],
-                'rank_true': lemmaFreqToRank[self.wordFreqs[langID][lID]],
-                'rank': self.quantile_label(self.wordFreqs[langID][lID],
-                                            lemmaFreqToRank[self.wordFreqs[langID][lID]],
-                                            quantiles),
-                'n_sents': self.wordSFreqs[langID][lID],
-                'n_docs': len(self.wordDIDs[langID][lID]),
+                'freq': freq,
+                'lemma_freq': freq,
+                'rank_true': lemmaFreqToRank[freq],
+                'rank': rankLabels[freq],
+                'n_sents': sFreq,
+                'n_docs': len(docFreqs),
                 'freq_join': 'word'
             }
+            if self.packedFreqs:
+                lemmaJson['dids'] = sorted(docFreqs)
+                lemmaJson['d_freqs'] = self.pack_doc_freqs(docFreqs)
+            iLemma += 1
+            yield lID, lemmaJson, docFreqs
+
+    def lemma_freq_action(self, lID, docID, lOrder, freq):
+        """
+        Return an action for indexing the frequency of a lemma
+        in one document as a word_freq child of the lemma.
+        """
+        lfreqJson = {
+            'wtype': 'word_freq',
+            'l_id': lID,
+            'd_id': docID,
+            'l_order': lOrder,
+            'freq': freq,
+            'freq_join': {
+                'name': 'word_freq',
+                'parent': lID
+            }
+        }
+        curAction = {'_index': self.index_name('words'),
+                     '_id': 'lfreq' + str(self.lemmaFreqID),
+                     '_source': lfreqJson,
+                     '_routing': lID}
+        self.lemmaFreqID += 1
+        return curAction
+
+    def iterate_lemmata(self, langID, lemmataSorted):
+        """
+        Iterate over all lemmata for one language collected at the
+        word iteration stage.
+        """
+        for lID, lemmaJson, docFreqs in self.iterate_lemma_sources(langID, lemmataSorted):
             curAction = {
-                '_index': self.name + '.words',
+                '_index': self.index_name('words'),
                 '_id': lID,
                 '_source': lemmaJson
             }
-            iLemma += 1
             yield curAction
+            if self.wordMetaTables:
+                for wmAction in self.iterate_word_meta(lID, langID, docFreqs):
+                    yield wmAction
 
-            for docID in self.wordDIDs[langID][lID]:
-                lfreqJson = {
-                    'wtype': 'word_freq',
-                    'l_id': lID,
-                    'd_id': docID,
-                    'l_order': lOrder,
-                    'freq': self.wordDocFreqs[langID][(lID, docID)],
-                    'freq_join': {
-                        'name': 'word_freq',
-                        'parent': lID
-                    }
-                }
-                curAction = {'_index': self.name + '.words',
-                             '_id': 'lfreq' + str(self.lemmaFreqID),
-                             '_source': lfreqJson,
-                             '_routing': lID}
-                self.lemmaFreqID += 1
-                yield curAction
+            if self.packedFreqs:
+                continue
+            for docID in sorted(docFreqs):
+                yield self.lemma_freq_action(lID, docID, lemmaJson['l_order'], docFreqs[docID])
+
+    def iterate_word_sources(self, langID, wfsSorted, lemmataSorted, verbose=True):
+        """
+        Iterate through all words of one language collected at the
+        previous stage. Yield tuples (word ID, word JSON,
+        {document ID -> frequency in the document}).
+        """
+        iWord = 0
+        wordFreqToRank, rankLabels = self.get_item_freq_ranks(langID, 'w')
+        lemmaFreqToRank, lemmaRankLabels = self.get_item_freq_ranks(langID, 'l')
+
+        for w, wID, lID, wordFreq, sFreq, lemmaFreq, docFreqs in self.wordStats.iterate_words(langID):
+            wID = 'w' + str(wID)
+            if iWord % 500 == 0 and verbose:
+                print('indexing word', iWord)
+            wJson = json.loads(w)
+            wfOrder = len(wfsSorted) + 1
+            if 'wf' in wJson:
+                wfOrder = wfsSorted[wJson['wf']]
+            lOrder = len(lemmataSorted) + 1
+            if 'ana' in wJson:
+                lOrder = lemmataSorted[self.get_lemma(wJson, lower_lemma=self.lowerWf)]
+            wJson['wf_order'] = wfOrder
+            wJson['l_order'] = lOrder
+            wJson['l_id'] = lID
+            wJson['freq'] = wordFreq
+            wJson['lemma_freq'] = lemmaFreq
+            wJson['dids'] = sorted(docFreqs)
+            wJson['n_sents'] = sFreq
+            wJson['n_docs'] = len(wJson['dids'])
+            wJson['rank_true'] = wordFreqToRank[wJson['freq']]  # for the calculations
+            wJson['lemma_rank_true'] = lemmaFreqToRank[lemmaFreq]  # for the calculations
+            wJson['rank'] = rankLabels[wJson['freq']]  # for the user
+            wJson['freq_join'] = 'word'
+            wJson['wtype'] = 'word'
+            if self.packedFreqs:
+                # Subcorpus queries group words by w_id
+                wJson['w_id'] = wID
+                wJson['d_freqs'] = self.pack_doc_freqs(docFreqs)
+            yield wID, wJson, docFreqs
+            iWord += 1
+            self.wID += 1
+
+    @staticmethod
+    def pack_doc_freqs(docFreqs):
+        """
+        Pack the frequencies of a word or lemma in individual documents
+        into a sorted list of 64-bit integers, each containing the
+        document ID in the upper 32 bits and the frequency in the lower ones.
+        """
+        return [(docID << 32) | docFreqs[docID] for docID in sorted(docFreqs)]
+
+    def word_freq_action(self, wID, docID, wJson, freq):
+        """
+        Return an action for indexing the frequency of a word
+        in one document as a word_freq child of the word.
+        """
+        wfreqJson = {
+            'wtype': 'word_freq',
+            'w_id': wID,
+            'l_id': wJson['l_id'],
+            'd_id': docID,
+            'wf_order': wJson['wf_order'],
+            'l_order': wJson['l_order'],
+            'freq': freq,
+            'freq_join': {
+                'name': 'word_freq',
+                'parent': wID
+            }
+        }
+        curAction = {'_index': self.index_name('words'),
+                     '_id': 'wfreq' + str(self.wordFreqID),
+                     '_source': wfreqJson,
+                     '_routing': wID}
+        self.wordFreqID += 1
+        return curAction
 
     def iterate_words(self):
         """
@@ -523,84 +931,22 @@ class Indexator:
 
         for langID in range(len(self.languages)):
             wfsSorted, lemmataSorted = self.sort_words(self.languages[langID])
-            iWord = 0
             print('Processing words in ' + self.languages[langID] + '...')
-
-            wFreqsSorted = [self.wordFreqs[langID][itemID]
-                            for itemID in self.wordFreqs[langID]
-                            if itemID.startswith('w')]
-            wFreqsSorted.sort(reverse=True)
-            wordFreqToRank, quantiles = self.get_freq_ranks(wFreqsSorted)
-
-            lFreqsSorted = [self.wordFreqs[langID][itemID]
-                            for itemID in self.wordFreqs[langID]
-                            if itemID.startswith('l')]
-            lFreqsSorted.sort(reverse=True)
-            lemmaFreqToRank, lemmaQuantiles = self.get_freq_ranks(lFreqsSorted)
-
-            # for wID in self.wordFreqs[langID]:
-            for w, wID in self.tmpWordIDs[langID].items():
-                wID = 'w' + str(wID)
-                if iWord % 500 == 0:
-                    print('indexing word', iWord)
-                try:
-                    lID = self.word2lemma[langID][wID]
-                except KeyError:
-                    lID = 'l0'
-                wJson = json.loads(w)
-                wfOrder = len(wfsSorted) + 1
-                if 'wf' in wJson:
-                    wfOrder = wfsSorted[wJson['wf']]
-                lOrder = len(lemmataSorted) + 1
-                if 'ana' in wJson:
-                    lOrder = lemmataSorted[self.get_lemma(wJson, lower_lemma=self.lowerWf)]
-                wJson['wf_order'] = wfOrder
-                wJson['l_order'] = lOrder
-                wJson['l_id'] = lID
-                wordFreq = self.wordFreqs[langID][wID]
-                lemmaFreq = self.wordFreqs[langID][lID]
-                wJson['freq'] = wordFreq
-                wJson['lemma_freq'] = lemmaFreq
-                # wJson['sids'] = [sid for sid in sorted(self.wordSIDs[langID][wID])]
-                wJson['dids'] = [did for did in sorted(self.wordDIDs[langID][wID])]
-                wJson['n_sents'] = self.wordSFreqs[langID][wID]
-                wJson['n_docs'] = len(wJson['dids'])
-                wJson['rank_true'] = wordFreqToRank[wJson['freq']]  # for the calculations
-                wJson['lemma_rank_true'] = lemmaFreqToRank[self.wordFreqs[langID][lID]]  # for the calculations
-                wJson['rank'] = self.quantile_label(wJson['freq'],
-                                                    wJson['rank_true'],
-                                                    quantiles)  # for the user
-                wJson['freq_join'] = 'word'
-                wJson['wtype'] = 'word'
+            for wID, wJson, docFreqs in self.iterate_word_sources(langID, wfsSorted, lemmataSorted):
                 curAction = {
-                    '_index': self.name + '.words',
+                    '_index': self.index_name('words'),
                     '_id': wID,
                     '_source': wJson
                 }
                 yield curAction
+                if self.wordMetaTables:
+                    for wmAction in self.iterate_word_meta(wID, langID, docFreqs):
+                        yield wmAction
 
+                if self.packedFreqs:
+                    continue
                 for docID in wJson['dids']:
-                    wfreqJson = {
-                        'wtype': 'word_freq',
-                        'w_id': wID,
-                        'l_id': lID,
-                        'd_id': docID,
-                        'wf_order': wfOrder,
-                        'l_order': lOrder,
-                        'freq': self.wordDocFreqs[langID][(wID, docID)],
-                        'freq_join': {
-                            'name': 'word_freq',
-                            'parent': wID
-                        }
-                    }
-                    curAction = {'_index': self.name + '.words',
-                                 '_id': 'wfreq' + str(self.wordFreqID),
-                                 '_source': wfreqJson,
-                                 '_routing': wID}
-                    self.wordFreqID += 1
-                    yield curAction
-                iWord += 1
-                self.wID += 1
+                    yield self.word_freq_action(wID, docID, wJson, docFreqs[docID])
             for lAction in self.iterate_lemmata(langID, lemmataSorted):
                 yield lAction
         emptyLemmaJson = {
@@ -610,111 +956,164 @@ class Indexator:
             'rank_true': -1
         }
         curAction = {
-            '_index': self.name + '.words',
+            '_index': self.index_name('words'),
             '_id': 'l0',    # l prefix stands for "lemma"
             '_source': emptyLemmaJson
         }
         yield curAction
-        self.wfs = None
-        self.lemmata = None
+
+    def dictionary_lexemes(self, words, lang):
+        """
+        Return a dictionary {(lemma, grammatical tags, translations) -> frequency}
+        for a list of tuples (word as JSON, frequency) of one language.
+        """
+        lexFreqs = {}
+        for w, wordFreq in words:
+            wJson = json.loads(w)
+            if 'ana' not in wJson or len(wJson['ana']) <= 0:
+                continue
+            lemma = self.get_lemma(wJson, lower_lemma=False)
+            grdic, translations = self.get_grdic(wJson, lang)
+            lexTuple = (lemma, grdic, translations)
+            if lexTuple not in lexFreqs:
+                lexFreqs[lexTuple] = wordFreq
+            else:
+                lexFreqs[lexTuple] += wordFreq
+        return lexFreqs
+
+    def iterate_dictionary_words(self, langID):
+        """
+        Iterate over the words of one language in chunks: lists of
+        at most DICT_CHUNK_SIZE tuples (word as JSON, frequency).
+        """
+        chunk = []
+        for w, wordFreq in self.wordStats.iterate_word_freqs(langID):
+            chunk.append((w, wordFreq))
+            if len(chunk) >= self.DICT_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def dictionary_writer(self, langID):
+        """
+        Return a DictionaryWriter for the dictionary of one language.
+        """
+        lang = self.languages[langID]
+        splitByLetter = 'split_dictionary' in self.settings and self.settings['split_dictionary']
+        return DictionaryWriter(self.name, lang, self.collation(lang),
+                                splitByLetter=splitByLetter, dictDir=self.dictionaryDir)
 
     def generate_dictionary(self):
         """
         For each language, print out an HTML dictionary containing all lexemes of the corpus.
+        If there are several workers, the lexemes are collected from chunks of
+        the word list and the dictionaries of different languages are written
+        in parallel. The lexemes of each chunk are passed to the DictionaryWriter
+        of its language, which keeps at most a limited number of them in memory.
         """
-        for langID in range(len(self.languages)):
-            iWord = 0
-            print('Generating dictionary for ' + self.languages[langID] + '...')
-            lexFreqs = {}       # lemma ID -> its frequency
-            wFreqsSorted = [v for v in sorted(self.wordFreqs[langID].values(), reverse=True)]
-            freqToRank, quantiles = self.get_freq_ranks(wFreqsSorted)
-            # for wID in self.wordFreqs[langID]:
-            for w, wID in self.tmpWordIDs[langID].items():
-                wID = 'w' + str(wID)
-                if iWord % 1000 == 0:
-                    print('processing word', iWord, 'for the dictionary')
-                iWord += 1
-                wJson = json.loads(w)
-                if 'ana' not in wJson or len(wJson['ana']) <= 0:
-                    continue
-                lemma = self.get_lemma(wJson, lower_lemma=False)
-                grdic, translations = self.get_grdic(wJson, self.languages[langID])
-                wordFreq = self.wordFreqs[langID][wID]
-                lexTuple = (lemma, grdic, translations)
-                if lexTuple not in lexFreqs:
-                    lexFreqs[lexTuple] = wordFreq
-                else:
-                    lexFreqs[lexTuple] += wordFreq
-            if len(lexFreqs) <= 0:
-                continue
+        writers = [self.dictionary_writer(langID) for langID in range(len(self.languages))]
+        if self.workers <= 1:
+            for langID in range(len(self.languages)):
+                print('Generating dictionary for ' + self.languages[langID] + '...')
+                for chunk in self.iterate_dictionary_words(langID):
+                    writers[langID].add_lexemes(self.dictionary_lexemes(chunk, self.languages[langID]))
+                if writers[langID].nLexemes > 0:
+                    writers[langID].write()
+                writers[langID] = None
+            return
+        print('Generating dictionaries in', self.workers, 'processes.')
+        with multiprocessing.Pool(self.workers, initializer=init_worker, initargs=('',)) as pool:
+            tasks = []
+            for langID in range(len(self.languages)):
+                for chunk in self.iterate_dictionary_words(langID):
+                    # Do not let the chunks pile up in memory
+                    while len(tasks) >= 2 * self.workers:
+                        chunkLangID, chunkLexFreqs = tasks.pop(0).get()
+                        writers[chunkLangID].add_lexemes(chunkLexFreqs)
+                    tasks.append(pool.apply_async(dictionary_lexemes_worker, ((langID, chunk),)))
+            for task in tasks:
+                chunkLangID, chunkLexFreqs = task.get()
+                writers[chunkLangID].add_lexemes(chunkLexFreqs)
+            tasks = [pool.apply_async(write_dictionary_worker, (writers[langID],))
+                     for langID in range(len(self.languages))
+                     if writers[langID].nLexemes > 0]
+            for task in tasks:
+                task.get()
 
-            if not os.path.exists('../search/web_app/templates/dictionaries'):
-                os.makedirs('../search/web_app/templates/dictionaries')
-            fOut = open(os.path.join('../search/web_app/templates/dictionaries', 'dictionary_' + self.settings['corpus_name']
-                                     + '_' + self.languages[langID] + '.html'), 'w', encoding='utf-8')
-            fOut.write('<h1 class="dictionary_header"> {{ _(\'Dictionary_header\') }} '
-                       '({{ _(\'langname_' + self.languages[langID] + '\') }})</h1>\n')
-            prevLetter = ''
-            sortingFunction = self.make_sorting_function(self.settings['languages'][langID])
-            for lemma, grdic, trans in sorted(lexFreqs, key=lambda x: (sortingFunction(x[0].lower()), -lexFreqs[x])):
-                if len(lemma) <= 0:
-                    continue
-                mChar = self.character_regex(self.languages[langID]).search(lemma.lower())
-                if mChar is None:
-                    curLetter = '*'
-                else:
-                    curLetter = mChar.group(0)
-                if curLetter != prevLetter:
-                    if prevLetter != '':
-                        fOut.write('</tbody>\n</table>\n')
-                    fOut.write('<h2 class="dictionary_letter">' + curLetter.upper() + '</h2>\n')
-                    fOut.write('<table class="dictionary_table">\n<thead>\n'
-                               '<th>{{ _(\'word_th_lemma\') }}</th>'
-                               '<th>{{ _(\'word_th_gr\') }}</th>'
-                               '<th>{{ _(\'word_th_trans_en\') }}</th>'
-                               '<th>{{ _(\'word_th_frequency\') }}</th>'
-                               '</thead>\n<tbody>\n')
-                    prevLetter = curLetter
-                fOut.write('<tr>\n<td class="dictionary_lemma">' + lemma + '</td><td>' + grdic + '</td>'
-                           '<td>' + trans + '</td><td>'
-                           + str(lexFreqs[(lemma, grdic, trans)]) + '</td></tr>\n')
-            if prevLetter != '':
-                fOut.write('</tbody>\n</table>\n')
-            fOut.close()
+    def dictionary_from_state(self):
+        """
+        Generate the dictionaries from the word statistics saved
+        after the previous run, without indexing anything.
+        """
+        t1 = time.time()
+        if self.load_index_state() is None:
+            return
+        self.generate_dictionary()
+        self.wordStats.close()
+        print('Dictionaries generated in', time.time() - t1, 'seconds.')
 
     def index_words(self):
         """
         Index all words that have been collected at the previous stage
         in self.words (while the sentences were being indexed).
         """
-        bulk(self.es, self.iterate_words(), chunk_size=300, request_timeout=60)
+        self.bulkLoader.add(self.iterate_words())
+        self.bulkLoader.flush()
+        self.bulkLoader.report()
         if 'generate_dictionary' in self.settings and self.settings['generate_dictionary']:
             self.generate_dictionary()
 
-    def add_parallel_sids(self, sentences, paraIDs):
+    def collect_para_sids(self, doc):
+        """
+        In the parallel corpus, make a pre-pass over the document
+        and return a list with a dictionary {para_id -> list of IDs
+        of sentences aligned with it} for each language. The IDs
+        are the same as the sentences get in iterate_sentences().
+        """
+        paraIDs = [{} for i in range(len(self.languages))]
+        sID = self.sID
+        for langID, sentParaIDs in doc.iterate_alignment():
+            for paraID in sentParaIDs:
+                paraID = str(self.dID) + '_' + str(paraID)
+                try:
+                    paraIDs[langID][paraID].append(self.randomize_id(sID))
+                except KeyError:
+                    paraIDs[langID][paraID] = [self.randomize_id(sID)]
+            sID += 1
+        return paraIDs
+
+    def add_parallel_sids(self, s, langID, paraIDs):
         """
         In the parallel corpus, add the IDs of aligned sentences in other languages
-        to each sentence that has a para_id.
+        to each para_alignment of the sentence and the list of its para_ids.
+        """
+        s['para_ids'] = []
+        for pa in s['para_alignment']:
+            paraID = str(self.dID) + '_' + str(pa['para_id'])
+            pa['para_id'] = paraID
+            s['para_ids'].append(paraID)
+            pa['sent_ids'] = []
+            for i in range(len(self.languages)):
+                if i == langID:
+                    continue
+                if paraID in paraIDs[i]:
+                    pa['sent_ids'] += paraIDs[i][paraID]
+
+    def iterate_sentences(self, doc):
+        """
+        Iterate through the sentences of a document (JSONDoc) and
+        yield indexing actions for them. In the parallel corpus,
+        the alignment is collected in a pre-pass, so that the
+        sentences do not have to be kept until the end
+        of the document.
         """
-        for s in sentences:
-            if 'para_alignment' not in s['_source'] or 'lang' not in s['_source']:
-                continue
-            langID = s['_source']['lang']
-            for pa in s['_source']['para_alignment']:
-                paraID = pa['para_id']
-                pa['sent_ids'] = []
-                for i in range(len(self.languages)):
-                    if i == langID:
-                        continue
-                    if paraID in paraIDs[i]:
-                        pa['sent_ids'] += paraIDs[i][paraID]
-
-    def iterate_sentences(self, fname):
         self.numSents = 0
         prevLast = False
-        sentences = []
-        paraIDs = [{} for i in range(len(self.languages))]
-        for s, bLast in self.iterSent.get_sentences(fname):
+        paraIDs = None
+        if len(self.languages) > 1:
+            paraIDs = self.collect_para_sids(doc)
+        for s, bLast in doc.iterate_sentences():
             if 'lang' in s:
                 langID = s['lang']
             else:
@@ -723,6 +1122,10 @@ class Indexator:
             s['n_words'] = 0
             if 'words' in s:
                 sentAnaMeta = self.process_sentence_words(s['words'], langID)
+                if self.ngramIndex and not self.localIDs:
+                    # In worker processes, the pairs are counted after
+                    # the IDs have been replaced with global ones
+                    self.count_ngrams(s['words'], langID)
                 s['n_words'] = sum(1 for w in s['words'] if 'wtype' in w and w['wtype'] == 'word')
                 if 'meta' not in s:
                     s['meta'] = {}
@@ -739,35 +1142,20 @@ class Indexator:
             if 'meta' in s:
                 for metaField in [mf for mf in s['meta'].keys() if not (mf.startswith('year') or mf.endswith('_kw'))]:
                     s['meta'][metaField + '_kw'] = s['meta'][metaField]
-            # self.es.index(index=self.name + '.sentences',
+            if paraIDs is not None and 'para_alignment' in s:
+                self.add_parallel_sids(s, langID, paraIDs)
+            # self.es.index(index=self.index_name('sentences'),
             #               id=self.sID,
             #               body=s)
-            curAction = {'_index': self.name + '.sentences',
+            curAction = {'_index': self.index_name('sentences'),
                          '_id': self.randomize_id(self.sID),
                          '_source': s}
-            if len(self.languages) <= 1:
-                yield curAction
-            else:
-                sentences.append(curAction)
-                if 'para_alignment' in s:
-                    s['para_ids'] = []
-                    for pa in s['para_alignment']:
-                        paraID = str(self.dID) + '_' + str(pa['para_id'])
-                        pa['para_id'] = paraID
-                        s['para_ids'].append(paraID)
-                        try:
-                            paraIDs[langID][paraID].append(self.randomize_id(self.sID))
-                        except KeyError:
-                            paraIDs[langID][paraID] = [self.randomize_id(self.sID)]
-            if self.sID % 500 == 0:
+            if self.sID % 500 == 0 and not self.localIDs:
                 print('Indexing sentence', self.sID, ',', self.totalNumWords, 'words so far.')
             self.numSents += 1
             self.numSentsLang[langID] += 1
             self.sID += 1
-        if len(self.languages) > 1:
-            self.add_parallel_sids(sentences, paraIDs)
-            for s in sentences:
-                yield s
+            yield curAction
 
     @staticmethod
     def add_meta_keywords(meta):
@@ -778,13 +1166,132 @@ class Indexator:
         for field in [k for k in meta.keys() if not k.startswith('year')]:
             meta[field + '_kw'] = meta[field]
 
-    def index_doc(self, fname):
+    def prepare_doc(self, fname, dID):
+        """
+        Read one document and prepare its sentences for indexing.
+        This is done in a worker process, so the statistics only
+        cover this document. Sentence IDs are counted from 0 and
+        word/lemma IDs are local to the document; they are replaced
+        with global IDs in merge_doc_stats().
+        """
+        self.localIDs = True
+        self.reset_word_stats()
+        self.dID = dID
+        self.sID = 0
+        self.totalNumWords = 0
+        self.numWords = 0
+        self.numSents = 0
+        self.numWordsLang = [0] * len(self.languages)
+        self.numSentsLang = [0] * len(self.languages)
+        doc = self.iterSent.read_doc(fname)
+        fulltextSentences = None
+        if self.fulltextEnabled:
+            # The full-text HTML is generated from the sentences as they
+            # were before indexing, but only after the document has been
+            # given its nonpersistent full-text ID in the main process
+            fulltextSentences = doc.serialize_sentences()
+        sentences = [action['_source'] for action in self.iterate_sentences(doc)]
+        return {
+            'fname': fname,
+            'meta': doc.meta,
+            'sentences': sentences,
+            'fulltext_sentences': fulltextSentences,
+            'read_stats': doc.readStats,
+            'num_words': self.numWords,
+            'num_sents': self.numSents,
+            'num_words_lang': self.numWordsLang,
+            'num_sents_lang': self.numSentsLang,
+            'word_ids': self.wordStats.wordIDs,
+            'lemma_ids': self.wordStats.lemmaIDs,
+            'word_freqs': self.docWordFreqs,
+            'lemma_freqs': self.docLemmaFreqs
+        }
+
+    def merge_doc_stats(self, docData):
         """
-        Store the metadata of the source file.
+        Add the statistics for one document prepared by prepare_doc()
+        to the global statistics. Documents have to be merged in the
+        same order in which they would be indexed in a single process:
+        new words and lemmata get their global IDs in the order of
+        their first occurrence, exactly as in process_sentence_words().
+        Return the sentence actions of the document with global
+        sentence, word and lemma IDs.
+        """
+        lemmaIDs = {0: 0}     # local lemma ID -> global lemma ID
+        localLemmata = sorted((lIDLocal, langID, l)
+                              for langID in range(len(self.languages))
+                              for l, lIDLocal in docData['lemma_ids'][langID].items())
+        for lIDLocal, langID, l in localLemmata:
+            lemmaIDs[lIDLocal] = self.wordStats.lemma_id(langID, l)
+        wordIDs = {}          # local word ID -> global word ID
+        localWords = sorted((wIDLocal, langID, w)
+                            for langID in range(len(self.languages))
+                            for w, wIDLocal in docData['word_ids'][langID].items())
+        for wIDLocal, langID, w in localWords:
+            wJson = json.loads(w)
+            lemma = None
+            lID = 0
+            if 'ana' in wJson:
+                lemma = self.get_lemma(wJson, lower_lemma=self.lowerWf)
+                if len(lemma) > 0:
+                    lID = self.wordStats.lemma_id(langID, lemma)
+            wordIDs[wIDLocal] = self.wordStats.word_id(langID, w, wJson.get('wf'), lemma, lID)
+        itemIDs = {}          # local word/lemma string ID -> global word/lemma string ID
+        for wIDLocal, wID in wordIDs.items():
+            itemIDs['w' + str(wIDLocal)] = 'w' + str(wID)
+        for lIDLocal, lID in lemmaIDs.items():
+            itemIDs['l' + str(lIDLocal)] = 'l' + str(lID)
+
+        for langID in range(len(self.languages)):
+            self.docWordFreqs[langID] = {wordIDs[wIDLocal]: freqs
+                                         for wIDLocal, freqs in docData['word_freqs'][langID].items()}
+            self.docLemmaFreqs[langID] = {lemmaIDs[lIDLocal]: freqs
+                                          for lIDLocal, freqs in docData['lemma_freqs'][langID].items()}
+        self.numWords = docData['num_words']
+        self.numSents = docData['num_sents']
+        self.numWordsLang = docData['num_words_lang']
+        self.numSentsLang = docData['num_sents_lang']
+        self.totalNumWords += docData['num_words']
+
+        sIDStart = self.sID
+        actions = []
+        for s in docData['sentences']:
+            if 'words' in s:
+                for w in s['words']:
+                    if 'wtype' in w and w['wtype'] == 'word':
+                        w['w_id'] = itemIDs[w['w_id']]
+                        w['l_id'] = itemIDs[w['l_id']]
+                if self.ngramIndex:
+                    self.count_ngrams(s['words'], s['lang'])
+            for idField in ['prev_id', 'next_id']:
+                if idField in s:
+                    s[idField] = self.randomize_id(sIDStart + s[idField])
+            if len(self.languages) > 1 and 'para_alignment' in s:
+                for pa in s['para_alignment']:
+                    if 'sent_ids' in pa:
+                        pa['sent_ids'] = [self.randomize_id(sIDStart + sID) for sID in pa['sent_ids']]
+            actions.append({'_index': self.index_name('sentences'),
+                            '_id': self.randomize_id(self.sID),
+                            '_source': s})
+            if self.sID % 500 == 0:
+                print('Indexing sentence', self.sID, ',', self.totalNumWords, 'words so far.')
+            self.sID += 1
+        return actions
+
+    def index_doc(self, fname, meta=None):
+        """
+        Store the metadata of the source file. If the metadata
+        has already been read (e.g. in a worker process), it is
+        passed in meta. The metadata is sent by the bulk loader
+        together with the sentences; if it is rejected,
+        doc_error_fallback() is used.
         """
         if self.dID % 100 == 0:
             print('Indexing document', self.dID)
-        meta = self.iterSent.get_metadata(fname)
+        if meta is None:
+            meta = self.iterSent.get_metadata(fname)
+        if self.wordMetaTables:
+            self.docMetaValues[self.dID] = self.doc_meta_values(meta)
         self.add_meta_keywords(meta)
         meta['n_words'] = self.numWords
         meta['n_sents'] = self.numSents
@@ -796,31 +1303,87 @@ class Indexator:
         self.numSents = 0
         self.numWordsLang = [0] * len(self.languages)
         self.numSentsLang = [0] * len(self.languages)
-        try:
-            self.es.index(index=self.name + '.docs',
-                          id=self.dID,
-                          body=meta)
-        except RequestError as err:
-            print('Metadata error: {0}'.format(err))
-            shortMeta = {}
-            if 'filename' in meta:
-                shortMeta['filename'] = meta['filename']
-            if 'title' in meta:
-                shortMeta['title'] = meta['title']
-                shortMeta['title_kw'] = meta['title']
-                self.es.index(index=self.name + '.docs',
-                              id=self.dID,
-                              body=shortMeta)
-        if ('fulltext_view_enabled' in self.settings
-                and self.settings['fulltext_view_enabled']
-                and 'fulltext_id' in meta):
-            fnameOut = meta['fulltext_id'] + '.json'
-            self.j2h.process_file(fname,
-                                  os.path.join('../search/corpus_html',
-                                               self.name,
-                                               fnameOut))
+        self.bulkLoader.add([{'_index': self.index_name('docs'),
+                              '_id': self.dID,
+                              '_source': meta}])
+        if self.ngramIndex:
+            self.bulkLoader.add(self.iterate_ngrams())
+        self.wordStats.add_doc(self.dID, self.docWordFreqs, self.docLemmaFreqs)
+        self.reset_doc_stats()
+        fileStat = os.stat(fname)
+        self.indexedFiles[os.path.relpath(fname, self.corpus_dir)] = {
+            'd_id': self.dID,
+            'size': fileStat.st_size,
+            'mtime': fileStat.st_mtime
+        }
         self.dID += 1
 
+    def index_fulltext(self, fname, meta, sentencesData):
+        """
+        Generate the full-text HTML of a document if full-text view is
+        enabled. sentencesData is a serialized copy of its sentences
+        made before indexing (see JSONDoc.serialize_sentences()), or
+        None if the file has to be read again. If there are full-text
+        worker processes, the HTML is generated there.
+        """
+        if not self.fulltextEnabled or 'fulltext_id' not in meta:
+            return
+        fnameOut = os.path.join('../search/corpus_html', self.name,
+                                meta['fulltext_id'] + '.json')
+        task = (fname, dict(meta), sentencesData, fnameOut)
+        if self.fulltextPool is None:
+            make_fulltext(self.j2h, task)
+            return
+        # Do not let unprocessed documents pile up in memory
+        self.wait_fulltext_tasks(2 * self.fulltextWorkers - 1)
+        self.fulltextTasks.append(self.fulltextPool.apply_async(fulltext_worker, (task,)))
+
+    def wait_fulltext_tasks(self, maxPending=0):
+        """
+        Wait until at most maxPending full-text HTML files
+        are still being generated.
+        """
+        while len(self.fulltextTasks) > maxPending:
+            self.fulltextTasks.pop(0).get()
+
+    def start_fulltext_workers(self):
+        """
+        Start the processes that generate full-text HTML, if
+        full-text view is enabled and the settings require them.
+        """
+        if self.fulltextEnabled and self.fulltextWorkers > 0:
+            print('Generating full-text HTML in', self.fulltextWorkers, 'processes.')
+            self.fulltextPool = multiprocessing.Pool(self.fulltextWorkers,
+                                                     initializer=init_fulltext_worker,
+                                                     initargs=(self.settings,))
+
+    def stop_fulltext_workers(self):
+        """
+        Wait until all full-text HTML files have been generated and
+        stop the processes that generate them.
+        """
+        if self.fulltextPool is None:
+            return
+        with self.fulltextPool:
+            self.wait_fulltext_tasks()
+        self.fulltextPool = None
+
+    def doc_error_fallback(self, action, result):
+        """
+        Handle a document whose metadata could not be indexed, e.g.
+        because of a value that does not fit the mapping. Return an
+        action that indexes only its filename and title instead, an
+        empty list if there is no title, or None if the short
+        metadata could not be indexed either.
+        Called by the bulk loader for each failed document.
+        The IDs of the dropped documents are stored, so that
+        validate_indices() does not expect them in the index.
+        """
+        fallbackActions = doc_error_fallback(action, result)
+        if fallbackActions is not None and len(fallbackActions) <= 0:
+            self.droppedDocs.add(action['_id'])
+        return fallbackActions
+
     def analyze_dir(self):
         """
         Collect all filenames for subsequent indexing and calculate
@@ -853,16 +1416,481 @@ class Indexator:
         if len(self.filenames) <= 0:
             print('There are no files in this corpus.')
             return
+        fnames = []
         for fname, fsize in sorted(self.filenames, key=lambda p: -p[1]):
             # print(fname, fsize)
             if 'sample_size' in self.settings and 0 < self.settings['sample_size'] < 1:
                 # Only take a random sample of the source files (for test purposes)
                 if random.random() > self.settings['sample_size']:
                     continue
-            bulk(self.es, self.iterate_sentences(fname), chunk_size=200, request_timeout=60)
-            self.index_doc(fname)
+            fnames.append(fname)
+        self.index_files(fnames)
         self.index_words()
 
+    def index_files(self, fnames):
+        """
+        Index sentences and metadata of the files in the given order.
+        """
+        self.sortedWords = {}
+        self.start_fulltext_workers()
+        try:
+            if self.workers > 1:
+                self.index_files_parallel(fnames)
+            else:
+                for fname in fnames:
+                    doc = self.iterSent.read_doc(fname)
+                    if self.fulltextEnabled:
+                        # Indexing changes the sentences, so the HTML is made from a copy
+                        self.index_fulltext(fname, doc.meta, doc.serialize_sentences())
+                    self.bulkLoader.add(self.iterate_sentences(doc))
+                    self.index_doc(fname, meta=doc.meta)
+                    self.iterSent.log_read_stats(fname, doc.readStats)
+                    self.checkpoint_if_needed()
+        finally:
+            self.stop_fulltext_workers()
+        self.bulkLoader.flush()
+        self.iterSent.report()
+
+    def index_files_parallel(self, fnames):
+        """
+        Index files in the given order, with parsing and preparation
+        of the documents distributed among self.workers processes.
+        The results are merged and sent to the database in the
+        original order, so that all IDs and frequencies are the same
+        as when indexing in a single process.
+        """
+        print('Preparing documents in', self.workers, 'processes.')
+        tasks = [(fnames[i], self.dID + i) for i in range(len(fnames))]
+        with multiprocessing.Pool(self.workers, initializer=init_worker,
+                                  initargs=(self.indexVersion,)) as pool:
+            for docData in pool.imap(prepare_doc_worker, tasks):
+                self.iterSent.insert_nonpersistent_fulltext_id(docData['meta'])
+                self.index_fulltext(docData['fname'], docData['meta'], docData['fulltext_sentences'])
+                self.bulkLoader.add(self.merge_doc_stats(docData))
+                self.index_doc(docData['fname'], meta=docData['meta'])
+                self.iterSent.log_read_stats(docData['fname'], docData['read_stats'])
+                self.checkpoint_if_needed()
+
+    def word_stats_filename(self, checkpoint=False):
+        """
+        Return the name of the file where the word statistics
+        kept in memory are saved between runs (or at a checkpoint).
+        """
+        if checkpoint:
+            return os.path.join(self.INDEX_STATE_DIR, self.name + '.checkpoint.word_stats.json.gz')
+        return os.path.join(self.INDEX_STATE_DIR, self.name + '.word_stats.json.gz')
+
+    def index_state_filename(self, checkpoint=False):
+        """
+        Return the path to the file where the indexator state
+        is stored between runs (or at a checkpoint).
+        """
+        if checkpoint:
+            return os.path.join(self.INDEX_STATE_DIR, self.name + '.checkpoint.json.gz')
+        return os.path.join(self.INDEX_STATE_DIR, self.name + '.json.gz')
+
+    def save_index_state(self, checkpoint=False):
+        """
+        Store word and lemma IDs, all word statistics and the list
+        of indexed files, so that the corpus can be updated
+        incrementally later, or, if checkpoint is True, so that
+        an interrupted indexation can be resumed.
+        """
+        if not checkpoint:
+            print('Saving indexator state...')
+        state = {
+            'languages': self.languages,
+            'sID': self.sID,
+            'dID': self.dID,
+            'wordFreqID': self.wordFreqID,
+            'lemmaFreqID': self.lemmaFreqID,
+            'totalNumWords': self.totalNumWords,
+            'id_seed': self.idSeed,
+            'files': self.indexedFiles,
+            'word_stats_backend': self.wordStatsSettings['backend']
+        }
+        if self.wordMetaTables:
+            state['doc_meta_values'] = self.docMetaValues
+        if checkpoint:
+            state['nonpersistent_id'] = self.iterSent.nonpersistentID
+            state['index_settings'] = self.lifecycle.savedSettings
+            state['index_version'] = self.indexVersion
+            state['dropped_docs'] = sorted(self.droppedDocs)
+        if not os.path.exists(self.INDEX_STATE_DIR):
+            os.makedirs(self.INDEX_STATE_DIR)
+        self.wordStats.save(self.word_stats_filename(checkpoint))
+        fnameTmp = self.index_state_filename(checkpoint) + '.tmp'
+        with gzip.open(fnameTmp, 'wt', encoding='utf-8') as fOut:
+            json.dump(state, fOut, ensure_ascii=False)
+        os.replace(fnameTmp, self.index_state_filename(checkpoint))
+
+    def load_index_state(self, checkpoint=False):
+        """
+        Restore word statistics and the list of indexed files saved
+        after the previous run (or at the last checkpoint). Return
+        the state dictionary, or None if there is no usable state.
+        """
+        if not os.path.exists(self.index_state_filename(checkpoint)):
+            if checkpoint:
+                print('There is no checkpoint for "' + self.name + '". '
+                      'Set checkpoint_interval in corpus.json to write checkpoints.')
+            else:
+                print('There is no saved indexator state for "' + self.name + '". '
+                      'Set incremental_indexing to true in corpus.json and index the whole corpus first.')
+            return None
+        with gzip.open(self.index_state_filename(checkpoint), 'rt', encoding='utf-8') as fIn:
+            state = json.load(fIn)
+        if state['languages'] != self.languages:
+            print('The list of languages has changed since the previous run. '
+                  'The whole corpus has to be reindexed.')
+            return None
+        if self.wordMetaTables and 'doc_meta_values' not in state:
+            print('The corpus was indexed without word_meta_tables. '
+                  'The whole corpus has to be reindexed.')
+            return None
+        self.sID = state['sID']
+        self.dID = state['dID']
+        self.wordFreqID = state['wordFreqID']
+        self.lemmaFreqID = state['lemmaFreqID']
+        self.totalNumWords = state['totalNumWords']
+        if 'id_seed' in state:
+            self.idSeed = state['id_seed']
+            self.idScrambler = IDScrambler(self.idSeed)
+        self.indexedFiles = state['files']
+        if self.wordMetaTables:
+            self.docMetaValues = {int(dID): values for dID, values in state['doc_meta_values'].items()}
+        # The statistics are read with the backend they were saved with
+        self.wordStatsSettings['backend'] = state['word_stats_backend']
+        self.reset_word_stats(self.wordStatsSettings['backend'])
+        self.wordStats.load(self.word_stats_filename(checkpoint))
+        return state
+
+    def checkpoint_if_needed(self):
+        """
+        Write a checkpoint if checkpoints are switched on and enough
+        time has passed since the previous one.
+        """
+        if (self.checkpointInterval <= 0 or self.exportDir is not None
+                or time.time() - self.lastCheckpoint < self.checkpointInterval):
+            return
+        self.write_checkpoint()
+
+    def write_checkpoint(self):
+        """
+        Wait until everything sent so far has been indexed and all
+        pending full-text HTML files have been written, and save the
+        state of the indexator, so that the indexation could be resumed
+        from this point with --resume.
+        """
+        t1 = time.time()
+        self.bulkLoader.flush()
+        self.wait_fulltext_tasks()
+        self.save_index_state(checkpoint=True)
+        self.lastCheckpoint = time.time()
+        print('Checkpoint written after document', self.dID - 1,
+              'in', round(self.lastCheckpoint - t1, 2), 'seconds.')
+
+    def remove_checkpoint(self):
+        """
+        Delete the checkpoint files after a successful indexation.
+        """
+        fnames = [self.index_state_filename(checkpoint=True),
+                  self.word_stats_filename(checkpoint=True)]
+        if not self.keepState and self.wordStatsSettings['backend'] == 'sqlite':
+            # The SQLite database is made persistent by every checkpoint
+            fnames.append(self.wordStats.fname)
+        for fname in fnames:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def word_index_values(self):
+        """
+        For each language, return a dictionary with current values
+        of the volatile fields of all word and lemma objects, as they
+        are stored in the words index. This is used in incremental
+        indexing to find out which objects have to be updated.
+        """
+        values = [{} for i in range(len(self.languages))]
+        for langID in range(len(self.languages)):
+            wfsSorted, lemmataSorted = self.sort_words(self.languages[langID])
+            for wID, wJson, docFreqs in self.iterate_word_sources(langID, wfsSorted, lemmataSorted, verbose=False):
+                values[langID][wID] = self.volatile_values(wJson)
+            for lID, lemmaJson, docFreqs in self.iterate_lemma_sources(langID, lemmataSorted, verbose=False):
+                values[langID][lID] = self.volatile_values(lemmaJson)
+        return values
+
+    def volatile_values(self, itemJson):
+        """
+        Return a tuple with the values of the volatile fields of a word
+        or lemma object. Lists are turned into tuples.
+        """
+        return tuple(tuple(itemJson[field]) if type(itemJson.get(field)) == list
+                     else itemJson.get(field)
+                     for field in self.VOLATILE_WORD_FIELDS)
+
+    def subtract_doc_stats(self, dID):
+        """
+        Return word and lemma statistics for one previously indexed
+        document as a tuple (word frequencies, lemma frequencies) and
+        subtract its words from the total count. The frequencies are
+        recalculated from its sentences stored in the sentences index,
+        because the source file may have already been changed or removed.
+        """
+        wordFreqs = [{} for i in range(len(self.languages))]    # word ID -> [frequency, number of sentences]
+        lemmaFreqs = [{} for i in range(len(self.languages))]   # lemma ID -> [frequency, number of sentences]
+        for hit in scan(self.es, index=self.index_name('sentences'),
+                        query={'query': {'term': {'doc_id': dID}}},
+                        _source=['lang', 'words.wtype', 'words.w_id', 'words.l_id']):
+            s = hit['_source']
+            if 'words' not in s:
+                continue
+            langID = 0
+            if 'lang' in s:
+                langID = s['lang']
+            sWords = set()
+            sLemmata = set()
+            for w in s['words']:
+                if 'wtype' not in w or w['wtype'] != 'word':
+                    continue
+                wID = int(w['w_id'][1:])
+                lID = int(w['l_id'][1:])
+                try:
+                    wordFreqs[langID][wID][0] += 1
+                except KeyError:
+                    wordFreqs[langID][wID] = [1, 0]
+                try:
+                    lemmaFreqs[langID][lID][0] += 1
+                except KeyError:
+                    lemmaFreqs[langID][lID] = [1, 0]
+                sWords.add(wID)
+                sLemmata.add(lID)
+            for wID in sWords:
+                wordFreqs[langID][wID][1] += 1
+            for lID in sLemmata:
+                lemmaFreqs[langID][lID][1] += 1
+        for langID in range(len(self.languages)):
+            self.totalNumWords -= sum(freq for freq, sFreq in wordFreqs[langID].values())
+        return wordFreqs, lemmaFreqs
+
+    def remove_docs(self, dIDs):
+        """
+        Remove previously indexed documents from the statistics
+        and from all three indexes. Words and lemmata that
+        do not occur anywhere else disappear from the statistics;
+        their IDs are never reused.
+        """
+        if len(dIDs) <= 0:
+            return
+        print('Removing', len(dIDs), 'documents...')
+        self.sortedWords = {}
+        self.wordStats.remove_docs([(dID,) + self.subtract_doc_stats(dID) for dID in dIDs])
+        self.wordCache = {}
+        for dID in dIDs:
+            if dID in self.docMetaValues:
+                del self.docMetaValues[dID]
+        for i in range(0, len(dIDs), 1000):
+            dIDsBatch = dIDs[i:i+1000]
+            self.es.delete_by_query(index=self.index_name('sentences'),
+                                    body={'query': {'terms': {'doc_id': dIDsBatch}}},
+                                    conflicts='proceed', request_timeout=600)
+            if not self.packedFreqs:
+                self.es.delete_by_query(index=self.index_name('words'),
+                                        body={'query': {'bool': {'must': [{'term': {'wtype': 'word_freq'}},
+                                                                          {'terms': {'d_id': dIDsBatch}}]}}},
+                                        conflicts='proceed', request_timeout=600)
+            if self.ngramIndex:
+                self.es.delete_by_query(index=self.index_name('ngrams'),
+                                        body={'query': {'terms': {'d_id': dIDsBatch}}},
+                                        conflicts='proceed', request_timeout=600)
+            self.es.delete_by_query(index=self.index_name('docs'),
+                                    body={'query': {'ids': {'values': [str(dID) for dID in dIDsBatch]}}},
+                                    conflicts='proceed', request_timeout=600)
+
+    def iterate_word_updates(self, oldValues, newDIDs, orderUpdates, metaUpdates):
+        """
+        Compare current word and lemma statistics with the values
+        stored in the words index (oldValues). Return actions that
+        index new words and lemmata, update changed fields of the
+        existing ones, delete those that no longer occur in the corpus
+        and add word_freq objects for new documents, unless the frequencies
+        are packed. IDs of items whose sorting positions have changed are
+        stored in orderUpdates, so that their existing word_freq objects
+        could be updated later. IDs of items whose frequencies by metafield
+        may have changed are added to the metaUpdates set.
+        """
+        for langID in range(len(self.languages)):
+            wfsSorted, lemmataSorted = self.sort_words(self.languages[langID])
+            print('Updating words in ' + self.languages[langID] + '...')
+            curItems = set()
+            for wID, wJson, docFreqs in self.iterate_word_sources(langID, wfsSorted, lemmataSorted):
+                curItems.add(wID)
+                actions = self.item_update_actions(wID, wJson, oldValues[langID], orderUpdates)
+                for action in actions:
+                    yield action
+                if len(actions) > 0 or any(docID in newDIDs for docID in docFreqs):
+                    metaUpdates.add(wID)
+                if self.packedFreqs:
+                    continue
+                for docID in wJson['dids']:
+                    if docID in newDIDs:
+                        yield self.word_freq_action(wID, docID, wJson, docFreqs[docID])
+            for lID, lemmaJson, docFreqs in self.iterate_lemma_sources(langID, lemmataSorted):
+                curItems.add(lID)
+                actions = self.item_update_actions(lID, lemmaJson, oldValues[langID], orderUpdates)
+                for action in actions:
+                    yield action
+                if len(actions) > 0 or any(docID in newDIDs for docID in docFreqs):
+                    metaUpdates.add(lID)
+                if self.packedFreqs:
+                    continue
+                for docID in sorted(docFreqs):
+                    if docID in newDIDs:
+                        yield self.lemma_freq_action(lID, docID, lemmaJson['l_order'], docFreqs[docID])
+            for itemID in oldValues[langID]:
+                if itemID not in curItems:
+                    metaUpdates.add(itemID)
+                    yield {'_op_type': 'delete',
+                           '_index': self.index_name('words'),
+                           '_id': itemID}
+
+    def item_update_actions(self, itemID, itemJson, oldValues, orderUpdates):
+        """
+        Return a list with the action needed to bring one word or lemma
+        object in the words index up to date (empty if nothing has changed).
+        """
+        if itemID not in oldValues:
+            return [{'_index': self.index_name('words'),
+                     '_id': itemID,
+                     '_source': itemJson}]
+        changedFields = {}
+        for field, oldValue in zip(self.VOLATILE_WORD_FIELDS, oldValues[itemID]):
+            if field not in itemJson:
+                continue
+            value = itemJson[field]
+            if type(value) == list:
+                if tuple(value) == oldValue:
+                    continue
+            elif value == oldValue:
+                continue
+            changedFields[field] = value
+        if len(changedFields) <= 0:
+            return []
+        if 'wf_order' in changedFields or 'l_order' in changedFields:
+            orderUpdates[itemID] = {field: itemJson[field] for field in ['wf_order', 'l_order']
+                                    if field in itemJson}
+        return [{'_op_type': 'update',
+                 '_index': self.index_name('words'),
+                 '_id': itemID,
+                 'doc': changedFields}]
+
+    def update_word_freq_orders(self, orderUpdates):
+        """
+        Update sorting positions in the existing word_freq objects
+        of words and lemmata whose positions have changed. There are
+        no such objects if the frequencies are packed.
+        """
+        if len(orderUpdates) <= 0 or self.packedFreqs:
+            return
+        print('Updating sorting positions of', len(orderUpdates), 'words and lemmata...')
+        self.es_ic.refresh(index=self.index_name('words'))
+        script = 'def o = ctx._source.containsKey("w_id") ? params.orders[ctx._source.w_id] ' \
+                 ': params.orders[ctx._source.l_id]; ' \
+                 'if (o != null) { for (def k : o.keySet()) { ctx._source[k] = o[k]; } }'
+        itemIDs = sorted(orderUpdates)
+        for i in range(0, len(itemIDs), 1000):
+            orders = {itemID: orderUpdates[itemID] for itemID in itemIDs[i:i+1000]}
+            esQuery = {
+                'query': {
+                    'bool': {
+                        'must': [{'term': {'wtype': 'word_freq'}}],
+                        'should': [
+                            {'terms': {'w_id': [itemID for itemID in orders if itemID.startswith('w')]}},
+                            {'bool': {
+                                'must': [{'terms': {'l_id': [itemID for itemID in orders if itemID.startswith('l')]}}],
+                                'must_not': [{'exists': {'field': 'w_id'}}]
+                            }}
+                        ],
+                        'minimum_should_match': 1
+                    }
+                },
+                'script': {
+                    'source': script,
+                    'params': {'orders': orders}
+                }
+            }
+            self.es.update_by_query(index=self.index_name('words'), body=esQuery,
+                                    conflicts='proceed', request_timeout=600)
+
+    def update_word_meta_tables(self, itemIDs):
+        """
+        Replace the frequencies by metafield of the words and lemmata
+        whose statistics have changed. The old tables are deleted
+        first, because some of their values may not occur anymore.
+        """
+        if not self.wordMetaTables or len(itemIDs) <= 0:
+            return
+        print('Updating frequencies by metafield of', len(itemIDs), 'words and lemmata...')
+        self.es_ic.refresh(index=self.index_name('word_meta'))
+        itemIDsSorted = sorted(itemIDs)
+        for i in range(0, len(itemIDsSorted), 1000):
+            self.es.delete_by_query(index=self.index_name('word_meta'),
+                                    body={'query': {'terms': {'item_id': itemIDsSorted[i:i+1000]}}},
+                                    conflicts='proceed', request_timeout=600)
+        for langID in range(len(self.languages)):
+            wfsSorted, lemmataSorted = self.sort_words(self.languages[langID])
+            for wID, wJson, docFreqs in self.iterate_word_sources(langID, wfsSorted, lemmataSorted, verbose=False):
+                if wID in itemIDs:
+                    self.bulkLoader.add(self.iterate_word_meta(wID, langID, docFreqs))
+            for lID, lemmaJson, docFreqs in self.iterate_lemma_sources(langID, lemmataSorted, verbose=False):
+                if lID in itemIDs:
+                    self.bulkLoader.add(self.iterate_word_meta(lID, langID, docFreqs))
+        self.bulkLoader.flush()
+
+    def update_corpus(self):
+        """
+        Update the previously indexed corpus: remove deleted files,
+        reindex changed files and index new ones. Only the affected
+        word and lemma objects are updated in the words index.
+        """
+        self.analyze_dir()
+        curFiles = {os.path.relpath(fname, self.corpus_dir): (fname, fsize)
+                    for fname, fsize in self.filenames}
+        removedDIDs = []
+        newFiles = []
+        for relName, fileInfo in sorted(self.indexedFiles.items()):
+            if relName not in curFiles:
+                removedDIDs.append(fileInfo['d_id'])
+                continue
+            fileStat = os.stat(curFiles[relName][0])
+            if fileStat.st_size != fileInfo['size'] or fileStat.st_mtime != fileInfo['mtime']:
+                removedDIDs.append(fileInfo['d_id'])
+                newFiles.append(curFiles[relName])
+        for relName in curFiles:
+            if relName not in self.indexedFiles:
+                newFiles.append(curFiles[relName])
+        print(len(newFiles), 'new or changed files,',
+              len(removedDIDs), 'removed or changed files.')
+        if len(newFiles) <= 0 and len(removedDIDs) <= 0:
+            print('Nothing to update.')
+            return
+        removedDIDsSet = set(removedDIDs)
+        self.indexedFiles = {relName: fileInfo for relName, fileInfo in self.indexedFiles.items()
+                             if fileInfo['d_id'] not in removedDIDsSet}
+        oldValues = self.word_index_values()
+        self.remove_docs(removedDIDs)
+        firstNewDID = self.dID
+        self.index_files([fname for fname, fsize in sorted(newFiles, key=lambda p: -p[1])])
+        orderUpdates = {}
+        metaUpdates = set()
+        self.bulkLoader.add(self.iterate_word_updates(oldValues, set(range(firstNewDID, self.dID)),
+                                                      orderUpdates, metaUpdates))
+        self.bulkLoader.flush()
+        self.update_word_meta_tables(metaUpdates)
+        self.bulkLoader.report()
+        self.update_word_freq_orders(orderUpdates)
+        if 'generate_dictionary' in self.settings and self.settings['generate_dictionary']:
+            self.generate_dictionary()
+
     def compile_translations(self):
         """
         Compile flask_babel translations in ../search/web_app.
@@ -883,32 +1911,268 @@ class Indexator:
         else:
             print('Interface translations compiled.')
 
-    def load_corpus(self):
+    def resume_corpus(self):
+        """
+        Continue a full indexation interrupted after a checkpoint:
+        restore the state saved at the checkpoint, remove the sentences
+        and documents indexed after it, and index the remaining files.
+        Return False if there is no usable checkpoint.
+        """
+        state = self.load_index_state(checkpoint=True)
+        if state is None:
+            return False
+        self.iterSent.nonpersistentID = state['nonpersistent_id']
+        self.set_index_version(state['index_version'])
+        self.droppedDocs = set(state.get('dropped_docs', []))
+        print('Resuming after', len(self.indexedFiles), 'indexed documents.')
+        # Documents indexed after the checkpoint are indexed again
+        # with the same IDs; their sentences are removed first, in case
+        # the files have changed since then
+        self.es_ic.refresh(index=self.index_name('sentences') + ',' + self.index_name('docs'))
+        self.es.delete_by_query(index=self.index_name('sentences'),
+                                body={'query': {'range': {'doc_id': {'gte': self.dID}}}},
+                                conflicts='proceed', request_timeout=600)
+        if self.ngramIndex:
+            self.es.delete_by_query(index=self.index_name('ngrams'),
+                                    body={'query': {'range': {'d_id': {'gte': self.dID}}}},
+                                    conflicts='proceed', request_timeout=600)
+        self.bulkLoader.add({'_op_type': 'delete',
+                             '_index': self.index_name('docs'),
+                             '_id': hit['_id']}
+                            for hit in scan(self.es, index=self.index_name('docs'),
+                                            query={'query': {'match_all': {}}, '_source': False})
+                            if int(hit['_id']) >= self.dID)
+        self.bulkLoader.flush()
+        self.analyze_dir()
+        self.filenames = [(fname, fsize) for fname, fsize in self.filenames
+                          if os.path.relpath(fname, self.corpus_dir) not in self.indexedFiles]
+        indices = [self.index_name(indexType) for indexType in self.index_types()]
+        self.lifecycle.start_load(indices, savedSettings=state['index_settings'])
+        try:
+            self.index_dir()
+        finally:
+            try:
+                self.bulkLoader.close()
+            finally:
+                self.lifecycle.restore_settings(indices)
+        self.lifecycle.finish_load(indices)
+        return True
+
+    def validate_indices(self):
+        """
+        Check that the new version of the indices contains all
+        documents and sentences that have been indexed. Documents
+        dropped by doc_error_fallback() are not expected in the
+        docs index. Return False if it does not.
+        """
+        self.es_ic.refresh(index=','.join(self.index_name(indexType)
+                                          for indexType in self.index_types()))
+        nDocs = self.es.count(index=self.index_name('docs'))['count']
+        nSents = self.es.count(index=self.index_name('sentences'))['count']
+        nWords = self.es.count(index=self.index_name('words'))['count']
+        nExpectedDocs = sum(1 for fileInfo in self.indexedFiles.values()
+                            if fileInfo['d_id'] not in self.droppedDocs)
+        if nDocs <= 0 or nDocs != nExpectedDocs or nSents != self.sID:
+            print('Validation failed: the new indices contain', nDocs, 'documents and',
+                  nSents, 'sentences instead of', nExpectedDocs, 'and', str(self.sID) + '.')
+            return False
+        if nWords <= 0 and self.totalNumWords > 0:
+            print('Validation failed: the new words index is empty.')
+            return False
+        return True
+
+    def activate_index_version(self):
+        """
+        Validate the new version of the indices, switch the aliases
+        to it and delete old versions. Return False if the validation
+        fails; the aliases are left unchanged then.
+        """
+        if not self.validate_indices():
+            print('The aliases still point to the previous version of the corpus. '
+                  'The new version has been kept for inspection.')
+            return False
+        indexTypes = self.index_types()
+        self.lifecycle.switch_aliases({self.name + '.' + indexType: self.index_name(indexType)
+                                       for indexType in indexTypes})
+        print('The corpus is now searched in the indices with the suffix', self.indexVersion + '.')
+        for indexType in indexTypes:
+            self.lifecycle.remove_old_versions(self.name + '.' + indexType)
+        return True
+
+    def load_corpus(self, incremental=False, resume=False):
         """
         Drop the current database, if any, and load the entire corpus.
+        If incremental is True, only add, update or remove the files
+        that have changed since the previous run instead. If resume
+        is True, continue an interrupted indexation from the last
+        checkpoint. If versioned_indices is turned on, the current
+        indices are not dropped: a new version is built, and the aliases
+        are switched to it when it is complete.
         """
         t1 = time.time()
         # self.compile_translations()
-        indicesDeleted = self.delete_indices()
-        if not indicesDeleted:
+        if resume:
+            if self.exportDir is not None:
+                print('Exports cannot be resumed: checkpoints are only written '
+                      'when indexing in Elasticsearch.')
+                return
+            if not self.resume_corpus():
+                return
+        elif incremental:
+            if self.exportDir is not None:
+                print('Incremental updates cannot be exported: they need '
+                      'the existing indices in Elasticsearch.')
+                return
+            self.keepState = True
+            if not self.load_index_state():
+                return
+            try:
+                self.update_corpus()
+            finally:
+                self.bulkLoader.close()
+        else:
+            if self.exportDir is None:
+                if self.lifecycle.settings['versioned_indices']:
+                    # The current indices are searchable until the new ones are ready
+                    if not self.confirm_overwrite(versioned=True):
+                        return
+                    self.set_index_version(self.lifecycle.new_version())
+                else:
+                    indicesDeleted = self.delete_indices()
+                    if not indicesDeleted:
+                        return
+            self.reset_word_stats(self.wordStatsSettings['backend'])
+            self.remove_checkpoint()
+            self.analyze_dir()
+            self.create_indices()
+            indices = [self.index_name(indexType) for indexType in self.index_types()]
+            if self.exportDir is None:
+                self.lifecycle.start_load(indices)
+            self.lastCheckpoint = time.time()
+            try:
+                self.index_dir()
+            finally:
+                try:
+                    self.bulkLoader.close()
+                finally:
+                    self.lifecycle.restore_settings(indices)
+            if self.exportDir is None:
+                self.lifecycle.finish_load(indices)
+        if len(self.indexVersion) > 0 and not self.activate_index_version():
+            self.wordStats.close()
             return
-        self.analyze_dir()
-        self.create_indices()
-        self.index_dir()
+        if self.keepState:
+            self.save_index_state()
+        self.remove_checkpoint()
         t2 = time.time()
         print('Corpus indexed in', t2-t1, 'seconds:',
-              self.dID, 'documents,',
+              len(self.indexedFiles), 'documents,',
               self.sID, 'sentences,',
               self.totalNumWords, 'words,',
-              sum(len(self.wordFreqs[i]) for i in range(len(self.languages))), 'word types (different words).')
+              self.wordStats.num_items(), 'word types (different words).')
+        self.wordStats.close()
+
+
+workerIndexator = None    # Indexator instance used by a worker process
+
+
+def init_worker(indexVersion):
+    """
+    Create an Indexator instance in a newly started worker process.
+    """
+    global workerIndexator
+    workerIndexator = Indexator()
+    workerIndexator.set_index_version(indexVersion)
+    # Nonpersistent full-text IDs are generated in the main process
+    workerIndexator.iterSent.generateFulltextIDs = False
+
+
+def dictionary_lexemes_worker(task):
+    """
+    Collect the lexemes of a chunk of the word list in a worker
+    process. task is a tuple (language ID, list of tuples
+    (word as JSON, frequency)).
+    """
+    langID, words = task
+    return langID, workerIndexator.dictionary_lexemes(words, workerIndexator.languages[langID])
+
+
+def write_dictionary_worker(writer):
+    """
+    Write the dictionary of one language in a worker process.
+    writer is a DictionaryWriter with all lexemes of the language.
+    """
+    writer.write()
+
+
+def prepare_doc_worker(task):
+    """
+    Prepare one document in a worker process. task is a tuple
+    (filename, document ID).
+    """
+    fname, dID = task
+    return workerIndexator.prepare_doc(fname, dID)
+
+
+fulltextConverter = None    # JSON2HTML instance used by a full-text worker process
+
+
+def init_fulltext_worker(settings):
+    """
+    Create a JSON2HTML instance in a newly started full-text
+    worker process.
+    """
+    global fulltextConverter
+    fulltextConverter = JSON2HTML(settings=settings)
+
+
+def make_fulltext(j2h, task):
+    """
+    Generate the full-text HTML of one document with the given
+    JSON2HTML instance. task is a tuple (filename, metadata,
+    serialized sentences or None, output filename).
+    """
+    fname, meta, sentencesData, fnameOut = task
+    if sentencesData is None:
+        doc = JSONDoc(fname, meta, None, reader=j2h.iterSent)
+    else:
+        doc = JSONDoc(fname, meta, JSONDoc.deserialize_sentences(sentencesData))
+    j2h.process_doc(doc, fnameOut)
+
+
+def fulltext_worker(task):
+    """
+    Generate the full-text HTML of one document in a full-text
+    worker process.
+    """
+    make_fulltext(fulltextConverter, task)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Index corpus in Elasticsearch 7.x.')
     parser.add_argument('-y', help='overwrite existing database without asking first')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes that parse and prepare documents')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only index new and changed files and remove deleted ones')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted indexation from the last checkpoint')
+    parser.add_argument('--dictionary', action='store_true',
+                        help='only generate the dictionaries from the word statistics '
+                             'saved after the previous run')
+    parser.add_argument('--storage-report', action='store_true',
+                        help='only print the storage used by the indices of the corpus and their fields')
+    parser.add_argument('--export', metavar='DIR',
+                        help='write gzipped bulk files to DIR instead of indexing '
+                             '(they can be loaded later with load_export.py)')
     args = parser.parse_args()
     overwrite = False
     if args.y is not None:
         overwrite = True
-    x = Indexator(overwrite)
-    x.load_corpus()
+    x = Indexator(overwrite, workers=args.workers, exportDir=args.export)
+    if args.dictionary:
+        x.dictionary_from_state()
+    elif args.storage_report:
+        x.lifecycle.storage_report([x.index_name(indexType) for indexType in x.index_types()])
+    else:
+        x.load_corpus(incremental=args.incremental, resume=args.resume)
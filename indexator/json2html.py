@@ -66,10 +66,21 @@ class JSON2HTML:
         Read one JSON file (fnameIn). Generate an HTML representation for it
         and store it in fnameOut.
         """
+        doc = self.iterSent.read_doc(fnameIn)
+        if doc is None:
+            return
+        self.process_doc(doc, fnameOut)
+
+    def process_doc(self, doc, fnameOut):
+        """
+        Generate an HTML representation for a document that has already
+        been read (JSONDoc) and store it in fnameOut. The sentences of
+        the document are modified in the process.
+        """
         htmlByTier = [[]]
         nTier = 0
         paraIDsByTier = [set()]
-        for s, bLast in self.iterSent.get_sentences(fnameIn):
+        for s, bLast in doc.iterate_sentences():
             if 'lang' in s:
                 langID = s['lang']
             else:
@@ -119,7 +130,7 @@ class JSON2HTML:
         usedParaIDsByTier = [set() for _ in range(nTiers)]
         dataFinal = {
             'rows': [],
-            'meta': self.iterSent.get_metadata(fnameIn)
+            'meta': doc.meta
         }
 
         fname = ''
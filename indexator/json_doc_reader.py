@@ -3,6 +3,24 @@ import ijson
 import os
 import gzip
 import random
+import marshal
+import codecs
+import struct
+import time
+try:
+    import orjson
+except ImportError:
+    # orjson is an optional faster parser for whole files
+    orjson = None
+
+# The fastest available backend of the iterative parser
+ijsonBackend = ijson
+for backendName in ['yajl2_c', 'yajl2_cffi']:
+    try:
+        ijsonBackend = ijson.get_backend(backendName)
+        break
+    except ImportError:
+        pass
 
 
 class JSONDocReader:
@@ -11,6 +29,14 @@ class JSONDocReader:
     through sentences read from corpus files in tsakorpus native
     JSON format.
     """
+    DEFAULT_SETTINGS = {
+        'memory_budget': 2048,      # MB of parsed data above which files are read iteratively
+        'fast_parser': True,        # whether orjson should be used for whole files if it is installed
+        'log_files': False          # whether the reading statistics should be printed for each file
+    }
+    # Parsed JSON takes up about this many times more memory than its text
+    PARSED_SIZE_FACTOR = 10
+
     def __init__(self, format, settings):
         self.filesize_limit = -1
         self.lastFileName = ''
@@ -18,6 +44,11 @@ class JSONDocReader:
         self.lastDocMeta = None         # for lazy calculations
         self.settings = settings
         self.nonpersistentID = random.randint(1, 100)
+        self.generateFulltextIDs = True     # False in worker processes, where IDs could collide
+        self.readerSettings = dict(self.DEFAULT_SETTINGS)
+        if 'doc_reader' in settings:
+            self.readerSettings.update(settings['doc_reader'])
+        self.readStats = {}     # strategy -> number of files, their total size and parsing time
 
     @staticmethod
     def insert_meta_year(metadata):
@@ -43,94 +74,328 @@ class JSONDocReader:
             if 'year_to' not in metadata:
                 metadata['year_to'] = metadata['year']
 
-    def get_metadata(self, fname):
+    def insert_nonpersistent_fulltext_id(self, metadata):
         """
-        If the file is not too large, return its metadata.
+        If the document has no fulltext_id and the settings allow it,
+        generate a random (nonpersistent) one.
         """
-        if os.stat(fname).st_size > self.filesize_limit > 0:
-            return
-        if fname == self.lastFileName and self.lastDocMeta is not None:
-            return self.lastDocMeta
-        self.lastFileName = fname
-        if self.format == 'json':
-            fIn = open(fname, 'r', encoding='utf-8-sig')
-        elif self.format == 'json-gzip':
-            fIn = gzip.open(fname, 'rt', encoding='utf-8-sig')
-        else:
-            return {}
-        metadata = {}
-        curMetaField = ''
-        JSONParser = ijson.parse(fIn)
-        for prefix, event, value in JSONParser:
-            if (prefix, event) == ('meta', 'map_key'):
-                curMetaField = value
-            elif len(curMetaField) > 0 and prefix.startswith('meta.'):
-                metadata[curMetaField] = value
-            elif (prefix, event) == ('meta', 'end_map'):
-                break
         if ('fulltext_id' not in metadata
                 and 'use_nonpersistent_fulltext_id' in self.settings
                 and self.settings['use_nonpersistent_fulltext_id']):
             metadata['fulltext_id'] = str(self.nonpersistentID)
             self.nonpersistentID += random.randint(1, 100)
-        self.lastDocMeta = metadata
+
+    def open_file(self, fname):
+        """
+        Open a corpus file for reading in binary mode, skipping the
+        byte order mark if there is one. Return None if the input
+        format is not supported.
+        """
+        if self.format == 'json':
+            fIn = open(fname, 'rb')
+        elif self.format == 'json-gzip':
+            fIn = gzip.open(fname, 'rb')
+        else:
+            return None
+        if fIn.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+            fIn.seek(0)
+        return fIn
+
+    def uncompressed_size(self, fname):
+        """
+        Return the size of the file contents in bytes. For gzipped
+        files, it is taken from the gzip trailer, which stores it
+        modulo 4 GB, so a value smaller than the compressed size means
+        that the actual size is larger than that.
+        """
+        fileSize = os.stat(fname).st_size
+        if self.format != 'json-gzip' or fileSize < 4:
+            return fileSize
+        with open(fname, 'rb') as fIn:
+            fIn.seek(-4, os.SEEK_END)
+            size = struct.unpack('<I', fIn.read(4))[0]
+        if size < fileSize:
+            size += 1 << 32
+        return size
+
+    def choose_strategy(self, size):
+        """
+        Decide how a file with contents of the given size should be
+        read. Whole files are parsed at once if their parsed contents
+        fit in the memory budget; larger files are read iteratively,
+        sentence by sentence.
+        """
+        budget = self.readerSettings['memory_budget'] * 1024 * 1024
+        if budget > 0 and size * self.PARSED_SIZE_FACTOR > budget:
+            return 'stream'
+        if self.readerSettings['fast_parser'] and orjson is not None:
+            return 'orjson'
+        return 'json'
+
+    def parse_whole(self, fIn, strategy):
+        """
+        Parse the whole file with the given parser.
+        """
+        data = fIn.read()
+        if strategy == 'orjson':
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                # orjson is stricter than json, e.g. about lone surrogates
+                pass
+        return json.loads(data.decode('utf-8'))
+
+    def read_metadata(self, fname):
+        """
+        Read the metadata from the beginning of the file with the
+        iterative parser, without loading the rest of the file.
+        The whole meta object is built from the parser events, so that
+        list and dictionary values are exactly the same as when the
+        file is parsed at once.
+        """
+        fIn = self.open_file(fname)
+        if fIn is None:
+            return {}
+        metadata = next(ijsonBackend.items(fIn, 'meta', use_float=True), {})
         fIn.close()
+        return metadata
+
+    def prepare_metadata(self, fname, metadata):
+        """
+        Add the generated fields to the metadata of a newly read
+        document and remember it as the metadata of the last file.
+        """
+        self.lastFileName = fname
+        if self.generateFulltextIDs:
+            self.insert_nonpersistent_fulltext_id(metadata)
+        self.lastDocMeta = metadata
         self.insert_meta_year(metadata)
+
+    def get_metadata(self, fname):
+        """
+        If the file is not too large, return its metadata.
+        """
+        if os.stat(fname).st_size > self.filesize_limit > 0:
+            return
+        if fname == self.lastFileName and self.lastDocMeta is not None:
+            return self.lastDocMeta
+        metadata = self.read_metadata(fname)
+        self.prepare_metadata(fname, metadata)
         return metadata
 
-    def insert_doc_level_meta(self, sentence):
+    def read_doc(self, fname):
+        """
+        If the file is not too large, parse it and return a JSONDoc
+        with its metadata and sentences. The file is parsed only once.
+        If its parsed contents would not fit in the memory budget, or
+        if parsing it runs out of memory, only the metadata is read,
+        and the sentences are later read with the iterative parser.
+        """
+        if os.stat(fname).st_size > self.filesize_limit > 0:
+            return
+        fIn = self.open_file(fname)
+        if fIn is None:
+            return JSONDoc(fname, {}, [])
+        size = self.uncompressed_size(fname)
+        strategy = self.choose_strategy(size)
+        parseTime = 0
+        if strategy != 'stream':
+            t1 = time.time()
+            try:
+                doc = self.parse_whole(fIn, strategy)
+                fIn.close()
+                metadata = doc.get('meta', {})
+                sentences = doc.get('sentences', [])
+            except MemoryError:
+                print('Memory error when reading', fname, ', trying iterative JSON parser (will work slowly).')
+                strategy = 'stream'
+            parseTime = time.time() - t1
+        if strategy == 'stream':
+            fIn.close()
+            metadata = self.read_metadata(fname)
+            sentences = None
+        self.prepare_metadata(fname, metadata)
+        doc = JSONDoc(fname, metadata, sentences, reader=self)
+        doc.readStats = {'strategy': strategy, 'size': size, 'time': parseTime}
+        return doc
+
+    def iterate_file_sentences(self, fname, readStats=None):
+        """
+        Iterate through the sentences of a file that is too large
+        to be loaded into memory, using the iterative parser. If
+        readStats is given, the time spent in the parser is added
+        to readStats['time'].
+        """
+        fIn = self.open_file(fname)
+        if fIn is None:
+            return
+        sentences = ijsonBackend.items(fIn, 'sentences.item', use_float=True)
+        while True:
+            t1 = time.time()
+            try:
+                sentence = next(sentences)
+            except StopIteration:
+                break
+            finally:
+                if readStats is not None:
+                    readStats['time'] += time.time() - t1
+            yield sentence
+        fIn.close()
+
+    def iterate_file_alignment(self, fname, readStats=None):
+        """
+        Iterate through the sentences of a file that is too large
+        to be loaded into memory and yield tuples (language ID,
+        list of para_id values of the sentence). Only the parser
+        events are looked at, so the sentences are not built.
+        If readStats is given, the parsing time is added
+        to readStats['time'].
+        """
+        fIn = self.open_file(fname)
+        if fIn is None:
+            return
+        t1 = time.time()
+        langID = 0
+        paraIDs = []
+        for prefix, event, value in ijsonBackend.parse(fIn, use_float=True):
+            if prefix == 'sentences.item':
+                if event == 'start_map':
+                    langID = 0
+                    paraIDs = []
+                elif event == 'end_map':
+                    if readStats is not None:
+                        readStats['time'] += time.time() - t1
+                    yield langID, paraIDs
+                    t1 = time.time()
+            elif prefix == 'sentences.item.lang':
+                langID = value
+            elif prefix == 'sentences.item.para_alignment.item.para_id':
+                paraIDs.append(value)
+        if readStats is not None:
+            readStats['time'] += time.time() - t1
+        fIn.close()
+
+    def log_read_stats(self, fname, readStats):
+        """
+        Add the statistics of reading one file (see read_doc())
+        to the totals and print them if necessary.
+        """
+        if readStats is None:
+            return
+        strategy = readStats['strategy']
+        if strategy not in self.readStats:
+            self.readStats[strategy] = {'files': 0, 'size': 0, 'time': 0}
+        for k in ['size', 'time']:
+            self.readStats[strategy][k] += readStats[k]
+        self.readStats[strategy]['files'] += 1
+        if self.readerSettings['log_files']:
+            print('{0}: {1}, {2:.2f} MB in {3:.3f} s, {4:.1f} MB/s.'.format(
+                fname, strategy, readStats['size'] / (1024 * 1024), readStats['time'],
+                readStats['size'] / (1024 * 1024) / max(readStats['time'], 0.001)))
+
+    def report(self):
+        """
+        Print the statistics of reading the files for each
+        strategy.
+        """
+        for strategy in sorted(self.readStats):
+            stats = self.readStats[strategy]
+            print('Files read with {0}: {1}, {2:.1f} MB in {3:.1f} s, {4:.1f} MB/s.'.format(
+                strategy, stats['files'], stats['size'] / (1024 * 1024), stats['time'],
+                stats['size'] / (1024 * 1024) / max(stats['time'], 0.001)))
+
+    def get_sentences(self, fname):
+        """
+        If the file is not too large, iterate through its
+        sentences.
+        """
+        doc = self.read_doc(fname)
+        if doc is None:
+            return
+        for s, bLast in doc.iterate_sentences():
+            yield s, bLast
+
+
+class JSONDoc:
+    """
+    One document in tsakorpus native JSON format, parsed once and then
+    used for indexing its sentences and metadata and for generating
+    its full-text view. If the document did not fit in memory,
+    self.sentences is None, and the sentences are read from the file
+    again each time they are needed.
+    """
+    def __init__(self, fname, meta, sentences, reader=None):
+        self.fname = fname
+        self.meta = meta
+        self.sentences = sentences
+        self.reader = reader
+        self.readStats = None       # how the file was read, see JSONDocReader.read_doc()
+
+    @staticmethod
+    def insert_doc_level_meta(sentence, docMeta):
         """
         Copy some document-level metadata into the sentence-level
         metadata dictionary, if it is not already there. This is
         needed for sorting. At the moment, this includes year_from.
         """
-        if self.lastDocMeta is None or 'year_from' not in self.lastDocMeta:
+        if docMeta is None or 'year_from' not in docMeta:
             return
         if 'meta' not in sentence:
             sentence['meta'] = {}
         if 'year' in sentence['meta']:
             return
-        sentence['meta']['year'] = self.lastDocMeta['year_from']
+        sentence['meta']['year'] = docMeta['year_from']
 
-    def get_sentences(self, fname):
+    def iterate_sentences(self):
         """
-        If the file is not too large, iterate through its
-        sentences.
+        Iterate through the sentences of the document. Yield
+        tuples (sentence, whether it is the last sentence).
         """
-        if os.stat(fname).st_size > self.filesize_limit > 0:
-            return
-        self.get_metadata(fname)
-        if self.format == 'json':
-            fIn = open(fname, 'r', encoding='utf-8-sig')
-        elif self.format == 'json-gzip':
-            fIn = gzip.open(fname, 'rt', encoding='utf-8-sig')
+        if self.sentences is not None:
+            sentences = self.sentences
+        elif self.reader is not None:
+            sentences = self.reader.iterate_file_sentences(self.fname, self.readStats)
         else:
-            return {}, True
-        try:
-            doc = json.load(fIn)
-            fIn.close()
-            for i in range(len(doc['sentences'])):
-                self.insert_doc_level_meta(doc['sentences'][i])
-                if i < len(doc['sentences']) - 1:
-                    yield doc['sentences'][i], False
-                else:
-                    yield doc['sentences'][i], True
-                    return
-        except MemoryError:
-            print('Memory error when reading', fname, ', trying iterative JSON parser (will work slowly).')
-            fIn.close()
-            if self.format == 'json':
-                fIn = open(fname, 'r', encoding='utf-8-sig')
-            elif self.format == 'json-gzip':
-                fIn = gzip.open(fname, 'rt', encoding='utf-8-sig')
-            else:
-                return {}, True
-            prevSent = {}
-            for sentence in ijson.items(fIn, 'sentences.item'):
-                self.insert_doc_level_meta(sentence)
-                if prevSent != {}:
-                    yield prevSent, False
-                prevSent = sentence
-            fIn.close()
-            yield prevSent, True
             return
+        prevSent = None
+        for sentence in sentences:
+            self.insert_doc_level_meta(sentence, self.meta)
+            if prevSent is not None:
+                yield prevSent, False
+            prevSent = sentence
+        if prevSent is not None:
+            yield prevSent, True
+
+    def iterate_alignment(self):
+        """
+        Iterate through the sentences of the document and yield
+        tuples (language ID, list of para_id values of the sentence).
+        This is a cheap pre-pass that lets the indexator know the IDs
+        of aligned sentences before it reads the sentences for indexing.
+        """
+        if self.sentences is not None:
+            for sentence in self.sentences:
+                langID = sentence.get('lang', 0)
+                yield langID, [pa['para_id'] for pa in sentence.get('para_alignment', [])]
+        elif self.reader is not None:
+            yield from self.reader.iterate_file_alignment(self.fname, self.readStats)
+
+    def serialize_sentences(self):
+        """
+        Return a serialized copy of the sentences that can be restored
+        with deserialize_sentences(). It is used when the sentences are
+        needed after indexing has changed them, or in another process.
+        marshal is used because it copies JSON data several times
+        faster than copy.deepcopy() and faster than pickle. Return None if the
+        sentences have not been loaded into memory.
+        """
+        if self.sentences is None:
+            return None
+        return marshal.dumps(self.sentences)
+
+    @staticmethod
+    def deserialize_sentences(data):
+        """
+        Restore the sentences serialized by serialize_sentences().
+        """
+        return marshal.loads(data)
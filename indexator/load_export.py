@@ -0,0 +1,168 @@
+from elasticsearch import Elasticsearch
+from elasticsearch.client import IndicesClient
+import json
+import os
+import gzip
+import time
+import argparse
+from bulk_loader import BulkLoader, doc_error_fallback
+from bulk_export import BulkExporter
+from index_lifecycle import IndexLifecycle
+
+
+class ExportLoader:
+    """
+    Loads the gzipped NDJSON bulk files written by the indexator with
+    the --export option into Elasticsearch. The indices are created
+    with the mappings stored in the manifest, and the files are sent
+    with parallel bulk requests by BulkLoader. The names of the files
+    that have been loaded completely are stored in the export directory,
+    so that a failed load can be resumed.
+    """
+    SETTINGS_DIR = '../conf'
+    PROGRESS_NAME = 'loaded.json'
+    ERROR_HANDLERS = {
+        'doc_error_fallback': doc_error_fallback
+    }
+
+    def __init__(self, dirIn, overwrite=False, threads=0):
+        self.dirIn = dirIn
+        self.overwrite = overwrite  # whether to overwrite existing indices without asking
+        with open(os.path.join(self.dirIn, BulkExporter.MANIFEST_NAME),
+                  'r', encoding='utf-8') as fManifest:
+            self.manifest = json.load(fManifest)
+        # Connection and bulk request parameters are taken from corpus.json
+        # if it exists on this machine
+        self.settings = {}
+        if os.path.exists(os.path.join(self.SETTINGS_DIR, 'corpus.json')):
+            with open(os.path.join(self.SETTINGS_DIR, 'corpus.json'),
+                      'r', encoding='utf-8') as fSettings:
+                self.settings = json.load(fSettings)
+        if 'elastic_url' in self.settings and len(self.settings['elastic_url']) > 0:
+            self.es = Elasticsearch([self.settings['elastic_url']])
+        else:
+            self.es = Elasticsearch()
+        self.es_ic = IndicesClient(self.es)
+        self.bulkLoader = BulkLoader(self.es, self.settings)
+        if threads > 0:
+            self.bulkLoader.settings['thread_count'] = threads
+        # Error handlers registered by the indexator are listed in the manifest
+        self.errorHandlerIndices = set()
+        for index in self.manifest['indices']:
+            handlerName = self.manifest['indices'][index].get('error_handler', '')
+            if handlerName in self.ERROR_HANDLERS:
+                self.bulkLoader.set_error_handler(index, self.ERROR_HANDLERS[handlerName])
+                self.errorHandlerIndices.add(index)
+        self.lifecycle = IndexLifecycle(self.es, self.es_ic, self.settings)
+        self.loadedFiles = set()
+
+    def create_indices(self):
+        """
+        Create the indices listed in the manifest. If some of them
+        already exist, ask the user if they want to overwrite them.
+        Return False if they do not.
+        """
+        indices = sorted(self.manifest['indices'])
+        if not self.overwrite and any(self.es_ic.exists(index=index) for index in indices):
+            print('It seems that a corpus named "' + self.manifest['corpus_name'] + '" already exists. '
+                  + 'Do you want to overwrite it? [y/n]')
+            reply = input()
+            if reply.lower() != 'y':
+                print('Loading aborted.')
+                return False
+        for index in indices:
+            if self.es_ic.exists(index=index):
+                self.es_ic.delete(index=index)
+            self.es_ic.create(index=index, body=self.manifest['indices'][index]['mapping'])
+        return True
+
+    def read_progress(self):
+        """
+        Read the list of files that have been loaded completely.
+        """
+        fname = os.path.join(self.dirIn, self.PROGRESS_NAME)
+        self.loadedFiles = set()
+        if os.path.exists(fname):
+            with open(fname, 'r', encoding='utf-8') as fIn:
+                self.loadedFiles = set(json.load(fIn))
+
+    def write_progress(self):
+        """
+        Store the list of files that have been loaded completely.
+        """
+        with open(os.path.join(self.dirIn, self.PROGRESS_NAME), 'w', encoding='utf-8') as fOut:
+            json.dump(sorted(self.loadedFiles), fOut, indent=1)
+
+    def iterate_file(self, fname):
+        """
+        Iterate through the actions stored in one file. Yield
+        tuples (lines of the request body, action) accepted
+        by BulkLoader.add_serialized(). For the indices with an
+        error handler, the action also contains its _id and _source,
+        which the handler needs to build a fallback action.
+        """
+        with gzip.open(os.path.join(self.dirIn, fname), 'rt', encoding='utf-8') as fIn:
+            for line in fIn:
+                line = line.rstrip('\n')
+                if len(line) <= 0:
+                    continue
+                actionMeta = json.loads(line)
+                opType = next(iter(actionMeta))
+                action = {'_index': actionMeta[opType].get('_index', '')}
+                if opType == 'delete':
+                    yield [line], action
+                    continue
+                sourceLine = fIn.readline().rstrip('\n')
+                if action['_index'] in self.errorHandlerIndices:
+                    action['_id'] = actionMeta[opType].get('_id')
+                    action['_source'] = json.loads(sourceLine)
+                yield [line, sourceLine], action
+
+    def load(self, resume=False):
+        """
+        Load all files listed in the manifest. If resume is True,
+        skip the files that have been loaded by a previous run and
+        do not recreate the indices.
+        """
+        t1 = time.time()
+        if resume:
+            self.read_progress()
+        else:
+            if not self.create_indices():
+                return
+            self.loadedFiles = set()
+            self.write_progress()
+        indices = sorted(self.manifest['indices'])
+        self.lifecycle.start_load(indices)
+        try:
+            for index in indices:
+                for fileInfo in self.manifest['indices'][index]['files']:
+                    if fileInfo['file'] in self.loadedFiles:
+                        continue
+                    self.bulkLoader.add_serialized(self.iterate_file(fileInfo['file']))
+                    self.bulkLoader.flush()
+                    self.loadedFiles.add(fileInfo['file'])
+                    self.write_progress()
+                    print('Loaded', fileInfo['file'], '(' + str(fileInfo['actions']), 'actions).')
+        finally:
+            try:
+                self.bulkLoader.close()
+            finally:
+                self.lifecycle.restore_settings(indices)
+        self.lifecycle.finish_load(indices)
+        self.bulkLoader.report()
+        print('Corpus loaded in', time.time() - t1, 'seconds.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load bulk files written by indexator.py --export '
+                                                 'into Elasticsearch 7.x.')
+    parser.add_argument('dir', help='directory with the exported files')
+    parser.add_argument('-y', action='store_true', help='overwrite existing indices without asking first')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='number of bulk requests sent in parallel (overrides bulk_loader in corpus.json)')
+    parser.add_argument('--resume', action='store_true',
+                        help='only load the files that have not been loaded by a previous run')
+    args = parser.parse_args()
+    loader = ExportLoader(args.dir, overwrite=args.y, threads=args.threads)
+    loader.load(resume=args.resume)
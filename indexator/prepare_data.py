@@ -1,6 +1,7 @@
 import json
 import os
 import re
+import copy
 
 
 class PrepareData:
@@ -11,6 +12,9 @@ class PrepareData:
     SETTINGS_DIR = '../conf'
     rxBadField = re.compile('[^a-zA-Z0-9_]|^(?:lex|gr|gloss_index|wf|[wm]type|ana|sent_ids|id)$')
     MULTIPLE_SHARDS_THRESHOLD = 256 * 1024 * 1024
+    # Fields that are not indexed, but are read by search scripts,
+    # so they need doc values even in the lean mapping profile
+    SCRIPT_FIELDS = {'d_freqs'}
 
     def __init__(self):
         """
@@ -27,6 +31,18 @@ class PrepareData:
         self.kwFields = []
         if 'kw_word_fields' in self.settings:
             self.kwFields = self.settings['kw_word_fields']
+        self.tableFields = []
+        if 'word_table_fields' in self.settings:
+            self.tableFields = self.settings['word_table_fields']
+        # The "lean" profile does not index, keep doc values for or
+        # store in _source the fields the web interface never uses
+        # in that way; mapping_overrides change individual fields
+        self.mappingProfile = 'full'
+        if 'mapping_profile' in self.settings:
+            self.mappingProfile = self.settings['mapping_profile']
+        self.mappingOverrides = {}
+        if 'mapping_overrides' in self.settings:
+            self.mappingOverrides = self.settings['mapping_overrides']
         f = open(os.path.join(self.SETTINGS_DIR, 'categories.json'),
                  'r', encoding='utf-8')
         self.categories = json.loads(f.read())
@@ -158,6 +174,13 @@ class PrepareData:
                     # (and maybe other objects in the future).
                 }
             }
+            if 'word_freq_layout' in self.settings and self.settings['word_freq_layout'] == 'packed':
+                # In the packed layout, there are no word_freq objects.
+                # Instead, each word or lemma stores its frequencies in
+                # individual documents as (document ID << 32) | frequency.
+                # These values are only read by aggregation scripts,
+                # so they are not indexed.
+                m['d_freqs'] = {'type': 'long', 'index': False}
         mapping = {
             'mappings': {
                 'properties': m
@@ -166,6 +189,8 @@ class PrepareData:
                 'analysis': self.wfAnalyzer
             }
         }
+        if wordFreqs:
+            self.apply_mapping_profile(mapping, 'words')
         return mapping
 
     def generate_docs_mapping(self):
@@ -213,8 +238,9 @@ class PrepareData:
             'mappings': {
                 'properties': m
             },
-            'settings': self.docNormalizer
+            'settings': dict(self.docNormalizer)
         }
+        self.apply_mapping_profile(mapping, 'docs')
         return mapping
 
     def generate_sentences_mapping(self, word_mapping, corpusSizeInBytes=0):
@@ -222,7 +248,7 @@ class PrepareData:
         Return Elasticsearch mapping for the type "sentence", based
         on searchable features described in the corpus settings.
         """
-        wordProps = word_mapping['mappings']['properties']
+        wordProps = copy.deepcopy(word_mapping['mappings']['properties'])
         m = {
             'prev_id': {'type': 'integer'},
             'next_id': {'type': 'integer'},
@@ -353,8 +379,195 @@ class PrepareData:
                 }
             }
         }
+        self.apply_mapping_profile(mapping, 'sentences')
+        return mapping
+
+    def generate_ngrams_mapping(self):
+        """
+        Return Elasticsearch mapping for the type "ngram". Each
+        element of the ngrams index contains the frequency of a pair
+        of adjacent words in a single document.
+        """
+        m = {
+            'w1_id': {'type': 'keyword'},
+            'w2_id': {'type': 'keyword'},
+            'l1_id': {'type': 'keyword'},
+            'l2_id': {'type': 'keyword'},
+            'lang': {'type': 'byte'},
+            'd_id': {'type': 'integer'},
+            'freq': {'type': 'integer'},
+            'n_sents': {'type': 'integer'},
+            's_ids': {'type': 'integer'}
+        }
+        mapping = {
+            'mappings': {
+                'properties': m
+            },
+            'settings': {
+                'refresh_interval': '30s'
+            }
+        }
+        self.apply_mapping_profile(mapping, 'ngrams')
+        return mapping
+
+    def generate_word_meta_mapping(self):
+        """
+        Return Elasticsearch mapping for the type "word_meta". Each
+        element of the word_meta index contains the frequency of a word
+        or a lemma in the documents with one value of a document-level
+        metafield listed in stat_options.
+        """
+        m = {
+            'item_id': {'type': 'keyword'},
+            'field': {'type': 'keyword'},
+            'value': {'type': 'keyword'},
+            'lang': {'type': 'byte'},
+            'freq': {'type': 'integer'},
+            'n_docs': {'type': 'integer'}
+        }
+        mapping = {
+            'mappings': {
+                'properties': m
+            },
+            'settings': {
+                'refresh_interval': '30s'
+            }
+        }
+        self.apply_mapping_profile(mapping, 'word_meta')
         return mapping
 
+    @staticmethod
+    def find_field(properties, path):
+        """
+        Return the mapping of the field with the dot-separated path
+        (e.g. words.ana.gr.pos) in the properties of an index, or None
+        if there is no such field. Field names may contain dots
+        themselves, so the longest name that fits is taken at each level.
+        """
+        parts = path.split('.')
+        field = None
+        i = 0
+        while i < len(parts):
+            if field is not None:
+                if 'properties' not in field:
+                    return None
+                properties = field['properties']
+            for j in range(len(parts), i, -1):
+                name = '.'.join(parts[i:j])
+                if name in properties:
+                    field = properties[name]
+                    i = j
+                    break
+            else:
+                return None
+        return field
+
+    def lean_fields(self, indexType):
+        """
+        Return a dictionary {field path -> mapping parameters} with
+        the changes the lean profile makes in the index of the given
+        type. The parameter "source": false means that the field is
+        excluded from _source. Fields without "type" are only changed
+        if they are in the mapping; the others are added, because
+        otherwise they would be mapped dynamically as searchable fields.
+        """
+        if indexType in ('docs', 'ngrams', 'word_meta'):
+            # Metadata of the documents is displayed and searched as is;
+            # n-grams and frequency tables only contain IDs and frequencies
+            return {}
+        prefix = ''
+        if indexType == 'sentences':
+            prefix = 'words.'
+        displayOnly = {'type': 'keyword', 'index': False, 'doc_values': False}
+        fields = {}
+        if indexType == 'sentences':
+            # Glosses are searched in gloss_index, but displayed from gloss.
+            # Word objects keep it in _source: incremental indexing updates
+            # them, and an update rebuilds the object from _source.
+            fields['words.ana.gloss_index'] = {'source': False}
+        if 'parts' not in self.wordFields:
+            fields[prefix + 'ana.parts'] = displayOnly
+        for field in self.tableFields:
+            # Fields only shown in the word tables and the popups
+            if (self.rxBadField.search(field) is None
+                    and field not in self.wordFields and field not in self.kwFields):
+                fields[prefix + 'ana.' + field] = displayOnly
+        if indexType == 'sentences':
+            # Offsets and links between tokens are only used for display
+            for field in ['off_start', 'off_end', 'next_word']:
+                fields['words.' + field] = {'type': 'integer', 'index': False, 'doc_values': False}
+            # Keyword copies of the metadata are only used in queries
+            # and aggregations; the original values are displayed
+            fields['meta.sent_analyses_kw'] = {'source': False}
+            for meta in self.settings['sentence_meta']:
+                if not (meta.startswith('year') or ('integer_meta_fields' in self.settings
+                                                    and meta in self.settings['integer_meta_fields'])):
+                    fields['meta.' + meta + '_kw'] = {'source': False}
+        return fields
+
+    def drop_unused_doc_values(self, properties):
+        """
+        Turn off doc values for all fields that are not indexed,
+        except the fields used by search scripts. Such fields are never
+        used in sorting or aggregations.
+        """
+        for name, field in properties.items():
+            if 'properties' in field:
+                self.drop_unused_doc_values(field['properties'])
+            elif (field.get('index') is False and name not in self.SCRIPT_FIELDS
+                  and field.get('type') not in ('text', 'nested', 'object', 'join')):
+                field['doc_values'] = False
+
+    def change_field(self, mapping, path, params):
+        """
+        Apply mapping parameters to one field of an index mapping.
+        The parameter "source" determines whether the field is kept
+        in _source. A field that is not in the mapping is added
+        if the parameters include its type.
+        """
+        properties = mapping['mappings']['properties']
+        field = self.find_field(properties, path)
+        if field is None:
+            if 'type' not in params:
+                print('Mapping override for ' + path + ' ignored: there is no such field.')
+                return
+            parentPath, _, name = path.rpartition('.')
+            if len(parentPath) > 0:
+                parent = self.find_field(properties, parentPath)
+                if parent is None or 'properties' not in parent:
+                    print('Mapping override for ' + path + ' ignored: there is no such field.')
+                    return
+                properties = parent['properties']
+            field = properties[name] = {}
+        for k, v in params.items():
+            if k != 'source':
+                field[k] = v
+            elif not v:
+                if '_source' not in mapping['mappings']:
+                    mapping['mappings']['_source'] = {'excludes': []}
+                if path not in mapping['mappings']['_source']['excludes']:
+                    mapping['mappings']['_source']['excludes'].append(path)
+
+    def apply_mapping_profile(self, mapping, indexType):
+        """
+        Change the mapping of the docs, words or sentences index
+        according to mapping_profile and mapping_overrides. The keys
+        of mapping_overrides are field paths starting with the index
+        type, e.g. sentences.words.ana.trans_en.
+        """
+        if self.mappingProfile == 'lean':
+            for path, params in sorted(self.lean_fields(indexType).items()):
+                self.change_field(mapping, path, dict(params))
+            self.drop_unused_doc_values(mapping['mappings']['properties'])
+        for path, params in sorted(self.mappingOverrides.items()):
+            if path.startswith(indexType + '.'):
+                if indexType == 'words' and 'source' in params and not params['source']:
+                    # Updates of word objects would lose the excluded values
+                    print('Mapping override for ' + path + ': fields of the words index '
+                          'cannot be excluded from _source.')
+                    params = {k: v for k, v in params.items() if k != 'source'}
+                self.change_field(mapping, path[len(indexType) + 1:], params)
+
     def generate_mappings(self):
         """
         Return Elasticsearch mappings for all types to be used
@@ -369,6 +582,10 @@ class PrepareData:
             'sentences': mSent,
             'words': mWord
         }
+        if 'ngram_index' in self.settings and self.settings['ngram_index']:
+            mappings['ngrams'] = self.generate_ngrams_mapping()
+        if 'word_meta_tables' in self.settings and self.settings['word_meta_tables']:
+            mappings['word_meta'] = self.generate_word_meta_mapping()
         return mappings
 
     def write_mappings(self, fnameOut):
@@ -0,0 +1,223 @@
+import os
+import json
+import math
+import random
+from elasticsearch.exceptions import TransportError
+
+
+class ShardPlanner:
+    """
+    Chooses the number of shards and replicas of the docs, words
+    and sentences indices. The size of each index is estimated from
+    a sample of the corpus files: the size of the JSON is multiplied
+    by size_factor, each nested object (word, analysis, alignment)
+    adds nested_doc_bytes, and the number of different words and
+    lemmata in the whole corpus is extrapolated from the sample with
+    Heaps' law. An index gets as many shards as needed to keep them
+    under target_shard_size. An index larger than min_shard_size is
+    also split so that its shards can be searched in parallel by the
+    processors of all data nodes, as long as each shard stays larger
+    than min_shard_size. The numbers of data nodes and processors
+    are taken from the cluster, or from the settings when the cluster
+    is not available (e.g. when exporting).
+    The parameters are taken from the shard_planner dictionary
+    in corpus.json.
+    """
+    DEFAULT_SETTINGS = {
+        'target_shard_size': 20480,     # maximum desirable size of a shard, in MB
+        'min_shard_size': 256,          # minimum size of a shard made for parallel search, in MB
+        'data_nodes': None,             # number of data nodes (None: ask the cluster)
+        'cpus_per_node': None,          # processors of each data node (None: ask the cluster)
+        'number_of_replicas': None,     # None: 1 if there are several data nodes, otherwise 0
+        'sample_files': 20,             # number of files measured to estimate the sizes
+        'size_factor': 1.5,             # size of an index relative to the JSON it contains
+        'nested_doc_bytes': 50          # additional size of each nested object
+    }
+    HEAPS_EXPONENT = 0.5        # number of different words grows as (number of tokens) ** HEAPS_EXPONENT
+    WORD_STATS_BYTES = 250      # size of the statistics fields added to each word or lemma
+    WORD_FREQ_BYTES = 150       # size of a word_freq object
+
+    def __init__(self, es, settings):
+        self.es = es                # None if the cluster is not available
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if 'shard_planner' in settings:
+            self.settings.update(settings['shard_planner'])
+        self.packedFreqs = ('word_freq_layout' in settings
+                            and settings['word_freq_layout'] == 'packed')
+
+    def measure_sample(self, filenames, reader):
+        """
+        Read a random sample of the corpus files and return the numbers
+        of sentences, words etc. in it, which are later multiplied by
+        the ratio of the corpus size to the sample size. filenames
+        is a list of tuples (filename, file size). The files are read
+        with the iterative parser, so that measuring them does not
+        change the state of the reader.
+        """
+        sample = sorted(filenames)
+        if len(sample) > self.settings['sample_files']:
+            sample = random.Random(len(filenames)).sample(sample, self.settings['sample_files'])
+        counts = {
+            'files': len(sample), 'file_bytes': 0, 'json_bytes': 0, 'meta_bytes': 0,
+            'sentences': 0, 'nested_docs': 0, 'tokens': 0, 'word_bytes': 0,
+            'analyses': 0, 'doc_words': 0
+        }
+        wordTypes = set()
+        lemmata = set()
+        for fname, fileSize in sample:
+            counts['file_bytes'] += fileSize
+            counts['json_bytes'] += reader.uncompressed_size(fname)
+            counts['meta_bytes'] += len(json.dumps(reader.read_metadata(fname), ensure_ascii=False))
+            docWords = set()
+            for s in reader.iterate_file_sentences(fname):
+                counts['sentences'] += 1
+                langID = s.get('lang', 0)
+                for key in ['words', 'para_alignment', 'src_alignment', 'style_spans']:
+                    if key in s:
+                        counts['nested_docs'] += len(s[key])
+                if 'words' not in s:
+                    continue
+                for word in s['words']:
+                    if 'ana' in word:
+                        counts['nested_docs'] += len(word['ana'])
+                    if word.get('wtype') != 'word' or 'wf' not in word:
+                        continue
+                    counts['tokens'] += 1
+                    wf = word['wf'].lower()
+                    if (langID, wf) in wordTypes:
+                        docWords.add((langID, wf))
+                        continue
+                    wordTypes.add((langID, wf))
+                    docWords.add((langID, wf))
+                    counts['word_bytes'] += len(json.dumps(word, ensure_ascii=False))
+                    if 'ana' in word:
+                        counts['analyses'] += len(word['ana'])
+                        for ana in word['ana']:
+                            if 'lex' not in ana:
+                                continue
+                            # A lemma can be a list, as in Indexator.get_lemma()
+                            if type(ana['lex']) == list:
+                                for l in ana['lex']:
+                                    lemmata.add((langID, l.lower()))
+                            else:
+                                lemmata.add((langID, ana['lex'].lower()))
+            counts['doc_words'] += len(docWords)
+        counts['word_types'] = len(wordTypes)
+        counts['lemmata'] = len(lemmata)
+        return counts
+
+    def cluster_topology(self):
+        """
+        Return a tuple (number of data nodes, processors per node,
+        description of where these numbers come from).
+        """
+        nodes = self.settings['data_nodes']
+        cpus = self.settings['cpus_per_node']
+        nodesSource = cpusSource = 'settings'
+        if (nodes is None or cpus is None) and self.es is not None:
+            try:
+                dataNodes = self.es.nodes.info(node_id='data:true', metric='os')['nodes'].values()
+                if nodes is None:
+                    nodes = len(dataNodes)
+                    nodesSource = 'cluster'
+                if cpus is None and len(dataNodes) > 0:
+                    # Shards are spread evenly, so the smallest node counts
+                    cpus = min(n['os'].get('allocated_processors', n['os'].get('available_processors', 1))
+                               for n in dataNodes)
+                    cpusSource = 'cluster'
+            except TransportError as err:
+                print('Could not get the nodes of the cluster:', err)
+        if nodes is None or nodes <= 0:
+            nodes = 1
+            nodesSource = 'default'
+        if cpus is None or cpus <= 0:
+            cpus = os.cpu_count() or 1
+            cpusSource = 'this machine'
+        return nodes, cpus, 'nodes: ' + nodesSource + ', processors: ' + cpusSource
+
+    def estimate_sizes(self, counts, totalBytes, nFiles):
+        """
+        Return a dictionary {index type -> (estimated size in bytes,
+        explanation)} for the whole corpus.
+        """
+        ratio = totalBytes / max(counts['file_bytes'], 1)
+        factor = self.settings['size_factor']
+        nestedBytes = self.settings['nested_doc_bytes']
+        jsonBytes = counts['json_bytes'] * ratio
+        nestedDocs = counts['nested_docs'] * ratio
+        sentSize = jsonBytes * factor + nestedDocs * nestedBytes
+        sentReason = '{0:.1f} MB of JSON x {1} + {2:.0f} nested objects x {3} B'.format(
+            jsonBytes / (1024 * 1024), factor, nestedDocs, nestedBytes)
+
+        tokens = counts['tokens'] * ratio
+        heaps = ratio ** self.HEAPS_EXPONENT
+        wordTypes = min(counts['word_types'] * heaps, tokens)
+        lemmata = min(counts['lemmata'] * heaps, wordTypes)
+        wordBytes = counts['word_bytes'] / max(counts['word_types'], 1) + self.WORD_STATS_BYTES
+        anaPerWord = counts['analyses'] / max(counts['word_types'], 1)
+        wordSize = (wordTypes * (wordBytes * factor + (1 + anaPerWord) * nestedBytes)
+                    + lemmata * self.WORD_STATS_BYTES * factor)
+        wordReason = '{0:.0f} tokens, ~{1:.0f} word forms and ~{2:.0f} lemmata'.format(
+            tokens, wordTypes, lemmata)
+        if not self.packedFreqs:
+            # Each word and lemma has a word_freq object for each document it occurs in
+            wordFreqs = counts['doc_words'] * ratio * (1 + lemmata / max(wordTypes, 1))
+            wordSize += wordFreqs * self.WORD_FREQ_BYTES * factor
+            wordReason += ', ~{0:.0f} word_freq objects'.format(wordFreqs)
+
+        docSize = nFiles * counts['meta_bytes'] / max(counts['files'], 1) * factor
+        docReason = '{0} documents'.format(nFiles)
+        return {
+            'sentences': (sentSize, sentReason),
+            'words': (wordSize, wordReason),
+            'docs': (docSize, docReason)
+        }
+
+    def choose_shards(self, size, nodes, cpus):
+        """
+        Return a tuple (number of shards, explanation) for an index
+        of the given size in bytes.
+        """
+        sizeMB = size / (1024 * 1024)
+        bySize = max(1, math.ceil(sizeMB / self.settings['target_shard_size']))
+        reason = '{0} by size (target {1} MB)'.format(bySize, self.settings['target_shard_size'])
+        shards = bySize
+        if sizeMB > self.settings['min_shard_size']:
+            # One processor of each node is left for indexing and other requests
+            byCPU = min(nodes * max(cpus - 1, 1), int(sizeMB // self.settings['min_shard_size']))
+            reason += ', {0} for parallel search (at least {1} MB each)'.format(
+                byCPU, self.settings['min_shard_size'])
+            shards = max(shards, byCPU)
+        if shards > 1 and nodes > 1 and shards % nodes != 0:
+            shards += nodes - shards % nodes
+            reason += ', rounded up to a multiple of the number of nodes'
+        return shards, reason
+
+    def plan(self, filenames, reader):
+        """
+        Return a dictionary {index type -> index settings with the numbers
+        of shards and replicas} for the docs, words and sentences indices
+        and print the reasoning behind each choice.
+        """
+        plan = {}
+        nodes, cpus, source = self.cluster_topology()
+        replicas = self.settings['number_of_replicas']
+        replicaReason = 'from settings'
+        if replicas is None:
+            replicas = 1 if nodes > 1 else 0
+            replicaReason = 'one copy on another node' if nodes > 1 else 'no other node for a copy'
+        print('Shard planner: {0} data node(s) with {1} processor(s) each (from {2}).'.format(
+            nodes, cpus, source))
+        if len(filenames) <= 0:
+            sizes = {indexType: (0, 'no files') for indexType in ['docs', 'words', 'sentences']}
+        else:
+            counts = self.measure_sample(filenames, reader)
+            sizes = self.estimate_sizes(counts, sum(fileSize for fname, fileSize in filenames), len(filenames))
+            print('Shard planner: estimates are based on {0} of {1} files.'.format(counts['files'], len(filenames)))
+        for indexType in ['docs', 'words', 'sentences']:
+            size, sizeReason = sizes[indexType]
+            shards, shardReason = self.choose_shards(size, nodes, cpus)
+            plan[indexType] = {'number_of_shards': shards, 'number_of_replicas': replicas}
+            print('Shard planner: {0}: ~{1:.1f} MB ({2}); {3} shard(s): {4}; {5} replica(s): {6}.'.format(
+                indexType, size / (1024 * 1024), sizeReason, shards, shardReason, replicas, replicaReason))
+        return plan
@@ -0,0 +1,235 @@
+import json
+import os
+import gzip
+import random
+import argparse
+
+
+class SyntheticCorpus:
+    """
+    Generates a corpus of random documents in the tsakorpus JSON
+    format, which can be indexed without any real data, e.g. to
+    measure the performance of the indexator (see benchmark_indexator.py).
+    Word frequencies follow Zipf's law: the probability of the word
+    with rank r in the vocabulary is proportional to 1 / r ** zipf_exponent.
+    Each language has its own vocabulary. If there are several languages,
+    each document contains the same number of sentences in each of them,
+    and the sentences with the same number are aligned with each other.
+    The same seed always gives the same corpus.
+    """
+    DEFAULT_SETTINGS = {
+        'n_docs': 100,
+        'sentences_per_doc': 200,       # in each language
+        'words_per_sentence': 10,       # average number of words (without punctuation)
+        'vocabulary_size': 50000,       # number of different word forms in each language
+        'zipf_exponent': 1.0,
+        'analyses_per_word': 1,         # maximum number of analyses of one word
+        'unanalyzed_share': 0.1,        # share of the vocabulary that has no analyses
+        'para_alignment': True,         # only used if there are several languages
+        'src_alignment': False,
+        'input_format': 'json',         # json or json-gzip
+        'seed': 1
+    }
+    ALPHABET = 'abcdefghijklmnoprstuvyz'
+    POS = ['N', 'V', 'A', 'ADV', 'PRO', 'POST', 'PART']
+    SUFFIXES = ['', 'en', 'ez', 'os', 'ly', 'aš', 'yn', 'ti']
+
+    def __init__(self, languages, settings=None, wordFields=None):
+        self.languages = languages
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+        self.wordFields = []    # additional string fields of analyses, such as trans_en
+        if wordFields is not None:
+            self.wordFields = wordFields
+        self.rand = random.Random(self.settings['seed'])
+        self.vocabularies = [self.make_vocabulary() for lang in self.languages]
+        rankWeights = [1 / (r ** self.settings['zipf_exponent'])
+                       for r in range(1, self.settings['vocabulary_size'] + 1)]
+        self.cumWeights = []
+        cumWeight = 0
+        for w in rankWeights:
+            cumWeight += w
+            self.cumWeights.append(cumWeight)
+        self.numWords = 0       # number of words generated so far
+
+    def make_stem(self):
+        """
+        Return a random stem.
+        """
+        return ''.join(self.rand.choice(self.ALPHABET)
+                       for i in range(self.rand.randint(2, 7)))
+
+    def make_vocabulary(self):
+        """
+        Return a list of tuples (word form, analyses) ordered by their
+        frequency rank. Several word forms share the same stem
+        with different suffixes.
+        """
+        vocabulary = []
+        wfs = set()
+        while len(vocabulary) < self.settings['vocabulary_size']:
+            stem = self.make_stem()
+            for suffix in self.SUFFIXES:
+                wf = stem + suffix
+                if wf in wfs or len(vocabulary) >= self.settings['vocabulary_size']:
+                    continue
+                wfs.add(wf)
+                ana = []
+                if self.rand.random() >= self.settings['unanalyzed_share']:
+                    nAna = self.rand.randint(1, max(1, self.settings['analyses_per_word']))
+                    for i in range(nAna):
+                        curAna = {'lex': stem, 'gr.pos': self.rand.choice(self.POS)}
+                        if len(suffix) > 0:
+                            curAna['parts'] = stem + '-' + suffix
+                            curAna['gloss'] = 'STEM-SFX' + str(self.SUFFIXES.index(suffix))
+                            curAna['gloss_index'] = 'STEM{' + stem + '}-' + curAna['gloss'][5:] \
+                                                    + '{' + suffix + '}-'
+                        for field in self.wordFields:
+                            curAna[field] = field + '_' + stem + str(i)
+                        ana.append(curAna)
+                vocabulary.append((wf, ana))
+        self.rand.shuffle(vocabulary)
+        return vocabulary
+
+    def make_sentence(self, langID, sentNum, mediaFile):
+        """
+        Return one random sentence in the given language.
+        """
+        nWordsAvg = self.settings['words_per_sentence']
+        nWords = self.rand.randint(max(1, nWordsAvg // 2), max(1, nWordsAvg + nWordsAvg // 2))
+        self.numWords += nWords
+        vocabulary = self.vocabularies[langID]
+        words = []
+        text = ''
+        for i in range(nWords):
+            wf, ana = self.rand.choices(vocabulary, cum_weights=self.cumWeights)[0]
+            if i == 0:
+                wf = wf.capitalize()
+            elif len(text) > 0:
+                text += ' '
+            word = {
+                'wf': wf,
+                'wtype': 'word',
+                'off_start': len(text),
+                'off_end': len(text) + len(wf),
+                'next_word': len(words) + 1,
+                'sentence_index': i,
+                'sentence_index_neg': nWords - i
+            }
+            if len(ana) > 0:
+                word['ana'] = [dict(a) for a in ana]
+            words.append(word)
+            text += wf
+        words.append({
+            'wf': '.',
+            'wtype': 'punct',
+            'off_start': len(text),
+            'off_end': len(text) + 1,
+            'next_word': len(words) + 1
+        })
+        text += '.'
+        sentence = {
+            'text': text,
+            'words': words,
+            'lang': langID,
+            'meta': {'speaker': 'S' + str(sentNum % 3)}
+        }
+        if len(self.languages) > 1 and self.settings['para_alignment']:
+            sentence['para_alignment'] = [{'off_start': 0, 'off_end': len(text),
+                                           'para_id': sentNum}]
+        if self.settings['src_alignment']:
+            sentence['src_alignment'] = [{
+                'off_start_src': str(sentNum * 2.0),
+                'off_end_src': str(sentNum * 2.0 + 1.5),
+                'off_start_sent': 0,
+                'off_end_sent': len(text),
+                'mtype': 'audio',
+                'src_id': str(sentNum * 2000) + '_' + str(sentNum * 2000 + 1500),
+                'src': mediaFile
+            }]
+        return sentence
+
+    def make_doc(self, docNum):
+        """
+        Return one random document.
+        """
+        meta = {
+            'filename': 'synthetic_' + str(docNum),
+            'title': 'Synthetic document ' + str(docNum),
+            'author': 'Author ' + str(docNum % 10),
+            'genre': self.rand.choice(['dialogue', 'monologue', 'experiment']),
+            'year': str(self.rand.randint(1950, 2020))
+        }
+        mediaFile = meta['filename'] + '.mp3'
+        sentences = []
+        for langID in range(len(self.languages)):
+            for sentNum in range(self.settings['sentences_per_doc']):
+                sentences.append(self.make_sentence(langID, sentNum, mediaFile))
+        return {'meta': meta, 'sentences': sentences}
+
+    def write(self, dirOut):
+        """
+        Generate the documents and write them to dirOut.
+        """
+        if not os.path.exists(dirOut):
+            os.makedirs(dirOut)
+        for docNum in range(self.settings['n_docs']):
+            doc = self.make_doc(docNum)
+            fname = os.path.join(dirOut, 'synthetic_' + str(docNum).zfill(6))
+            if self.settings['input_format'] == 'json-gzip':
+                fOut = gzip.open(fname + '.json.gz', 'wt', encoding='utf-8')
+            else:
+                fOut = open(fname + '.json', 'w', encoding='utf-8')
+            json.dump(doc, fOut, ensure_ascii=False)
+            fOut.close()
+        print(self.settings['n_docs'], 'documents,', self.numWords, 'words written to', dirOut + '.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a random corpus in the tsakorpus JSON format.')
+    parser.add_argument('dir', nargs='?', default='../corpus/synthetic',
+                        help='directory where the documents are written')
+    parser.add_argument('--docs', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['n_docs'],
+                        help='number of documents')
+    parser.add_argument('--sentences', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['sentences_per_doc'],
+                        help='number of sentences in each language in one document')
+    parser.add_argument('--words', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['words_per_sentence'],
+                        help='average number of words in a sentence')
+    parser.add_argument('--vocabulary', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['vocabulary_size'],
+                        help='number of different word forms in each language')
+    parser.add_argument('--zipf', type=float, default=SyntheticCorpus.DEFAULT_SETTINGS['zipf_exponent'],
+                        help='exponent of the Zipfian word frequency distribution')
+    parser.add_argument('--analyses', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['analyses_per_word'],
+                        help='maximum number of analyses of one word')
+    parser.add_argument('--languages', type=int,
+                        help='number of languages (by default, all languages listed in corpus.json)')
+    parser.add_argument('--no-para', action='store_true', help='do not align the languages with each other')
+    parser.add_argument('--src', action='store_true', help='add sound alignment to all sentences')
+    parser.add_argument('--seed', type=int, default=SyntheticCorpus.DEFAULT_SETTINGS['seed'],
+                        help='seed of the random generator')
+    args = parser.parse_args()
+    with open('../conf/corpus.json', 'r', encoding='utf-8') as fSettings:
+        corpusSettings = json.load(fSettings)
+    languages = corpusSettings['languages']
+    if len(languages) <= 0:
+        languages = [corpusSettings['corpus_name']]
+    if args.languages is not None:
+        languages = [languages[i] if i < len(languages) else 'lang' + str(i)
+                     for i in range(args.languages)]
+    wordFields = []
+    if 'word_fields' in corpusSettings:
+        wordFields = corpusSettings['word_fields']
+    corpus = SyntheticCorpus(languages, settings={
+        'n_docs': args.docs,
+        'sentences_per_doc': args.sentences,
+        'words_per_sentence': args.words,
+        'vocabulary_size': args.vocabulary,
+        'zipf_exponent': args.zipf,
+        'analyses_per_word': args.analyses,
+        'para_alignment': not args.no_para,
+        'src_alignment': args.src,
+        'input_format': corpusSettings['input_format'],
+        'seed': args.seed
+    }, wordFields=wordFields)
+    corpus.write(args.dir)
@@ -0,0 +1,558 @@
+import json
+import gzip
+import os
+import shutil
+import sqlite3
+from array import array
+
+
+class DocFreqs:
+    """
+    Frequencies of words or lemmata in separate documents. The
+    records (item ID, document ID, frequency) are stored in three
+    parallel arrays in the order in which the documents were added.
+    An index that groups the records by item is built when the
+    records are read.
+    """
+    def __init__(self):
+        self.itemIDs = array('i')
+        self.dIDs = array('i')
+        self.freqs = array('i')
+        self.offsets = None      # item ID -> position of its first record in self.positions
+        self.positions = None    # record positions sorted by item ID
+
+    def add(self, dID, itemFreqs):
+        """
+        Add records for one document. itemFreqs is a dictionary
+        {item ID -> [frequency, number of sentences]}.
+        """
+        self.itemIDs.extend(itemFreqs.keys())
+        self.dIDs.extend([dID] * len(itemFreqs))
+        self.freqs.extend(freq for freq, sFreq in itemFreqs.values())
+        self.offsets = None
+
+    def remove_docs(self, dIDs):
+        """
+        Remove all records for the documents whose IDs are in dIDs.
+        """
+        keep = [i for i in range(len(self.dIDs)) if self.dIDs[i] not in dIDs]
+        self.itemIDs = array('i', (self.itemIDs[i] for i in keep))
+        self.dIDs = array('i', (self.dIDs[i] for i in keep))
+        self.freqs = array('i', (self.freqs[i] for i in keep))
+        self.offsets = None
+
+    def build_index(self, nItems):
+        """
+        Sort record positions by item ID (counting sort), keeping
+        the records of each item in the order of document IDs.
+        """
+        offsets = array('q', bytes(8 * (nItems + 1)))
+        for itemID in self.itemIDs:
+            offsets[itemID + 1] += 1
+        for i in range(nItems):
+            offsets[i + 1] += offsets[i]
+        cur = array('q', offsets)
+        positions = array('q', bytes(8 * len(self.itemIDs)))
+        for i, itemID in enumerate(self.itemIDs):
+            positions[cur[itemID]] = i
+            cur[itemID] += 1
+        self.offsets = offsets
+        self.positions = positions
+
+    def get(self, itemID, nItems):
+        """
+        Return a dictionary {document ID -> frequency} for one item.
+        """
+        if self.offsets is None or len(self.offsets) < nItems + 1:
+            self.build_index(nItems)
+        return {self.dIDs[i]: self.freqs[i]
+                for i in self.positions[self.offsets[itemID]:self.offsets[itemID + 1]]}
+
+
+class WordStats:
+    """
+    Stores word and lemma IDs and frequency statistics collected
+    by the indexator. This implementation keeps everything in memory.
+    Words and lemmata have integer IDs, which are shared by all
+    languages; outside of the statistics, they are referred to by
+    string IDs starting with 'w' or 'l' followed by the integer.
+    Lemma ID 0 ('l0') stands for "no lemma" and is counted separately
+    for each language. Counters are stored in arrays indexed by IDs.
+    """
+    ARRAY_FIELDS = ['wordLemmas', 'wordFreqs', 'wordSFreqs', 'lemmaFreqs', 'lemmaSFreqs',
+                    'noLemmaFreqs', 'noLemmaSFreqs']
+
+    def __init__(self, nLangs):
+        self.nLangs = nLangs
+        self.wordIDs = [{} for i in range(nLangs)]      # word as JSON -> its integer ID
+        self.lemmaIDs = [{} for i in range(nLangs)]     # lemma as string -> its integer ID
+        self.wordLemmas = array('i')     # word ID -> ID of its lemma (0 if none)
+        self.wordFreqs = array('q')      # word ID -> its frequency
+        self.wordSFreqs = array('q')     # word ID -> its number of sentences
+        self.lemmaFreqs = array('q', [0])    # lemma ID -> its frequency
+        self.lemmaSFreqs = array('q', [0])   # lemma ID -> its number of sentences
+        self.noLemmaFreqs = array('q', [0] * nLangs)   # language ID -> number of words without lemma
+        self.noLemmaSFreqs = array('q', [0] * nLangs)  # language ID -> number of sentences with such words
+        self.wordDocFreqs = DocFreqs()
+        self.lemmaDocFreqs = DocFreqs()
+        self.wfs = set()         # set of word forms (for sorting)
+        self.lemmata = set()     # set of lemmata (for sorting)
+        self.nextWordID = 0      # integer ID of the next new word
+        self.nextLemmaID = 1     # integer ID of the next new lemma
+
+    def word_id(self, langID, w, wf, lemma, lID):
+        """
+        Return the integer ID of a word (as JSON string). If the word
+        is new, register it together with its word form and lemma
+        (None if absent), which are used for sorting, and the integer
+        ID of its lemma (0 if none).
+        """
+        try:
+            return self.wordIDs[langID][w]
+        except KeyError:
+            pass
+        wID = self.nextWordID
+        self.nextWordID += 1
+        self.wordIDs[langID][w] = wID
+        self.wordLemmas.append(lID)
+        self.wordFreqs.append(0)
+        self.wordSFreqs.append(0)
+        if wf is not None:
+            self.wfs.add(wf)
+        if lemma is not None:
+            self.lemmata.add(lemma)
+        return wID
+
+    def lemma_id(self, langID, lemma):
+        """
+        Return the integer ID of a lemma, registering it if it is new.
+        """
+        try:
+            return self.lemmaIDs[langID][lemma]
+        except KeyError:
+            pass
+        lID = self.nextLemmaID
+        self.nextLemmaID += 1
+        self.lemmaIDs[langID][lemma] = lID
+        self.lemmaFreqs.append(0)
+        self.lemmaSFreqs.append(0)
+        return lID
+
+    def add_doc(self, dID, docWordFreqs, docLemmaFreqs):
+        """
+        Add statistics for one document. docWordFreqs and docLemmaFreqs
+        contain a dictionary {word/lemma ID -> [frequency, number of sentences]}
+        for each language.
+        """
+        for langID in range(self.nLangs):
+            for wID, (freq, sFreq) in docWordFreqs[langID].items():
+                self.wordFreqs[wID] += freq
+                self.wordSFreqs[wID] += sFreq
+            self.wordDocFreqs.add(dID, docWordFreqs[langID])
+            lemmaFreqs = docLemmaFreqs[langID]
+            if 0 in lemmaFreqs:
+                freq, sFreq = lemmaFreqs[0]
+                self.noLemmaFreqs[langID] += freq
+                self.noLemmaSFreqs[langID] += sFreq
+                lemmaFreqs = {lID: freqs for lID, freqs in lemmaFreqs.items() if lID != 0}
+            for lID, (freq, sFreq) in lemmaFreqs.items():
+                self.lemmaFreqs[lID] += freq
+                self.lemmaSFreqs[lID] += sFreq
+            self.lemmaDocFreqs.add(dID, lemmaFreqs)
+
+    def remove_docs(self, docStats):
+        """
+        Subtract statistics for previously added documents. docStats
+        is a list of tuples (document ID, docWordFreqs, docLemmaFreqs).
+        Words and lemmata that no longer occur anywhere are removed,
+        together with their word forms and lemmata used for sorting;
+        their IDs are never reused.
+        """
+        for dID, docWordFreqs, docLemmaFreqs in docStats:
+            for langID in range(self.nLangs):
+                for wID, (freq, sFreq) in docWordFreqs[langID].items():
+                    self.wordFreqs[wID] -= freq
+                    self.wordSFreqs[wID] -= sFreq
+                for lID, (freq, sFreq) in docLemmaFreqs[langID].items():
+                    if lID == 0:
+                        self.noLemmaFreqs[langID] -= freq
+                        self.noLemmaSFreqs[langID] -= sFreq
+                    else:
+                        self.lemmaFreqs[lID] -= freq
+                        self.lemmaSFreqs[lID] -= sFreq
+        dIDs = set(dID for dID, docWordFreqs, docLemmaFreqs in docStats)
+        self.wordDocFreqs.remove_docs(dIDs)
+        self.lemmaDocFreqs.remove_docs(dIDs)
+        wordsRemoved = False
+        for langID in range(self.nLangs):
+            for w in [w for w, wID in self.wordIDs[langID].items() if self.wordFreqs[wID] <= 0]:
+                del self.wordIDs[langID][w]
+                wordsRemoved = True
+            for l in [l for l, lID in self.lemmaIDs[langID].items() if self.lemmaFreqs[lID] <= 0]:
+                del self.lemmaIDs[langID][l]
+        if wordsRemoved:
+            self.collect_forms()
+
+    def collect_forms(self):
+        """
+        Collect the word forms and lemmata of the remaining words
+        again, so that the sort orders are the same as after
+        indexing the remaining documents from scratch.
+        """
+        self.wfs = set()
+        self.lemmata = set()
+        for langID in range(self.nLangs):
+            lemmaForms = {lID: l for l, lID in self.lemmaIDs[langID].items()}
+            for w, wID in self.wordIDs[langID].items():
+                wJson = json.loads(w)
+                if wJson.get('wf') is not None:
+                    self.wfs.add(wJson['wf'])
+                lID = self.wordLemmas[wID]
+                if lID > 0:
+                    self.lemmata.add(lemmaForms[lID])
+                elif 'ana' in wJson:
+                    # Analyzed words with an empty lemma
+                    self.lemmata.add('')
+
+    def item_freqs(self, langID, prefix):
+        """
+        Return the list of frequencies of all words (prefix='w')
+        or lemmata (prefix='l') of one language.
+        """
+        if prefix == 'w':
+            return [self.wordFreqs[wID] for wID in self.wordIDs[langID].values()]
+        freqs = [self.lemmaFreqs[lID] for lID in self.lemmaIDs[langID].values()]
+        if self.noLemmaFreqs[langID] > 0:
+            freqs.append(self.noLemmaFreqs[langID])
+        return freqs
+
+    def word_forms(self):
+        """
+        Return all word forms (for sorting).
+        """
+        return self.wfs
+
+    def lemma_forms(self):
+        """
+        Return all lemmata (for sorting).
+        """
+        return self.lemmata
+
+    def num_items(self):
+        """
+        Return the total number of words and lemmata with statistics.
+        """
+        return sum(len(self.wordIDs[langID]) + len(self.lemmaIDs[langID])
+                   + (1 if self.noLemmaFreqs[langID] > 0 else 0)
+                   for langID in range(self.nLangs))
+
+    def iterate_words(self, langID):
+        """
+        Iterate over all words of one language. Yield tuples
+        (word as JSON, integer word ID, lemma ID, frequency,
+        number of sentences, lemma frequency,
+        {document ID -> frequency in the document}).
+        """
+        for w, wID in self.wordIDs[langID].items():
+            lID = self.wordLemmas[wID]
+            if lID > 0:
+                lemmaFreq = self.lemmaFreqs[lID]
+            else:
+                lemmaFreq = self.noLemmaFreqs[langID]
+            yield (w, wID, 'l' + str(lID),
+                   self.wordFreqs[wID], self.wordSFreqs[wID], lemmaFreq,
+                   self.wordDocFreqs.get(wID, self.nextWordID))
+
+    def iterate_word_freqs(self, langID):
+        """
+        Iterate over all words of one language. Yield tuples
+        (word as JSON, frequency). Unlike iterate_words(), the
+        frequencies in separate documents are not collected.
+        """
+        for w, wID in self.wordIDs[langID].items():
+            yield w, self.wordFreqs[wID]
+
+    def iterate_lemmata(self, langID):
+        """
+        Iterate over all lemmata of one language. Yield tuples
+        (lemma, integer lemma ID, frequency, number of sentences,
+        {document ID -> frequency in the document}).
+        """
+        for l, lID in self.lemmaIDs[langID].items():
+            yield (l, lID, self.lemmaFreqs[lID], self.lemmaSFreqs[lID],
+                   self.lemmaDocFreqs.get(lID, self.nextLemmaID))
+
+    def save(self, fname):
+        """
+        Store the statistics in a file (gzipped JSON).
+        """
+        state = {
+            'nextWordID': self.nextWordID,
+            'nextLemmaID': self.nextLemmaID,
+            'wordIDs': self.wordIDs,
+            'lemmaIDs': self.lemmaIDs,
+            'wfs': sorted(self.wfs),
+            'lemmata': sorted(self.lemmata)
+        }
+        for field in self.ARRAY_FIELDS:
+            state[field] = getattr(self, field).tolist()
+        for field in ['wordDocFreqs', 'lemmaDocFreqs']:
+            docFreqs = getattr(self, field)
+            state[field] = [docFreqs.itemIDs.tolist(), docFreqs.dIDs.tolist(), docFreqs.freqs.tolist()]
+        fnameTmp = fname + '.tmp'
+        with gzip.open(fnameTmp, 'wt', encoding='utf-8') as fOut:
+            json.dump(state, fOut, ensure_ascii=False)
+        os.replace(fnameTmp, fname)
+
+    def load(self, fname):
+        """
+        Restore the statistics saved by save().
+        """
+        with gzip.open(fname, 'rt', encoding='utf-8') as fIn:
+            state = json.load(fIn)
+        self.nextWordID = state['nextWordID']
+        self.nextLemmaID = state['nextLemmaID']
+        self.wordIDs = state['wordIDs']
+        self.lemmaIDs = state['lemmaIDs']
+        for field in self.ARRAY_FIELDS:
+            setattr(self, field, array(getattr(self, field).typecode, state[field]))
+        for field in ['wordDocFreqs', 'lemmaDocFreqs']:
+            docFreqs = DocFreqs()
+            docFreqs.itemIDs, docFreqs.dIDs, docFreqs.freqs = (array('i', v) for v in state[field])
+            setattr(self, field, docFreqs)
+        self.wfs = set(state['wfs'])
+        self.lemmata = set(state['lemmata'])
+
+    def close(self):
+        pass
+
+
+class SQLiteWordStats(WordStats):
+    """
+    Disk-backed version of WordStats for corpora whose statistics
+    do not fit in memory. Everything is stored in an SQLite database.
+    Only bounded caches of recently used word and lemma IDs are
+    kept in memory. The database is created as a temporary file,
+    which becomes persistent after save().
+    """
+    COMMIT_EVERY = 100    # commit after this number of documents
+
+    def __init__(self, nLangs, fname, cacheSize=200000):
+        self.nLangs = nLangs
+        self.fname = fname
+        self.fnameTmp = fname + '.tmp'
+        self.cacheSize = cacheSize
+        self.wordCache = {}      # (langID, word as JSON) -> integer ID
+        self.lemmaCache = {}     # (langID, lemma) -> integer ID
+        self.nextWordID = 0
+        self.nextLemmaID = 1
+        self.nDocsUncommitted = 0
+        if os.path.exists(self.fnameTmp):
+            os.remove(self.fnameTmp)
+        self.db = None
+        self.connect()
+
+    def connect(self):
+        """
+        Open the temporary database file and create the tables.
+        """
+        self.db = sqlite3.connect(self.fnameTmp)
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('PRAGMA cache_size = -65536')     # 64 MB
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS words (
+                id INTEGER PRIMARY KEY, lang INTEGER, key TEXT, wf TEXT,
+                lemma TEXT, l_id INTEGER, freq INTEGER DEFAULT 0, sfreq INTEGER DEFAULT 0);
+            CREATE UNIQUE INDEX IF NOT EXISTS words_key ON words (lang, key);
+            CREATE TABLE IF NOT EXISTS lemmata (
+                lang INTEGER, id INTEGER, lemma TEXT, freq INTEGER DEFAULT 0, sfreq INTEGER DEFAULT 0,
+                PRIMARY KEY (lang, id));
+            CREATE UNIQUE INDEX IF NOT EXISTS lemmata_lemma ON lemmata (lang, lemma);
+            CREATE TABLE IF NOT EXISTS word_doc_freqs (
+                w_id INTEGER, d_id INTEGER, freq INTEGER,
+                PRIMARY KEY (w_id, d_id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS lemma_doc_freqs (
+                lang INTEGER, l_id INTEGER, d_id INTEGER, freq INTEGER,
+                PRIMARY KEY (lang, l_id, d_id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER);
+        """)
+
+    def word_id(self, langID, w, wf, lemma, lID):
+        try:
+            return self.wordCache[(langID, w)]
+        except KeyError:
+            pass
+        row = self.db.execute('SELECT id FROM words WHERE lang = ? AND key = ?',
+                              (langID, w)).fetchone()
+        if row is not None:
+            wID = row[0]
+        else:
+            wID = self.nextWordID
+            self.nextWordID += 1
+            self.db.execute('INSERT INTO words (id, lang, key, wf, lemma, l_id) VALUES (?, ?, ?, ?, ?, ?)',
+                            (wID, langID, w, wf, lemma, lID))
+        if len(self.wordCache) >= self.cacheSize:
+            self.wordCache = {}
+        self.wordCache[(langID, w)] = wID
+        return wID
+
+    def lemma_id(self, langID, lemma):
+        try:
+            return self.lemmaCache[(langID, lemma)]
+        except KeyError:
+            pass
+        row = self.db.execute('SELECT id FROM lemmata WHERE lang = ? AND lemma = ?',
+                              (langID, lemma)).fetchone()
+        if row is not None:
+            lID = row[0]
+        else:
+            lID = self.nextLemmaID
+            self.nextLemmaID += 1
+            self.db.execute('INSERT INTO lemmata (lang, id, lemma) VALUES (?, ?, ?)',
+                            (langID, lID, lemma))
+        if len(self.lemmaCache) >= self.cacheSize:
+            self.lemmaCache = {}
+        self.lemmaCache[(langID, lemma)] = lID
+        return lID
+
+    def add_doc(self, dID, docWordFreqs, docLemmaFreqs):
+        for langID in range(self.nLangs):
+            wordRows = [(freq, sFreq, wID)
+                        for wID, (freq, sFreq) in docWordFreqs[langID].items()]
+            lemmaRows = [(langID, lID, freq, sFreq)
+                         for lID, (freq, sFreq) in docLemmaFreqs[langID].items()]
+            self.db.executemany('UPDATE words SET freq = freq + ?, sfreq = sfreq + ? WHERE id = ?',
+                                wordRows)
+            self.db.executemany('INSERT INTO word_doc_freqs VALUES (?, ?, ?)',
+                                ((wID, dID, freq) for freq, sFreq, wID in wordRows))
+            # Lemma 0 ("no lemma") is not registered with lemma_id()
+            self.db.executemany('INSERT INTO lemmata (lang, id, freq, sfreq) VALUES (?, ?, ?, ?) '
+                                'ON CONFLICT (lang, id) DO UPDATE SET freq = freq + excluded.freq, '
+                                'sfreq = sfreq + excluded.sfreq',
+                                lemmaRows)
+            self.db.executemany('INSERT INTO lemma_doc_freqs VALUES (?, ?, ?, ?)',
+                                ((langID, lID, dID, freq) for langID, lID, freq, sFreq in lemmaRows))
+        self.nDocsUncommitted += 1
+        if self.nDocsUncommitted >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.nDocsUncommitted = 0
+
+    def remove_docs(self, docStats):
+        for dID, docWordFreqs, docLemmaFreqs in docStats:
+            for langID in range(self.nLangs):
+                for wID, (freq, sFreq) in docWordFreqs[langID].items():
+                    self.db.execute('UPDATE words SET freq = freq - ?, sfreq = sfreq - ? WHERE id = ?',
+                                    (freq, sFreq, wID))
+                    self.db.execute('DELETE FROM word_doc_freqs WHERE w_id = ? AND d_id = ?',
+                                    (wID, dID))
+                for lID, (freq, sFreq) in docLemmaFreqs[langID].items():
+                    self.db.execute('UPDATE lemmata SET freq = freq - ?, sfreq = sfreq - ? '
+                                    'WHERE lang = ? AND id = ?',
+                                    (freq, sFreq, langID, lID))
+                    self.db.execute('DELETE FROM lemma_doc_freqs WHERE lang = ? AND l_id = ? AND d_id = ?',
+                                    (langID, lID, dID))
+        self.db.execute('DELETE FROM words WHERE freq <= 0')
+        self.db.execute('DELETE FROM lemmata WHERE freq <= 0')
+        self.db.commit()
+        self.wordCache = {}
+        self.lemmaCache = {}
+
+    def item_freqs(self, langID, prefix):
+        if prefix == 'w':
+            cur = self.db.execute('SELECT freq FROM words WHERE lang = ? AND freq > 0', (langID,))
+        else:
+            cur = self.db.execute('SELECT freq FROM lemmata WHERE lang = ? AND freq > 0', (langID,))
+        return [freq for freq, in cur]
+
+    def word_forms(self):
+        return (wf for wf, in self.db.execute('SELECT DISTINCT wf FROM words WHERE wf IS NOT NULL'))
+
+    def lemma_forms(self):
+        return (l for l, in self.db.execute('SELECT DISTINCT lemma FROM words WHERE lemma IS NOT NULL'))
+
+    def num_items(self):
+        return (self.db.execute('SELECT COUNT(*) FROM words WHERE freq > 0').fetchone()[0]
+                + self.db.execute('SELECT COUNT(*) FROM lemmata WHERE freq > 0').fetchone()[0])
+
+    @staticmethod
+    def merge_doc_freqs(itemCursor, docCursor):
+        """
+        Join rows of two cursors ordered by item ID: each item
+        row gets a dictionary {document ID -> frequency} built
+        from the rows of the second cursor.
+        """
+        docRow = next(docCursor, None)
+        for row in itemCursor:
+            docFreqs = {}
+            while docRow is not None and docRow[0] < row[0]:
+                docRow = next(docCursor, None)
+            while docRow is not None and docRow[0] == row[0]:
+                docFreqs[docRow[1]] = docRow[2]
+                docRow = next(docCursor, None)
+            yield row, docFreqs
+
+    def iterate_words(self, langID):
+        self.db.commit()
+        itemCursor = self.db.execute(
+            'SELECT w.id, w.key, w.l_id, w.freq, w.sfreq, l.freq FROM words w '
+            'LEFT JOIN lemmata l ON l.lang = w.lang AND l.id = w.l_id '
+            'WHERE w.lang = ? ORDER BY w.id', (langID,))
+        docCursor = self.db.execute(
+            'SELECT d.w_id, d.d_id, d.freq FROM word_doc_freqs d '
+            'JOIN words w ON w.id = d.w_id WHERE w.lang = ? ORDER BY d.w_id, d.d_id', (langID,))
+        for (wID, w, lID, freq, sFreq, lemmaFreq), docFreqs in self.merge_doc_freqs(itemCursor, docCursor):
+            yield w, wID, 'l' + str(lID), freq, sFreq, lemmaFreq, docFreqs
+
+    def iterate_word_freqs(self, langID):
+        self.db.commit()
+        return iter(self.db.execute('SELECT key, freq FROM words WHERE lang = ? ORDER BY id', (langID,)))
+
+    def iterate_lemmata(self, langID):
+        self.db.commit()
+        itemCursor = self.db.execute(
+            'SELECT id, lemma, freq, sfreq FROM lemmata WHERE lang = ? AND id > 0 ORDER BY id',
+            (langID,))
+        docCursor = self.db.execute(
+            'SELECT l_id, d_id, freq FROM lemma_doc_freqs WHERE lang = ? AND l_id > 0 ORDER BY l_id, d_id',
+            (langID,))
+        for (lID, l, freq, sFreq), docFreqs in self.merge_doc_freqs(itemCursor, docCursor):
+            yield l, lID, freq, sFreq, docFreqs
+
+    def save(self, fname=None):
+        """
+        Make the database persistent: move it from the temporary
+        file to the permanent one.
+        """
+        self.db.executemany('INSERT OR REPLACE INTO info VALUES (?, ?)',
+                            [('nextWordID', self.nextWordID), ('nextLemmaID', self.nextLemmaID)])
+        self.db.commit()
+        self.db.close()
+        os.replace(self.fnameTmp, self.fname)
+        shutil.copyfile(self.fname, self.fnameTmp)
+        self.connect()
+
+    def load(self, fname=None):
+        """
+        Continue working with a database saved by save(). The changes
+        are made in a temporary copy until the next save().
+        """
+        self.db.close()
+        shutil.copyfile(self.fname, self.fnameTmp)
+        self.connect()
+        info = dict(self.db.execute('SELECT key, value FROM info').fetchall())
+        self.nextWordID = info['nextWordID']
+        self.nextLemmaID = info['nextLemmaID']
+        self.wordCache = {}
+        self.lemmaCache = {}
+
+    def close(self):
+        """
+        Close the database and remove the temporary file.
+        """
+        if self.db is None:
+            return
+        self.db.close()
+        self.db = None
+        if os.path.exists(self.fnameTmp):
+            os.remove(self.fnameTmp)
@@ -0,0 +1,164 @@
+"""
+Compare two storage layouts of the frequencies of words in individual
+documents: word_freq child objects (word_freq_layout = "join") and
+frequencies packed into the word objects (word_freq_layout = "packed").
+Index the same corpus twice under different corpus names, once with
+each layout, and run this script from the search directory:
+
+python3 benchmark_word_freqs.py corpus_join corpus_packed
+
+The script prints the size of the words index for each layout and
+the latency of subcorpus word queries, which are made with the same
+InterfaceQueryParser code as in the web interface.
+"""
+
+from elasticsearch import Elasticsearch
+from elasticsearch.client import IndicesClient
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+sys.path.insert(0, 'web_app')
+from corpus_settings import CorpusSettings
+from search_engine.query_parsers import InterfaceQueryParser
+
+SETTINGS_DIR = '../conf'
+
+
+class WordFreqBenchmark:
+    """
+    Measures the index size and subcorpus word query latency
+    for two copies of a corpus indexed with different layouts.
+    """
+    LAYOUTS = ['join', 'packed']
+
+    def __init__(self, corpusNames, nQueries=50, nDocs=100, seed=1):
+        self.settings = CorpusSettings()
+        self.settings.load_settings(os.path.join(SETTINGS_DIR, 'corpus.json'),
+                                    os.path.join(SETTINGS_DIR, 'categories.json'))
+        if self.settings.elastic_url is not None and len(self.settings.elastic_url) > 0:
+            self.es = Elasticsearch([self.settings.elastic_url], timeout=600)
+        else:
+            self.es = Elasticsearch(timeout=600)
+        self.es_ic = IndicesClient(self.es)
+        self.corpusNames = dict(zip(self.LAYOUTS, corpusNames))
+        self.nQueries = nQueries
+        self.nDocs = nDocs
+        self.rand = random.Random(seed)
+        self.queryParsers = {}
+        for layout in self.LAYOUTS:
+            settings = copy.deepcopy(self.settings)
+            settings.word_freq_layout = layout
+            self.queryParsers[layout] = InterfaceQueryParser(SETTINGS_DIR, settings)
+
+    def index_size(self, layout):
+        """
+        Return the number of objects in the words index and the size
+        of its primary shards in bytes. If the name is an alias of a
+        versioned index, the statistics of the index it points to
+        are returned.
+        """
+        index = self.corpusNames[layout] + '.words'
+        stats = self.es_ic.stats(index=index, metric='docs,store')
+        primaries = stats['_all']['primaries']
+        return primaries['docs']['count'], primaries['store']['size_in_bytes']
+
+    def sample_words(self):
+        """
+        Return a list of (language, word form) pairs of random words.
+        The same words are used for both layouts.
+        """
+        esQuery = {
+            'query': {
+                'function_score': {
+                    'query': {'term': {'wtype': 'word'}},
+                    'random_score': {'seed': self.rand.randint(1, 100000), 'field': '_seq_no'}
+                }
+            },
+            '_source': ['lang', 'wf'],
+            'size': self.nQueries
+        }
+        hits = self.es.search(index=self.corpusNames['join'] + '.words', body=esQuery)
+        return [(self.settings.languages[hit['_source']['lang']], hit['_source']['wf'])
+                for hit in hits['hits']['hits']
+                if 'wf' in hit['_source'] and 'lang' in hit['_source']]
+
+    def sample_subcorpus(self):
+        """
+        Return a list of random document IDs.
+        """
+        nDocs = self.es.count(index=self.corpusNames['join'] + '.docs')['count']
+        return self.rand.sample(range(nDocs), min(self.nDocs, nDocs))
+
+    def run_queries(self, layout, words, docIDs, groupBy='word'):
+        """
+        Run subcorpus word queries for the given words and return
+        the list of latencies in milliseconds (the time reported by
+        Elasticsearch) and the list of total frequencies found.
+        """
+        latencies = []
+        freqs = []
+        for lang, wf in words:
+            htmlQuery = {'lang': lang, 'lang1': lang, 'wf1': wf, 'n_words': 1,
+                         'doc_ids': docIDs}
+            esQuery = self.queryParsers[layout].html2es(htmlQuery, searchOutput='words',
+                                                        groupBy=groupBy, sortOrder='freq',
+                                                        query_size=10)
+            response = self.es.search(index=self.corpusNames[layout] + '.words', body=esQuery,
+                                      request_cache=False)
+            latencies.append(response['took'])
+            freqs.append(response['aggregations']['agg_freq']['value'])
+        return latencies, freqs
+
+    @staticmethod
+    def percentile(values, p):
+        """
+        Return the p-th percentile of a list of numbers.
+        """
+        values = sorted(values)
+        if len(values) <= 0:
+            return 0
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def run(self):
+        """
+        Print the index sizes and the query latencies for both layouts.
+        """
+        for layout in self.LAYOUTS:
+            nObjects, size = self.index_size(layout)
+            print('{0}: {1} objects in the words index, {2:.1f} MB.'.format(
+                layout, nObjects, size / (1024 * 1024)))
+        words = self.sample_words()
+        docIDs = self.sample_subcorpus()
+        print(len(words), 'words,', len(docIDs), 'documents in the subcorpus.')
+        for groupBy in ['word', 'lemma']:
+            results = {}
+            for layout in self.LAYOUTS:
+                # The first run warms up the caches
+                self.run_queries(layout, words, docIDs, groupBy=groupBy)
+                t1 = time.time()
+                latencies, freqs = self.run_queries(layout, words, docIDs, groupBy=groupBy)
+                results[layout] = freqs
+                print('{0}, grouped by {1}: median {2} ms, 90th percentile {3} ms, '
+                      'total {4:.2f} s.'.format(layout, groupBy,
+                                                self.percentile(latencies, 50),
+                                                self.percentile(latencies, 90),
+                                                time.time() - t1))
+            if results['join'] != results['packed']:
+                print('Warning: the layouts returned different frequencies.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the word_freq storage layouts '
+                                                 'of two copies of a corpus.')
+    parser.add_argument('corpus_join', help='name of the corpus indexed with word_freq_layout = "join"')
+    parser.add_argument('corpus_packed', help='name of the corpus indexed with word_freq_layout = "packed"')
+    parser.add_argument('--queries', type=int, default=50, help='number of words to search for')
+    parser.add_argument('--docs', type=int, default=100, help='number of documents in the subcorpus')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    benchmark = WordFreqBenchmark([args.corpus_join, args.corpus_packed],
+                                  nQueries=args.queries, nDocs=args.docs, seed=args.seed)
+    benchmark.run()
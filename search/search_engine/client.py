@@ -1,8 +1,12 @@
 from elasticsearch import Elasticsearch, helpers
 from elasticsearch.client import IndicesClient
+from elasticsearch.exceptions import TransportError
+from collections import OrderedDict
 import json
 import os
+import copy
 import time
+import threading
 from .query_parsers import InterfaceQueryParser
 
 
@@ -24,6 +28,7 @@ class SearchClient:
     """
     Contains methods for querying the corpus database.
     """
+    DOC_CACHE_CHECK_INTERVAL = 10   # minimum number of seconds between checks if the docs index has changed
 
     def __init__(self, settings_dir, settings):
         self.settings = settings
@@ -41,6 +46,13 @@ class SearchClient:
         self.query_log = []
         # Logging is only switched temporarily when the user clicks on
         # "show query" or "show response" buttons in debug mode.
+        # Metadata of recently used documents (document ID -> _source),
+        # least recently used first. Each process has its own cache, which
+        # is cleared when the docs index changes.
+        self.docCache = OrderedDict()
+        self.docCacheLock = threading.Lock()
+        self.docIndexState = None
+        self.lastDocIndexCheck = 0
 
     def start_query_logging(self):
         """
@@ -120,6 +132,34 @@ class SearchClient:
                                     query=esQuery)
         return iterator
 
+    @log_if_needed
+    def get_ngrams(self, esQuery):
+        """
+        Retrieve hits from the ngrams index, which contains
+        the frequencies of pairs of adjacent words in each document.
+        """
+        if self.settings.query_timeout > 0:
+            hits = self.es.search(index=self.name + '.ngrams',
+                                  body=esQuery, request_timeout=self.settings.query_timeout)
+        else:
+            hits = self.es.search(index=self.name + '.ngrams',
+                                  body=esQuery)
+        return hits
+
+    @log_if_needed
+    def get_word_meta(self, esQuery):
+        """
+        Retrieve hits from the word_meta index, which contains
+        the frequencies of words and lemmata by metafield values.
+        """
+        if self.settings.query_timeout > 0:
+            hits = self.es.search(index=self.name + '.word_meta',
+                                  body=esQuery, request_timeout=self.settings.query_timeout)
+        else:
+            hits = self.es.search(index=self.name + '.word_meta',
+                                  body=esQuery)
+        return hits
+
     def get_sentence_by_id(self, sentId):
         esQuery = {'query': {'term': {'_id': sentId}}}
         hits = self.es.search(index=self.name + '.sentences',
@@ -138,6 +178,89 @@ class SearchClient:
                               body=esQuery)
         return hits
 
+    def docs_index_state(self):
+        """
+        Return a tuple that changes whenever the docs index changes:
+        the names and UUIDs of the indices behind it (they change when
+        the corpus is reindexed or an alias is switched to a new version)
+        and the numbers of documents and of indexing and delete operations
+        (they change when the corpus is updated incrementally).
+        """
+        stats = self.es_ic.stats(index=self.name + '.docs', metric='docs,indexing')
+        state = []
+        for index in sorted(stats['indices']):
+            primaries = stats['indices'][index]['primaries']
+            state.append((index, stats['indices'][index].get('uuid'),
+                          primaries['docs']['count'],
+                          primaries['indexing']['index_total'],
+                          primaries['indexing']['delete_total']))
+        return tuple(state)
+
+    def check_doc_cache(self):
+        """
+        Clear the document metadata cache if the docs index has changed
+        since the previous check. The index is checked at most once
+        in DOC_CACHE_CHECK_INTERVAL seconds.
+        """
+        if time.time() - self.lastDocIndexCheck < self.DOC_CACHE_CHECK_INTERVAL:
+            return
+        self.lastDocIndexCheck = time.time()
+        try:
+            state = self.docs_index_state()
+        except TransportError:
+            state = None
+        if state is None or state != self.docIndexState:
+            with self.docCacheLock:
+                self.docCache.clear()
+            self.docIndexState = state
+
+    def get_docs_by_ids(self, docIds):
+        """
+        Return a dictionary {document ID (string) -> metadata} for
+        the documents with the given IDs. The metadata is taken from
+        the cache if possible; all missing documents are retrieved
+        with one mget request and added to the cache. Documents that
+        do not exist are left out. The dictionaries returned are copies,
+        so they can be changed by the caller.
+        """
+        self.check_doc_cache()
+        docs = {}
+        missingIds = []
+        with self.docCacheLock:
+            for docId in docIds:
+                docId = str(docId)
+                if docId in docs or docId in missingIds:
+                    continue
+                if docId in self.docCache:
+                    self.docCache.move_to_end(docId)
+                    docs[docId] = self.docCache[docId]
+                else:
+                    missingIds.append(docId)
+        if len(missingIds) > 0:
+            response = self.es.mget(index=self.name + '.docs',
+                                    body={'ids': missingIds})
+            with self.docCacheLock:
+                for doc in response['docs']:
+                    if not doc.get('found', False) or '_source' not in doc:
+                        continue
+                    docs[doc['_id']] = doc['_source']
+                    if self.settings.doc_cache_size > 0:
+                        self.docCache[doc['_id']] = doc['_source']
+                        self.docCache.move_to_end(doc['_id'])
+                while len(self.docCache) > max(self.settings.doc_cache_size, 0):
+                    self.docCache.popitem(last=False)
+        return {docId: copy.deepcopy(meta) for docId, meta in docs.items()}
+
+    def get_doc_meta(self, docId):
+        """
+        Return the metadata of one document (a copy taken from the cache,
+        if it is there), or None if there is no such document.
+        """
+        docs = self.get_docs_by_ids([docId])
+        if str(docId) not in docs:
+            return None
+        return docs[str(docId)]
+
     def get_n_words(self):
         """
         Return total number of words in the primary language in the corpus.
@@ -11,8 +11,27 @@ class InterfaceQueryParser:
     rxGlossQueryQuant = re.compile('^\\(([^()]+)\\)([*+?])$')
     rxGlossQuerySrc = re.compile('^([^{}]*)\\{([^{}]*)\\}$')
     rxFieldNum = re.compile('^([^0-9]+)([0-9]+)$')
+    rxItemID = re.compile('^[wl][0-9]+$')
     rxNumber = re.compile('^(?:0|-?[1-9][0-9]*)$')
     maxQuerySize = 500  # maximum number of hits to be requested
+    maxNgramItems = 5000    # maximum number of words that fit a query word or are found in the n-gram index
+    ngramSentsPrecision = 40000     # sentence counts from the n-gram index are exact up to this number
+
+    # Scripts for subcorpus word queries with packed word frequencies
+    # (word_freq_layout = "packed"). Each value of d_freqs contains
+    # a document ID in its upper 32 bits and the frequency of the word
+    # in that document in the lower 32 bits. params.dids is a sorted
+    # list of the subcorpus document IDs.
+    scriptSubcorpusFreq = 'long s = 0; for (long v : doc["d_freqs"]) { ' \
+                          'if (Collections.binarySearch(params.dids, (int) (v >>> 32)) >= 0) ' \
+                          '{ s += v & 0xFFFFFFFFL; } } return s;'
+    scriptSubcorpusNDocs = 'long n = 0; for (long v : doc["d_freqs"]) { ' \
+                           'if (Collections.binarySearch(params.dids, (int) (v >>> 32)) >= 0) ' \
+                           '{ n += 1; } } return n;'
+    scriptSubcorpusDIDs = 'List d = new ArrayList(); for (long v : doc["d_freqs"]) { ' \
+                          'int dID = (int) (v >>> 32); ' \
+                          'if (Collections.binarySearch(params.dids, dID) >= 0) ' \
+                          '{ d.add(dID); } } return d;'
 
     dictOperators = {',': 'must',
                      '&': 'must',
@@ -46,6 +65,7 @@ class InterfaceQueryParser:
         #     self.gramDict[g] = 'ana.gr.' + self.gramDict[g]
 
         self.maxFreqRank = 10000    # Number of buckets for queries with rank aggregation
+        self.packedFreqs = (self.settings.word_freq_layout == 'packed')
 
     @staticmethod
     def find_operator(strQuery, start=0, end=-1, glossField=False):
@@ -396,6 +416,10 @@ class InterfaceQueryParser:
             # We need the buckets, not the hits
             query_from = 0
 
+        if subcorpus and self.packedFreqs:
+            return self.packed_subcorpus_word_query(innerQuery, query_size, sortOrder,
+                                                    randomSeed, docIDs, groupBy,
+                                                    order, subAggregations)
         if not subcorpus:
             if sortOrder == 'random':
                 innerQuery = self.make_random(innerQuery, randomSeed=randomSeed)
@@ -457,6 +481,55 @@ class InterfaceQueryParser:
         # print(esQuery)
         return esQuery
 
+    def packed_subcorpus_word_query(self, innerQuery, query_size, sortOrder, randomSeed,
+                                    docIDs, groupBy, order, subAggregations):
+        """
+        Make a subcorpus word query for a corpus where the frequencies
+        of words in individual documents are packed into the word objects
+        (word_freq_layout = "packed"). Instead of searching word_freq
+        objects, search for the words that occur in the subcorpus and
+        sum up their frequencies in the subcorpus documents with scripts.
+        The aggregations have the same names as in the query for
+        word_freq objects.
+        """
+        params = {'dids': sorted(set(docIDs))}
+        innerPackedQuery = {
+            'bool': {
+                'must': [innerQuery],
+                'filter': [{
+                    'terms': {'dids': params['dids']}
+                }]
+            }
+        }
+        if sortOrder == 'random':
+            innerPackedQuery = self.make_random(innerPackedQuery, randomSeed=randomSeed)
+        freqScript = {'source': self.scriptSubcorpusFreq, 'params': params}
+        mainAgg = {'agg_freq': {'sum': {'script': freqScript}},
+                   'agg_ndocs': {'cardinality': {'script': {'source': self.scriptSubcorpusDIDs,
+                                                            'params': params}}}}
+        if groupBy == 'lemma':
+            idField = 'l_id'
+        else:
+            idField = 'w_id'
+        mainAgg['agg_group_by_word'] = {
+            'terms': {
+                'field': idField,
+                'size': query_size
+            }
+        }
+        mainAgg['agg_noccurrences'] = {'cardinality': {'field': idField}}
+        if subAggregations is None:
+            subAggregations = {}
+        subAggregations['subagg_freq'] = {'sum': {'script': freqScript}}
+        # The number of documents cannot be taken from doc_count
+        # because each bucket contains words, not word_freq objects
+        subAggregations['subagg_ndocs'] = {'sum': {'script': {'source': self.scriptSubcorpusNDocs,
+                                                              'params': params}}}
+        mainAgg['agg_group_by_word']['aggs'] = subAggregations
+        if order is not None:
+            mainAgg['agg_group_by_word']['terms']['order'] = order
+        return {'query': innerPackedQuery, 'size': 0, 'aggs': mainAgg}
+
     def full_word_query(self, queryDict, query_from=0, query_size=10, sortOrder='random',
                         randomSeed=None, lang=-1, groupBy='word', after_key=None):
         """
@@ -1210,6 +1283,164 @@ class InterfaceQueryParser:
                 newQuery[k] = v
         return newQuery
 
+    def adjacent_query_words(self, htmlQuery, constraints):
+        """
+        Check if a two-word query can be answered with the n-gram index,
+        i.e. the words have to be adjacent, none of them is negative
+        and there are no sentence-level requirements. Return a tuple
+        with the numbers of the left and the right query word if it
+        can, None otherwise.
+        """
+        if (not self.settings.ngram_index or constraints is None
+                or 'n_words' not in htmlQuery or int(htmlQuery['n_words']) != 2):
+            return None
+        if list(constraints) != [(1, 2)]:
+            return None
+        distFrom, distTo = constraints[(1, 2)].get('from'), constraints[(1, 2)].get('to')
+        if distFrom != distTo or distFrom not in (-1, 1):
+            return None
+        if 'lang2' in htmlQuery and htmlQuery['lang2'] != htmlQuery.get('lang1'):
+            return None
+        for k, v in htmlQuery.items():
+            if k in ('sent_ids', 'para_ids', 'negq1', 'negq2'):
+                return None
+            if k == 'txt' and len(v) > 0:
+                return None
+            if (k.startswith('sent_meta_')
+                    and (type(v) != str or (len(v) > 0 and self.rxStars.search(v) is None))):
+                return None
+            if (k.startswith('sentence_index') and len(v) > 0
+                    and self.rxNumber.search(v) is not None and int(v) != 0):
+                return None
+        if distFrom == -1:
+            # The second word follows the first one
+            return 1, 2
+        return 2, 1
+
+    def constrained_word_fields(self, htmlQuery, nWord):
+        """
+        Return the set of fields (without the number) that restrict
+        the query word with the number nWord.
+        """
+        fields = set()
+        for k, v in htmlQuery.items():
+            mFieldNum = self.rxFieldNum.search(k)
+            if (mFieldNum is None or mFieldNum.group(2) != str(nWord)
+                    or mFieldNum.group(1) in ('lang', 'negq', 'wtype', 'sentence_index')):
+                continue
+            if type(v) == str and (self.rxStars.search(v) is not None
+                                   or (mFieldNum.group(1) == 'n_ana' and v == 'any')):
+                continue
+            fields.add(mFieldNum.group(1))
+        return fields
+
+    def word_meta_item_id(self, htmlQuery, nWord):
+        """
+        If the query word with the number nWord is only restricted
+        by the ID of one word or one lemma (e.g. when the statistics
+        are opened from the word or lemma table), return the ID.
+        Return None otherwise.
+        """
+        fields = self.constrained_word_fields(htmlQuery, nWord)
+        if len(fields) != 1:
+            return None
+        field = fields.pop()
+        if field not in ('w_id', 'l_id'):
+            return None
+        itemID = htmlQuery[field + str(nWord)]
+        if type(itemID) != str or self.rxItemID.search(itemID) is None or itemID[0] != field[0]:
+            return None
+        return itemID
+
+    def word_ids_query(self, htmlQuery, nWord):
+        """
+        Make an ES query for the words index that finds the IDs of the words
+        that fit the query word with the number nWord. Return None if any
+        word fits it.
+        """
+        wordQuery = self.remove_non_first_words(self.swap_query_words(1, nWord, htmlQuery))
+        if len(self.constrained_word_fields(wordQuery, 1)) <= 0:
+            return None
+        wordQuery['n_words'] = 1
+        if 'lang1' in htmlQuery:
+            wordQuery['lang1'] = htmlQuery['lang1']
+        if 'doc_ids' in wordQuery:
+            del wordQuery['doc_ids']
+        esQuery = self.html2es(wordQuery, sortOrder='no', searchOutput='words')
+        return {'query': esQuery['query'], 'size': self.maxNgramItems + 1, '_source': False}
+
+    def ngram_query(self, wordIDs, nGroup=1, lang=-1, docIDs=None, groupBy='word'):
+        """
+        Make an ES query for the ngrams index that finds the pairs of adjacent
+        words. wordIDs is a list with the IDs of the words that fit the left
+        and the right query word (None if any word fits). If groupBy is 'word'
+        or 'lemma', group the pairs by the word or the lemma in the position
+        nGroup (1 or 2); otherwise, only count their occurrences.
+        Sentences are counted by their IDs, so that a sentence where
+        several pairs fit the query is counted once.
+        """
+        queryFilter = []
+        for i in range(2):
+            if wordIDs[i] is not None:
+                queryFilter.append({'terms': {'w' + str(i + 1) + '_id': wordIDs[i]}})
+        if lang >= 0:
+            queryFilter.append({'term': {'lang': lang}})
+        if docIDs is not None:
+            queryFilter.append({'terms': {'d_id': docIDs}})
+        # Words without analyses are not excluded in lemma search: as in
+        # the sentence search, they are counted under the lemma ID l0
+        query = {'bool': {'filter': queryFilter}}
+        esQuery = {
+            'query': query,
+            'size': 0,
+            'aggs': {
+                'agg_freq': {'sum': {'field': 'freq'}},
+                'agg_nsents': {'cardinality': {'field': 's_ids',
+                                               'precision_threshold': self.ngramSentsPrecision}},
+                'agg_ndocs': {'cardinality': {'field': 'd_id'}}
+            }
+        }
+        if groupBy not in ('word', 'lemma'):
+            return esQuery
+        groupAgg = {
+            'terms': {
+                'field': groupBy[0] + str(nGroup) + '_id',
+                'size': self.maxNgramItems
+            },
+            'aggs': {
+                'subagg_freq': {'sum': {'field': 'freq'}},
+                'subagg_nsents': {'cardinality': {'field': 's_ids',
+                                                  'precision_threshold': self.ngramSentsPrecision}},
+                'subagg_ndocs': {'cardinality': {'field': 'd_id'}}
+            }
+        }
+        if groupBy == 'lemma':
+            groupAgg['aggs']['subagg_nforms'] = {'cardinality': {'field': 'w' + str(nGroup) + '_id'}}
+        esQuery['aggs']['agg_group_by_word'] = groupAgg
+        return esQuery
+
+    def word_meta_query(self, itemIDs, metaField, values):
+        """
+        Make an ES query for the word_meta index that finds the frequencies
+        of the words or lemmata with the given IDs in the documents with
+        each of the given values of a document-level metafield.
+        """
+        itemIDs = sorted(set(itemIDs))
+        values = sorted(set(str(v) for v in values))
+        return {
+            'query': {
+                'bool': {
+                    'filter': [
+                        {'terms': {'item_id': itemIDs}},
+                        {'term': {'field': metaField}},
+                        {'terms': {'value': values}}
+                    ]
+                }
+            },
+            'size': len(itemIDs) * len(values),
+            '_source': ['item_id', 'value', 'freq', 'n_docs']
+        }
+
 
 if __name__ == '__main__':
     iqp = InterfaceQueryParser('../../conf')
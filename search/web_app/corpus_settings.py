@@ -94,10 +94,14 @@ class CorpusSettings:
         self.regex_simple_search = None
         self.search_remove_whitespaces = True
         self.detect_lemma_queries = False
+        self.word_freq_layout = 'join'
+        self.ngram_index = False
+        self.word_meta_tables = False
 
         # Server configuration
         self.session_cookie_domain = None
         self.query_log = True
+        self.doc_cache_size = 1000      # number of documents whose metadata is cached by each process
 
         # Statistics calculated at runtime
         self.corpus_size = 0
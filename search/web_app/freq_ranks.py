@@ -0,0 +1,127 @@
+"""
+Contains functions that calculate frequency ranks and quantiles of
+words or lemmata and the rank labels shown to the user in word search
+results. They are used both by the indexator, for the whole corpus,
+and by the web app, for the words collected from the sentences found
+by a multi-word query. If NumPy is installed, it is used for
+large lists of frequencies.
+"""
+
+
+import math
+try:
+    import numpy
+except ImportError:
+    # The pure Python implementation is used instead
+    numpy = None
+
+
+QUANTILES = [0.03, 0.04, 0.05, 0.1, 0.15, 0.2, 0.25, 0.5]
+NUMPY_THRESHOLD = 1000      # NumPy is only faster for longer lists
+
+
+def sorted_freqs(freqs):
+    """
+    Return the frequencies sorted in descending order.
+    """
+    if numpy is not None and len(freqs) >= NUMPY_THRESHOLD:
+        freqsSorted = numpy.sort(numpy.asarray(freqs, dtype=numpy.int64))[::-1]
+        return freqsSorted.tolist()
+    return sorted(freqs, reverse=True)
+
+
+def freq_ranks(freqsSorted, tieRank='middle'):
+    """
+    Calculate frequency ranks for a list of frequencies sorted in
+    descending order. Return a dictionary {frequency -> rank}.
+    Items with equal frequencies share the rank, which is the position
+    of the middle item of the group (tieRank='middle') or of its first
+    item (tieRank='first'). Zero frequencies get no rank.
+    """
+    freqToRank = {}
+    if numpy is not None and len(freqsSorted) >= NUMPY_THRESHOLD:
+        # Frequencies are negated because numpy.unique() sorts in ascending order
+        negFreqs, starts, counts = numpy.unique(-numpy.asarray(freqsSorted, dtype=numpy.int64),
+                                                return_index=True, return_counts=True)
+        if tieRank == 'middle':
+            starts = starts + counts // 2
+        freqToRank = dict(zip((-negFreqs).tolist(), starts.tolist()))
+        freqToRank.pop(0, None)
+        return freqToRank
+    prevFreq = 0
+    prevRank = 0
+    for i in range(len(freqsSorted)):
+        v = freqsSorted[i]
+        if v != prevFreq:
+            if prevFreq != 0:
+                freqToRank[prevFreq] = prevRank
+                if tieRank == 'middle':
+                    freqToRank[prevFreq] += (i - prevRank) // 2
+            prevRank = i
+            prevFreq = v
+    if prevFreq != 0:
+        freqToRank[prevFreq] = prevRank
+        if tieRank == 'middle':
+            freqToRank[prevFreq] += (len(freqsSorted) - prevRank) // 2
+    return freqToRank
+
+
+def freq_quantiles(freqsSorted):
+    """
+    Return a dictionary {quantile -> frequency} for a list of
+    frequencies sorted in descending order.
+    """
+    quantiles = {}
+    for q in QUANTILES:
+        qIndex = math.ceil(q * len(freqsSorted))
+        if qIndex >= len(freqsSorted):
+            qIndex = len(freqsSorted) - 1
+        if qIndex >= 0:
+            quantiles[q] = freqsSorted[qIndex]
+        else:
+            quantiles[q] = 0
+    return quantiles
+
+
+def rank_label(freq, rank, quantiles):
+    """
+    Return a string label of the frequency rank (for frequent items)
+    or quantile. This label is showed to the user in word query results.
+    """
+    if freq > 1 and freq >= quantiles[0.5]:
+        if freq > quantiles[0.03]:
+            return '#' + str(rank + 1)
+        else:
+            return '&gt; ' + str(min(math.ceil(q * 100) for q in quantiles
+                                     if freq >= quantiles[q])) + '%'
+    return ''
+
+
+def rank_labels(freqToRank, quantiles):
+    """
+    Return a dictionary {frequency -> rank label} for all frequencies
+    that have a rank. The label depends on the frequency only, so it
+    is calculated once for all items with the same frequency.
+    """
+    return {freq: rank_label(freq, rank, quantiles)
+            for freq, rank in freqToRank.items()}
+
+
+def cumulative_counts(rankCounts):
+    """
+    Turn a list of (rank, number of items) pairs ordered by rank into
+    a dictionary {rank -> total number of items whose rank is less
+    or equal to this rank}.
+    """
+    if len(rankCounts) <= 0:
+        return {}
+    ranks, counts = zip(*rankCounts)
+    if numpy is not None and len(rankCounts) >= NUMPY_THRESHOLD:
+        cumulCounts = numpy.cumsum(numpy.asarray(counts)).tolist()
+    else:
+        cumulCounts = []
+        cumulCount = 0
+        for count in counts:
+            cumulCount += count
+            cumulCounts.append(cumulCount)
+    return dict(zip(ranks, cumulCounts))
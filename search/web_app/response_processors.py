@@ -13,6 +13,10 @@ except ImportError:
     # from outside this package, but we do not need the
     # transliterations in that case
     pass
+try:
+    from .freq_ranks import sorted_freqs, freq_ranks, freq_quantiles, rank_labels, cumulative_counts
+except ImportError:
+    from freq_ranks import sorted_freqs, freq_ranks, freq_quantiles, rank_labels, cumulative_counts
 
 
 class SentenceViewer:
@@ -359,6 +363,19 @@ class SentenceViewer:
                     offEnds[i - indexSubtr] = {'smatch'}
                 indexSubtr += 5
 
+    def prefetch_doc_meta(self, response):
+        """
+        Retrieve the metadata of all documents the sentences of
+        an ES response belong to with one request, so that
+        process_sentence_header() could take it from the cache.
+        """
+        if 'hits' not in response or 'hits' not in response['hits']:
+            return
+        docIDs = [hit['_source']['doc_id'] for hit in response['hits']['hits']
+                  if '_source' in hit and 'doc_id' in hit['_source']]
+        if len(docIDs) > 0:
+            self.sc.get_docs_by_ids(docIDs)
+
     def process_sentence_header(self, sentSource, format='html'):
         """
         Retrieve the metadata of the document the sentence
@@ -369,20 +386,17 @@ class SentenceViewer:
         In the latter case, the first element should contain
         a short description string, including things such as
         authour or title.
+        The metadata is taken from the cache of the search client,
+        see also prefetch_doc_meta().
         """
         docID = sentSource['doc_id']
-        meta = self.sc.get_doc_by_id(docID)
-        if (meta is None
-                or 'hits' not in meta
-                or 'hits' not in meta['hits']
-                or len(meta['hits']['hits']) <= 0
-                or '_source' not in meta['hits']['hits'][0]):
+        meta = self.sc.get_doc_meta(docID)
+        if meta is None:
             if format == 'csv':
                 return ['']
             else:
                 return render_template('search_results/sentence_header.html',
                                        fulltext_view_enabled=False)
-        meta = meta['hits']['hits'][0]['_source']
         for k in meta:
             if type(meta[k]) == list:
                 meta[k] = '; '.join(meta[k])
@@ -1099,6 +1113,40 @@ class SentenceViewer:
             hitsProcessed['n_sentences'] += 1
             hitsProcessed['doc_ids'].add(hit['_source']['doc_id'])
 
+    def add_words_from_ngrams(self, hitsProcessed, response, wordSources, searchType='word'):
+        """
+        Add the words found in the ngrams index to the dictionary
+        hitsProcessed. Its structure is the same as in add_word_from_sentence(),
+        except that the numbers of sentences, documents and forms of each
+        word are stored instead of their sets. They are counted by
+        the ngrams index as distinct sentence and document IDs. wordSources is a dictionary
+        {word or lemma ID -> its source in the words index}.
+        searchType can equal 'word' or 'lemma'.
+        """
+        if 'aggregations' not in response or 'agg_group_by_word' not in response['aggregations']:
+            return
+        aggs = response['aggregations']
+        hitsProcessed['total_freq'] = int(aggs['agg_freq']['value'])
+        hitsProcessed['n_sentences'] = int(aggs['agg_nsents']['value'])
+        hitsProcessed['n_docs'] = int(aggs['agg_ndocs']['value'])
+        for bucket in aggs['agg_group_by_word']['buckets']:
+            wID = bucket['key']
+            wSource = wordSources.get(wID, {})
+            wf = wSource.get('wf', '')
+            if searchType == 'word':
+                wf = wf.lower()
+            hitsProcessed['n_occurrences'] += 1
+            hitsProcessed['word_ids'][wID] = {
+                'n_occurrences': int(bucket['subagg_freq']['value']),
+                'n_sents': int(bucket['subagg_nsents']['value']),
+                'n_docs': int(bucket['subagg_ndocs']['value']),
+                'wf': wf
+            }
+            if searchType == 'lemma':
+                hitsProcessed['word_ids'][wID]['n_forms'] = int(bucket['subagg_nforms']['value'])
+            elif searchType == 'word':
+                hitsProcessed['word_ids'][wID]['lemma'] = self.get_lemma(wSource)
+
     def get_lemma(self, word):
         """
         Join all lemmata in the JSON representation of a word with
@@ -1208,10 +1256,18 @@ class SentenceViewer:
                 word = {'w_id': wID, '_source': {'wf': freqData['wf']}}
                 word['_source']['freq'] = freqData['n_occurrences']
                 word['_source']['rank'] = ''
-                word['_source']['n_sents'] = len(freqData['sents'])
-                word['_source']['n_docs'] = len(freqData['docs'])
+                if 'sents' in freqData:
+                    word['_source']['n_sents'] = len(freqData['sents'])
+                    word['_source']['n_docs'] = len(freqData['docs'])
+                else:
+                    # Words found in the ngrams index only have the numbers
+                    word['_source']['n_sents'] = freqData['n_sents']
+                    word['_source']['n_docs'] = freqData['n_docs']
                 if searchType == 'lemma':
-                    word['_source']['n_forms'] = len(freqData['forms'])
+                    if 'forms' in freqData:
+                        word['_source']['n_forms'] = len(freqData['forms'])
+                    else:
+                        word['_source']['n_forms'] = freqData['n_forms']
                 elif searchType == 'word':
                     word['_source']['lemma'] = freqData['lemma']
                 hitsProcessedAll['words'].append(word)
@@ -1241,21 +1297,12 @@ class SentenceViewer:
         on their frequency in the hitsProcessed list.
         For each word, store results in word['_source']['rank']. Return nothing.
         """
-        freqsSorted = [w['_source']['freq'] for w in hitsProcessed['words']]
-        freqsSorted.sort(reverse=True)
-        quantiles = {}
-        for q in [0.03, 0.04, 0.05, 0.1, 0.15, 0.2, 0.25, 0.5]:
-            qIndex = math.ceil(q * len(freqsSorted))
-            if qIndex >= len(freqsSorted):
-                qIndex = len(freqsSorted) - 1
-            quantiles[q] = freqsSorted[qIndex]
+        freqsSorted = sorted_freqs([w['_source']['freq'] for w in hitsProcessed['words']])
+        # The rank of a word is the position of the first word with the same frequency
+        freqToRank = freq_ranks(freqsSorted, tieRank='first')
+        labels = rank_labels(freqToRank, freq_quantiles(freqsSorted))
         for w in hitsProcessed['words']:
-            if w['_source']['freq'] > 1:
-                if w['_source']['freq'] > quantiles[0.03]:
-                    w['_source']['rank'] = '#' + str(freqsSorted.index(w['_source']['freq']) + 1)
-                elif w['_source']['freq'] >= quantiles[0.5]:
-                    w['_source']['rank'] = '&gt; ' + str(min(math.ceil(q * 100) for q in quantiles
-                                                             if w['_source']['freq'] >= quantiles[q])) + '%'
+            w['_source']['rank'] = labels.get(w['_source']['freq'], '')
 
     def process_doc(self, d, exclude=None):
         """
@@ -1374,6 +1421,7 @@ class SentenceViewer:
         # response['hits']['total']['value'] is limited by 10,000 now, so we'll try to take this value from elsewhere
         resultLanguages = set()
         srcAlignmentInfo = {}
+        self.prefetch_doc_meta(response)
         if 'aggregations' in response:
             if 'agg_ndocs' in response['aggregations']:
                 result['n_docs'] = int(response['aggregations']['agg_ndocs']['value'])
@@ -1458,6 +1506,9 @@ class SentenceViewer:
                 wordID = response['aggregations']['agg_group_by_word']['buckets'][iHit]['key']
                 nForms = response['aggregations']['agg_group_by_word']['buckets'][iHit]['subagg_nforms']['value']
                 docCount = response['aggregations']['agg_group_by_word']['buckets'][iHit]['doc_count']
+                if 'subagg_ndocs' in response['aggregations']['agg_group_by_word']['buckets'][iHit]:
+                    # Packed word frequencies: buckets contain words, not word_freq objects
+                    docCount = int(response['aggregations']['agg_group_by_word']['buckets'][iHit]['subagg_ndocs']['value'])
             else:
                 wordID = response['aggregations']['agg_group_by_word']['buckets'][iHit]['key']['l_id']
                 nForms = response['aggregations']['agg_group_by_word']['buckets'][iHit]['doc_count']
@@ -1516,13 +1567,11 @@ class SentenceViewer:
                 or 'agg_rank' not in hits['aggregations']
                 or 'buckets' not in hits['aggregations']['agg_rank']):
             return {}
-        cumulFreq = 0
-        freqByRank = {}
+        rankCounts = []
         for bucket in hits['aggregations']['agg_rank']['buckets']:
             if 'subagg_nlemmata' in bucket:
                 # Subaggregation for word-based lemma frequency search
-                cumulFreq += bucket['subagg_nlemmata']['value']
+                rankCounts.append((bucket['key'], bucket['subagg_nlemmata']['value']))
             else:
-                cumulFreq += bucket['doc_count']
-            freqByRank[bucket['key']] = cumulFreq
-        return freqByRank
+                rankCounts.append((bucket['key'], bucket['doc_count']))
+        return cumulative_counts(rankCounts)
@@ -103,6 +103,7 @@ class SearchContext:
             return
         curSentIDs = []
         self.last_sent_num = len(hits['hits']['hits'])
+        sentView.prefetch_doc_meta(hits)
         for sent in hits['hits']['hits']:
             curSentID = {}
             self.add_sent_data_for_session(sent, curSentID)
@@ -345,6 +345,73 @@ def get_buckets_for_sent_metafield(fieldName, langID=-1, docIDs=None, maxBuckets
     return buckets
 
 
+def word_meta_item_ids(htmlQuery, nWords):
+    """
+    For each of the first nWords query words, find the only word
+    or lemma that fits it. Return the list of their IDs, or None if any
+    of the query words can fit several words.
+    """
+    itemIDs = []
+    for iWord in range(1, nWords + 1):
+        if ('negq' + str(iWord) in htmlQuery
+                or len(htmlQuery.get('sentence_index' + str(iWord), '')) > 0):
+            return None
+        itemID = sc.qp.word_meta_item_id(htmlQuery, iWord)
+        if itemID is None:
+            esQuery = sc.qp.word_ids_query(htmlQuery, iWord)
+            if esQuery is None:
+                return None
+            esQuery['size'] = 2
+            hits = sc.get_words(esQuery)
+            if len(hits['hits']['hits']) != 1:
+                return None
+            itemID = hits['hits']['hits'][0]['_id']
+        itemIDs.append(itemID)
+    return itemIDs
+
+
+def get_word_buckets_from_tables(buckets, metaField, nWords, htmlQuery):
+    """
+    Fill in the frequencies of each query word in the buckets of
+    a document-level metafield, taking them from the word_meta index,
+    where they were precomputed for each word and lemma. This only works
+    if each query word fits exactly one word or lemma. Return None
+    if it does not, so that the buckets have to be searched one by one.
+    """
+    itemIDs = word_meta_item_ids(htmlQuery, nWords)
+    if itemIDs is None:
+        return None
+    bucketNames = [bucket['name'] for bucket in buckets if bucket['name'] != '>>']
+    tables = {}     # (item ID, metafield value) -> (frequency, number of documents)
+    if len(bucketNames) > 0:
+        hits = sc.get_word_meta(sc.qp.word_meta_query(itemIDs, metaField, bucketNames))
+        if 'hits' not in hits or 'hits' not in hits['hits']:
+            return None
+        for hit in hits['hits']['hits']:
+            tables[(hit['_source']['item_id'], hit['_source']['value'])] = (hit['_source']['freq'],
+                                                                             hit['_source']['n_docs'])
+    results = []
+    for itemID in itemIDs:
+        curWordBuckets = []
+        for bucket in buckets:
+            if bucket['name'] == '>>':
+                continue
+            newBucket = copy.deepcopy(bucket)
+            if newBucket['n_words'] > 0:
+                freq, nDocs = tables.get((itemID, str(bucket['name'])), (0, 0))
+                successRate = freq / newBucket['n_words']
+                newBucket['n_words_conf_int'] = wilson_confidence_interval(successRate,
+                                                                           newBucket['n_words'],
+                                                                           1000000)
+                newBucket['n_words'] = successRate * 1000000
+                newBucket['n_sents'] = nDocs / newBucket['n_docs'] * 100
+            else:
+                newBucket['n_words_conf_int'] = [0.0, 0.0]
+            curWordBuckets.append(newBucket)
+        results.append(curWordBuckets)
+    return results
+
+
 def get_word_buckets(searchType, metaField, nWords, htmlQuery,
                      queryWordConstraints, langID, searchIndex):
     """
@@ -365,6 +432,13 @@ def get_word_buckets(searchType, metaField, nWords, htmlQuery,
         buckets = get_buckets_for_sent_metafield(metaField, langID=langID, docIDs=docIDs)
     else:
         buckets = get_buckets_for_doc_metafield(metaField, langID=langID, docIDs=docIDs)
+    if (settings.word_meta_tables and searchType == 'compare' and searchIndex == 'words'
+            and not bSentenceLevel and docIDs is None):
+        # Frequencies of single words in the whole corpus can be taken
+        # from the precomputed tables instead of one search per bucket
+        results = get_word_buckets_from_tables(buckets, metaField, nWords, htmlQuery)
+        if results is not None:
+            return results
     results = []
     if searchType == 'context':
         nWordsProcess = 1
@@ -508,6 +582,85 @@ def count_occurrences(query, distances=None):
     return 0
 
 
+def search_ngrams(query, adjacentWords, groupBy=None):
+    """
+    Look for the adjacent words of a two-word query in the ngrams index.
+    adjacentWords is a tuple with the numbers of the left and the right
+    query word. If groupBy is 'word' or 'lemma', group the results by the
+    words or lemmata that fit the first query word.
+    Return the response, or None if a query word fits too many words,
+    so that the sentences index has to be searched instead.
+    """
+    wordIDs = []
+    for nWord in adjacentWords:
+        esQuery = sc.qp.word_ids_query(query, nWord)
+        if esQuery is None:
+            wordIDs.append(None)
+            continue
+        hits = sc.get_words(esQuery)
+        if len(hits['hits']['hits']) > sc.qp.maxNgramItems:
+            return None
+        wordIDs.append([hit['_id'] for hit in hits['hits']['hits']])
+    langID = -1
+    if 'lang1' in query and query['lang1'] in settings.languages:
+        langID = settings.languages.index(query['lang1'])
+    docIDs = None
+    if 'doc_ids' in query:
+        docIDs = [int(docID) for docID in query['doc_ids']]
+    esQuery = sc.qp.ngram_query(wordIDs, nGroup=adjacentWords.index(1) + 1,
+                                lang=langID, docIDs=docIDs, groupBy=groupBy)
+    hits = sc.get_ngrams(esQuery)
+    if 'aggregations' not in hits:
+        return None
+    if ('agg_group_by_word' in hits['aggregations']
+            and hits['aggregations']['agg_group_by_word']['sum_other_doc_count'] > 0):
+        # Too many different words fit the first query word
+        return None
+    return hits
+
+
+def count_ngram_occurrences(query, adjacentWords):
+    """
+    Return the number of occurrences of two adjacent query words
+    taken from the ngrams index, or None if it cannot be used.
+    """
+    hits = search_ngrams(query, adjacentWords)
+    if hits is None:
+        return None
+    return int(hits['aggregations']['agg_freq']['value'])
+
+
+def find_words_in_ngrams(query, adjacentWords, searchType='word'):
+    """
+    Find the words or lemmata that fit the first word of a two-word query
+    whose words are adjacent, using the ngrams index. Return a dictionary
+    with the same structure as when they are collected from sentences,
+    or None if the ngrams index cannot be used.
+    """
+    hits = search_ngrams(query, adjacentWords, groupBy=searchType)
+    if hits is None:
+        return None
+    wordIDs = [bucket['key'] for bucket in hits['aggregations']['agg_group_by_word']['buckets']]
+    wordSources = {}
+    if len(wordIDs) > 0:
+        # Word forms and lemmata are needed for sorting
+        esQuery = {'query': {'ids': {'values': wordIDs}},
+                   'size': len(wordIDs),
+                   '_source': ['wf', 'ana.lex']}
+        for hit in sc.get_words(esQuery)['hits']['hits']:
+            wordSources[hit['_id']] = hit['_source']
+    hitsProcessedAll = {
+        'n_occurrences': 0,
+        'n_sentences': 0,
+        'n_docs': 0,
+        'total_freq': 0,
+        'words': [],
+        'word_ids': {}
+    }
+    sentView.add_words_from_ngrams(hitsProcessedAll, hits, wordSources, searchType=searchType)
+    return hitsProcessedAll
+
+
 def find_sentences_json(page=0):
     """
     Find sentences and change current options using the query in request.args.
@@ -593,7 +746,12 @@ def find_sentences_json(page=0):
             and (nWords == 1
                  or len(wordConstraints) <= 0
                  or not distance_constraints_too_complex(wordConstraints))):
-        nOccurrences = count_occurrences(query, distances=queryWordConstraints)
+        nOccurrences = None
+        adjacentWords = sc.qp.adjacent_query_words(query, queryWordConstraints)
+        if adjacentWords is not None:
+            nOccurrences = count_ngram_occurrences(query, adjacentWords)
+        if nOccurrences is None:
+            nOccurrences = count_occurrences(query, distances=queryWordConstraints)
 
     esQuery = sc.qp.html2es(query,
                             searchOutput='sentences',
@@ -686,6 +844,14 @@ def find_words_json(searchType='word', page=0):
         searchIndex = 'sentences'
         sortOrder = 'random'
 
+    ngramWords = None   # words found in the ngrams index
+    if nWords > 1 and len(cur_search_context().processed_words) <= 0:
+        # Adjacent words can be found in the ngrams index without
+        # looking through all sentences where they occur
+        adjacentWords = sc.qp.adjacent_query_words(query, queryWordConstraints)
+        if adjacentWords is not None:
+            ngramWords = find_words_in_ngrams(query, adjacentWords, searchType=searchType)
+
     querySize = get_session_data('page_size')
     if subcorpus and page >= 2:
         querySize = get_session_data('page_size') * page
@@ -724,7 +890,9 @@ def find_words_json(searchType='word', page=0):
         # Multi-word search (complicated)
         query['size'] = 0
         query['from'] = 0
-        if len(cur_search_context().processed_words) <= 0:
+        if ngramWords is not None:
+            hitsProcessedAll = ngramWords
+        elif len(cur_search_context().processed_words) <= 0:
             # cur_search_context().processed_words contains processed hits
             # if the same query has already been run
 
@@ -564,6 +564,26 @@ function gramm_gloss_selector_loaded(result) {
 function assign_dictionary_events(){
 	$(".dictionary_lemma").unbind("click");
 	$(".dictionary_lemma").click(input_lemma);
+	$(".dictionary_letter_link").unbind("click");
+	$(".dictionary_letter_link").click(show_dictionary_letter);
+}
+
+function show_dictionary_letter(e) {
+	// Load the table of one letter of a dictionary split by letter
+	var lang = $(e.target).attr('data-lang');
+	var letter = $(e.target).attr('data-letter');
+	$.ajax({
+			url: "dictionary/" + lang + "/" + letter,
+			type: "GET",
+			success: function(result) {
+				$('#dictionary_letter_body').html(result);
+				$('.dictionary_letter_link').removeClass('dictionary_letter_selected');
+				$(e.target).addClass('dictionary_letter_selected');
+				assign_dictionary_events();
+			},
+			error: function(errorThrown) {
+			}
+		});
 }
 
 function input_lemma(e) {
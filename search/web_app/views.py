@@ -728,6 +728,22 @@ def get_dictionary(lang):
         return ''
 
 
+@app.route('/docs/dictionary/<lang>/<int:letter>')
+@app.route('/dictionary/<lang>/<int:letter>')
+@gzipped
+def get_dictionary_letter(lang, letter):
+    """
+    Return the table of one letter of a dictionary split by letter.
+    """
+    if not settings.generate_dictionary:
+        return ''
+    dictFilename = 'dictionaries/dictionary_' + settings.corpus_name + '_' + lang + '_' + str(letter) + '.html'
+    try:
+        return render_template(dictFilename)
+    except:
+        return ''
+
+
 @app.route('/config')
 def setup_corpus():
     if not request.host.strip('/').endswith(('0.0.0.0:7342', '127.0.0.1:7342')):